@@ -0,0 +1,212 @@
+import os
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from indicator_engine import align_tail_matrix, compute_indicator_matrices, MIN_ROWS
+from signal_rules import SignalRules, TREND_NEUTRAL
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = os.path.join('index_data', '000300.csv')
+RESULTS_FILE = 'backtest_results.csv'
+REPORT_FILE = 'backtest_report.md'
+# 单笔交易亏损超过该比例时止损卖出，None 表示不止损
+STOP_LOSS = 0.10
+RESULT_COLUMNS = ['cum_return', 'max_drawdown', 'sharpe_ratio', 'win_rate', 'cagr', 'total_trades']
+
+def market_trend_array(ind, rules=None):
+    """按大盘趋势规则，对大盘指标的每一行给出趋势"""
+    return (rules or SignalRules()).market_trend(ind)
+
+
+def trade_masks(ind, params=None, signal='action_signal', rules=None):
+    """直接得到买入 / 卖出条件矩阵，不生成字符串信号"""
+    return (rules or SignalRules()).sides(signal, ind, params)
+
+
+def load_index_trend(index_file=INDEX_FILE, rules=None):
+    """读取沪深300数据并计算每个交易日的大盘趋势，返回 (日期数组, 趋势数组)；文件不存在时返回 None"""
+    if not os.path.exists(index_file):
+        logger.warning("大盘数据文件不存在: %s，回测中大盘趋势按中性处理", index_file)
+        return None
+    index_df = pd.read_csv(index_file, parse_dates=['date']).sort_values(by='date')
+    values = index_df['net_value'].to_numpy(dtype=np.float64)[:, None]
+    trend = market_trend_array(compute_indicator_matrices(values), rules)[:, 0]
+    return index_df['date'].values.astype('datetime64[D]'), trend
+
+
+def _trend_matrix(dates, index_trend):
+    """把每只基金每个日期对应到当日（或之前最近一个交易日）的大盘趋势"""
+    trend = np.full(dates.shape, TREND_NEUTRAL)
+    if index_trend is None:
+        return trend
+    index_dates, index_values = index_trend
+    pos = np.searchsorted(index_dates, dates, side='right') - 1
+    known = (pos >= 0) & ~np.isnat(dates)
+    trend[known] = index_values[pos[known]]
+    return trend
+
+
+def _simulate(values, buy, sell, stop_loss):
+    """
+    逐个观测日推进所有基金的持仓状态（每一步都是对全部基金的数组运算）。
+    规则与原回测一致：空仓时出现买入信号以当日净值买入，持仓时出现卖出信号以当日净值卖出，
+    持仓亏损超过 stop_loss 时当日止损且不再处理当日信号，期末仍持仓的按最后净值平仓。
+    返回 (策略日收益矩阵, 交易次数, 盈利交易数, 已平仓交易数)。
+    """
+    rows, cols = values.shape
+    returns = np.zeros((rows, cols))
+    holding = np.zeros(cols, dtype=bool)
+    buy_price = np.full(cols, np.nan)
+    trades = np.zeros(cols, dtype=int)
+    wins = np.zeros(cols, dtype=int)
+    closed = np.zeros(cols, dtype=int)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(1, rows):
+            nav = values[i]
+            daily = nav / values[i - 1] - 1
+            returns[i] = np.where(holding & ~np.isnan(daily), daily, 0.0)
+            trade_return = nav / buy_price - 1
+            stopped = holding & (trade_return < -stop_loss) if stop_loss is not None else np.zeros(cols, dtype=bool)
+            exited = holding & ~stopped & sell[i]
+            entered = ~holding & buy[i]
+            close = stopped | exited
+            closed += close
+            wins += close & (trade_return > 0)
+            trades += entered
+            holding = (holding & ~close) | entered
+            buy_price = np.where(entered, nav, buy_price)
+        # 期末平仓
+        last = values[-1] if rows else np.full(cols, np.nan)
+        final_return = last / buy_price - 1
+    closed += holding
+    wins += holding & (final_return > 0)
+    return returns, trades, wins, closed
+
+
+def active_mask(values):
+    """每只基金前 MIN_ROWS 个观测只用于预热指标，不产生交易"""
+    observed = np.cumsum(~np.isnan(values), axis=0)
+    return (observed >= MIN_ROWS) & ~np.isnan(values)
+
+
+def evaluate_positions(values, dates, active, buy, sell, stop_loss=STOP_LOSS):
+    """
+    根据买卖条件矩阵模拟交易并计算每只基金的回测指标。
+    返回 {指标名: 每只基金一个值的数组}，键为 RESULT_COLUMNS，另含 'valid' 表示数据是否足够。
+    """
+    returns, trades, wins, closed = _simulate(values, buy & active, sell & active, stop_loss)
+    returns = np.where(active, returns, np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        equity = np.cumprod(np.where(np.isnan(returns), 0.0, returns) + 1, axis=0)
+        cum_return = equity[-1] - 1
+        drawdown = np.where(active, equity / np.maximum.accumulate(equity, axis=0) - 1, np.nan)
+        max_drawdown = np.nanmin(np.where(active, drawdown, 0.0), axis=0)
+        count = active.sum(axis=0)
+        mean = np.nansum(returns, axis=0) / count
+        std = np.sqrt(np.nansum((returns - mean) ** 2, axis=0) / count)
+        sharpe_ratio = np.where(std > 0, mean / std * np.sqrt(252), np.nan)
+        win_rate = np.where(closed > 0, wins / np.maximum(closed, 1), 0.0)
+        first = np.where(active.any(axis=0), active.argmax(axis=0), 0)
+        start = dates[first, np.arange(values.shape[1])]
+        years = (dates[-1] - start).astype('timedelta64[D]').astype(float) / 365.25
+        cagr = np.where(years > 0, (1 + cum_return) ** (1 / years) - 1, 0.0)
+
+    valid = count >= 2
+    return {
+        'cum_return': np.where(valid, cum_return, np.nan),
+        'max_drawdown': np.where(valid, max_drawdown, np.nan),
+        'sharpe_ratio': np.where(valid, sharpe_ratio, np.nan),
+        'win_rate': np.where(valid, win_rate, np.nan),
+        'cagr': np.where(valid, cagr, np.nan),
+        'total_trades': trades,
+        'valid': valid,
+    }
+
+
+def run_backtest(frames, index_trend=None, stop_loss=STOP_LOSS, signal='action_signal', params=None, rules=None):
+    """
+    对多只基金的完整历史一次性回测。
+    frames 为 {基金代码: 含 date/net_value 的 DataFrame}，signal 选择用 'action_signal' 还是 'advice' 驱动交易，
+    params 可覆盖规则中的阈值，rules 为 SignalRules（默认内置规则）。
+    返回以基金代码为索引、列为 RESULT_COLUMNS 的 DataFrame，历史不足的基金各项为 NaN、交易次数为 0。
+    """
+    fund_codes, values, dates = align_tail_matrix(frames)
+    result = pd.DataFrame(np.nan, index=fund_codes, columns=RESULT_COLUMNS)
+    result['total_trades'] = 0
+    if values.size == 0:
+        return result
+
+    rules = rules or SignalRules()
+    ind = compute_indicator_matrices(values)
+    labels = rules.evaluate(signal, ind, _trend_matrix(dates, index_trend), params)
+    metrics = evaluate_positions(values, dates, active_mask(values),
+                                 np.isin(labels, rules.labels(signal, 'buy')),
+                                 np.isin(labels, rules.labels(signal, 'sell')), stop_loss)
+    for column in RESULT_COLUMNS:
+        result[column] = metrics[column]
+    skipped = int((~metrics['valid']).sum())
+    if skipped:
+        logger.warning("%d 只基金数据不足，无法回测", skipped)
+    return result
+
+
+def write_backtest_report(results, output_file=REPORT_FILE, stop_loss=STOP_LOSS, signal='action_signal'):
+    """将回测结果输出为 Markdown 报告"""
+    logger.info("正在生成回测报告...")
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write("# 历史回测报告\n\n")
+        f.write(f"生成日期: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        if results.empty:
+            f.write("---\n\n❌ 没有可用于回测的基金数据。\n")
+            logger.warning("回测结果为空")
+            return
+
+        report_df = results.rename(columns={
+            "cum_return": "累计回报",
+            "max_drawdown": "最大回撤",
+            "sharpe_ratio": "夏普比率",
+            "win_rate": "胜率",
+            "cagr": "年化收益率",
+            "total_trades": "总交易次数"
+        }).sort_values(by="累计回报", ascending=False)
+        for col in ["累计回报", "最大回撤", "年化收益率", "胜率"]:
+            report_df[col] = report_df[col].apply(lambda x: f"{x:.2%}" if not pd.isna(x) else "N/A")
+        report_df['夏普比率'] = report_df['夏普比率'].apply(lambda x: f"{x:.2f}" if not pd.isna(x) else "N/A")
+        report_df['总交易次数'] = report_df['总交易次数'].astype(int)
+
+        valid = results.dropna(subset=['cum_return'])
+        rule_name = "行动信号" if signal == 'action_signal' else "投资建议"
+        f.write(f"此报告展示了将市场监控的{rule_name}规则（结合每日大盘趋势）应用于全部历史数据的表现。\n\n")
+        if stop_loss is not None:
+            f.write(f"注意：此回测加入了**{stop_loss:.0%}止损**逻辑，以控制单笔交易亏损。\n\n")
+        f.write(f"回测基金数: {len(valid)}，平均累计回报: {valid['cum_return'].mean():.2%}，"
+                f"平均胜率: {valid['win_rate'].mean():.2%}\n\n")
+        f.write("此表格已按**累计回报**从高到低排序。\n\n")
+        f.write(report_df.to_markdown())
+        f.write("\n")
+    logger.info("回测报告生成完成: %s", output_file)
+
+
+def backtest_store(nav_store=None, fund_codes=None, index_file=INDEX_FILE, stop_loss=STOP_LOSS, signal='action_signal',
+                   results_file=RESULTS_FILE, report_file=REPORT_FILE, rules=None):
+    """回测净值存储中的全部（或指定）基金，保存 backtest_results.csv 和 backtest_report.md"""
+    if nav_store is None:
+        from nav_store import get_nav_store
+        nav_store = get_nav_store(data_dir='fund_data')
+    fund_codes = nav_store.codes() if fund_codes is None else fund_codes
+    frames = {code: nav_store.read(code) for code in fund_codes}
+    logger.info("开始回测 %d 只基金", len(frames))
+    rules = rules or SignalRules.load()
+    results = run_backtest(frames, load_index_trend(index_file, rules), stop_loss=stop_loss, signal=signal, rules=rules)
+    results.to_csv(results_file, encoding='utf-8')
+    logger.info("回测结果已保存到 %s", results_file)
+    write_backtest_report(results, report_file, stop_loss, signal)
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    backtest_store()
@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import types
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 合成基金的代码从这里开始编号，不与真实基金重复
+FUND_CODE_BASE = 900000
+INDEX_CODE = '000300'
+# 可运行的场景，默认全部运行
+SCENARIOS = ('monitor', 'monitor_fresh', 'analyzer', 'indicators', 'index')
+DEFAULT_FUNDS = 200
+DEFAULT_DAYS = 750
+DEFAULT_REPEAT = 3
+# 本地数据比替身服务器落后的交易日数（monitor / analyzer 场景需要补齐的尾部）
+STALE_DAYS = 3
+# 中位耗时比基线慢超过该比例视为性能退化
+DEFAULT_TOLERANCE = 0.2
+BENCHMARK_FILE = 'benchmark_results.json'
+# 场景子进程中的客户端限速远高于生产默认值，测量的是代码本身而不是限速等待；
+# 关闭 HTTP 缓存，使重复运行每次都真正访问替身服务器
+CLIENT_ENV = {'FETCH_RATE': '1000', 'FETCH_CONCURRENCY': '16', 'AKSHARE_RATE': '1000', 'HTTP_CACHE_MODE': 'off'}
+# 与基线比较前需要一致的运行参数
+COMPARABLE_PARAMS = ('funds', 'days', 'seed', 'latency', 'error_rate', 'rate_limit')
+
+
+def synthetic_universe(n_funds, n_days, seed=0, end=None):
+    """
+    生成 n_funds 只基金 × n_days 个交易日的合成净值（对数正态随机游走，各基金漂移和波动率不同）。
+    约十分之一的基金成立较晚，但仍保留至少 300 个交易日的历史。
+    返回 {基金代码: DataFrame[date, net_value]}，最后一个交易日不晚于 end（默认今天）。
+    """
+    end = pd.Timestamp(end or datetime.now().date())
+    dates = pd.bdate_range(end=end, periods=n_days)
+    rng = np.random.default_rng(seed)
+    drift = rng.normal(0.0003, 0.0003, n_funds)
+    volatility = rng.uniform(0.005, 0.02, n_funds)
+    returns = rng.standard_normal((n_days, n_funds)) * volatility + drift
+    nav = np.round(np.exp(np.cumsum(returns, axis=0)) * rng.uniform(0.8, 3.0, n_funds), 4)
+    late = rng.random(n_funds) < 0.1
+    start = np.where(late, rng.integers(0, max(1, n_days - 300), n_funds), 0)
+    return {
+        f"{FUND_CODE_BASE + i:06d}": pd.DataFrame({'date': dates[start[i]:], 'net_value': nav[start[i]:, i]})
+        for i in range(n_funds)
+    }
+
+
+def synthetic_index(n_days, seed=0, end=None):
+    """合成的沪深300指数点位"""
+    df = synthetic_universe(1, n_days, seed + 1, end)[f"{FUND_CODE_BASE:06d}"]
+    df['net_value'] = np.round(df['net_value'] / df['net_value'].iloc[0] * 3500, 2)
+    return df
+
+
+def _offline_akshare():
+    """
+    替身服务器不提供 akshare 使用的接口：以一个所有调用都立即失败的模块代替 akshare，
+    使 FundAnalyzer 走本地净值和 fundf10 网页抓取的路径，基准测试中不会访问真实网络。
+    """
+    module = types.ModuleType('akshare')
+
+    def __getattr__(name):
+        def unavailable(*args, **kwargs):
+            raise ConnectionError(f"基准测试中不访问 akshare.{name}")
+        return unavailable
+
+    module.__getattr__ = __getattr__
+    return module
+
+
+def _prepare(frames, index_df, stale_days=STALE_DAYS, local=True, report=True):
+    """在当前目录准备本地数据：落后 stale_days 个交易日的净值、沪深300指数和 analysis_report.md"""
+    from nav_store import get_nav_store
+    if local:
+        store = get_nav_store(data_dir='fund_data')
+        for fund_code, df in frames.items():
+            store.write(fund_code, df.iloc[:len(df) - stale_days] if stale_days else df)
+    if index_df is not None:
+        os.makedirs('index_data', exist_ok=True)
+        index_df.to_csv(os.path.join('index_data', f'{INDEX_CODE}.csv'), index=False, encoding='utf-8')
+    if report:
+        with open('analysis_report.md', 'w', encoding='utf-8') as f:
+            f.write("### 推荐基金\n\n| fund_code | fund_name | score |\n|:--|:--|--:|\n")
+            for fund_code in frames:
+                f.write(f"| {fund_code} | 合成基金{fund_code} | 40 |\n")
+
+
+def _scenario_monitor(frames, index_df):
+    """完整的监控运行：补齐落后的尾部、更新指标并生成报告"""
+    from market_monitor import MarketMonitor
+    _prepare(frames, index_df)
+
+    def run():
+        monitor = MarketMonitor()
+        monitor.get_fund_data()
+        monitor.generate_report()
+    return run
+
+
+def _scenario_monitor_fresh(frames, index_df):
+    """本地数据已是最新、指标状态已建立时的监控运行（不访问网络）"""
+    from market_monitor import MarketMonitor
+    _prepare(frames, index_df, stale_days=0)
+    warmup = MarketMonitor()
+    warmup.get_fund_data()
+
+    def run():
+        monitor = MarketMonitor()
+        monitor.get_fund_data()
+        monitor.generate_report()
+    return run
+
+
+def _scenario_analyzer(frames, index_df):
+    """批量评分：同步净值尾部、批量计算净值指标、抓取基金经理和持仓页面（缓存为空）"""
+    sys.modules['akshare'] = _offline_akshare()
+    from fund_analyzer import FundAnalyzer
+    _prepare(frames, index_df, report=False)
+    fund_info = {fund_code: f"合成基金{fund_code}" for fund_code in frames}
+
+    def run():
+        analyzer = FundAnalyzer(cache_file='fund_cache.db')
+        analyzer.run_analysis(list(frames), fund_info)
+    return run
+
+
+def _scenario_indicators(frames, index_df):
+    """逐只调用 MarketMonitor._calculate_indicators 计算完整历史的技术指标"""
+    from market_monitor import MarketMonitor
+    monitor = MarketMonitor()
+
+    def run():
+        for df in frames.values():
+            monitor._calculate_indicators(df)
+    return run
+
+
+def _scenario_index(frames, index_df):
+    """从空目录完整下载沪深300指数历史"""
+    from download_index_data import fetch_and_save_index_data
+    return fetch_and_save_index_data
+
+
+SCENARIO_SETUP = {
+    'monitor': _scenario_monitor,
+    'monitor_fresh': _scenario_monitor_fresh,
+    'analyzer': _scenario_analyzer,
+    'indicators': _scenario_indicators,
+    'index': _scenario_index,
+}
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows 没有 resource 模块
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(name, funds=DEFAULT_FUNDS, days=DEFAULT_DAYS, seed=0, end=None, repeat=DEFAULT_REPEAT):
+    """
+    在当前进程中运行一个场景 repeat 次，每次都在当前目录下新建子目录并重新准备数据，只计时场景本身。
+    由 run_benchmarks 在独立子进程中调用，使各场景的模块状态、限速桶和内存峰值互不影响。
+    """
+    frames = synthetic_universe(funds, days, seed, end)
+    index_df = synthetic_index(days, seed, end)
+    root = os.getcwd()
+    runs = []
+    for i in range(repeat):
+        workdir = os.path.join(root, f'run{i}')
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        try:
+            run = SCENARIO_SETUP[name](frames, index_df)
+            start = time.perf_counter()
+            run()
+            runs.append(time.perf_counter() - start)
+        finally:
+            os.chdir(root)
+    return {'runs': runs, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def run_benchmarks(scenarios=SCENARIOS, funds=DEFAULT_FUNDS, days=DEFAULT_DAYS, repeat=DEFAULT_REPEAT, seed=0,
+                   latency=0.0, error_rate=0.0, rate_limit=None):
+    """
+    启动本地天天基金替身，在独立子进程中逐个运行场景，返回可保存为基线的结果字典：
+    {'meta': 运行参数和环境, 'scenarios': {场景: {'median', 'min', 'runs', 'peak_rss_mb', 'server'}}}。
+    server 为该场景全部 repeat 次运行对替身服务器的请求统计。
+    """
+    from fake_eastmoney import FakeEastMoney
+
+    end = datetime.now().strftime('%Y-%m-%d')
+    frames = synthetic_universe(funds, days, seed, end)
+    frames[INDEX_CODE] = synthetic_index(days, seed, end)
+    results = {
+        'meta': {
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'funds': funds, 'days': days, 'seed': seed, 'repeat': repeat,
+            'latency': latency, 'error_rate': error_rate, 'rate_limit': rate_limit,
+        },
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='fund-benchmark-') as root, \
+            FakeEastMoney(frames, latency=latency, error_rate=error_rate, rate_limit=rate_limit, seed=seed) as server:
+        env = dict(os.environ, EASTMONEY_F10_URL=server.base_url, **CLIENT_ENV)
+        for name in scenarios:
+            server.reset_stats()
+            workdir = os.path.join(root, name)
+            os.makedirs(workdir)
+            command = [sys.executable, os.path.abspath(__file__), '--child', name, '--funds', str(funds),
+                       '--days', str(days), '--seed', str(seed), '--end', end, '--repeat', str(repeat)]
+            logger.info("运行场景 %s ...", name)
+            proc = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                logger.error("场景 %s 运行失败:\n%s", name, proc.stderr[-2000:])
+                results['scenarios'][name] = {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'}
+                continue
+            data = json.loads(proc.stdout.strip().splitlines()[-1])
+            runs = data['runs']
+            results['scenarios'][name] = {
+                'median': float(np.median(runs)),
+                'min': float(min(runs)),
+                'runs': runs,
+                'peak_rss_mb': data['peak_rss_mb'],
+                'server': dict(server.stats),
+            }
+            logger.info("场景 %s: 中位 %.3f 秒，最快 %.3f 秒，内存峰值 %.0f MB，请求 %d 次",
+                        name, results['scenarios'][name]['median'], min(runs), data['peak_rss_mb'] or 0,
+                        server.stats['requests'])
+    return results
+
+
+def save_results(results, path=BENCHMARK_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    logger.info("基准测试结果已保存到 %s", path)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    按中位耗时与基线比较，返回 (对比表 DataFrame, 是否有场景退化)。
+    比基线慢超过 tolerance 为“退化”，快超过同样比例为“提升”。
+    """
+    mismatched = [key for key in COMPARABLE_PARAMS if results['meta'].get(key) != baseline.get('meta', {}).get(key)]
+    if mismatched:
+        logger.warning("运行参数与基线不同 (%s)，对比结果仅供参考", ", ".join(mismatched))
+    rows = []
+    regressed = False
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name, {})
+        if 'median' not in current or 'median' not in base:
+            status = '运行失败' if 'median' not in current else '无基线'
+            rows.append({'scenario': name, 'baseline': base.get('median'), 'current': current.get('median'),
+                         'ratio': np.nan, 'status': status})
+            continue
+        ratio = current['median'] / base['median'] if base['median'] else np.inf
+        if ratio > 1 + tolerance:
+            status = '退化'
+            regressed = True
+        elif ratio < 1 / (1 + tolerance):
+            status = '提升'
+        else:
+            status = '持平'
+        rows.append({'scenario': name, 'baseline': base['median'], 'current': current['median'],
+                     'ratio': ratio, 'status': status})
+    return pd.DataFrame(rows), regressed
+
+
+def main(args):
+    """运行基准测试并保存结果；指定 baseline 时与基线比较，有场景退化时返回 1"""
+    scenarios = [name.strip() for name in args.scenarios.split(',')] if args.scenarios else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"未知的场景: {', '.join(sorted(unknown))}，可选: {', '.join(SCENARIOS)}")
+    results = run_benchmarks(scenarios, funds=args.funds, days=args.days, repeat=args.repeat, seed=args.seed,
+                             latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit)
+    save_results(results, args.output)
+    failed = any('median' not in result for result in results['scenarios'].values())
+    if args.baseline:
+        table, regressed = compare(results, load_results(args.baseline), args.tolerance)
+        print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        return 1 if regressed or failed else 0
+    for name, result in results['scenarios'].items():
+        print(f"{name:<14} {result['median']:8.3f} s" if 'median' in result else f"{name:<14} 失败: {result['error']}")
+    return 1 if failed else 0
+
+
+def add_arguments(parser):
+    parser.add_argument('--scenarios', default=None, help=f"逗号分隔的场景，默认全部: {','.join(SCENARIOS)}")
+    parser.add_argument('--funds', type=int, default=DEFAULT_FUNDS, help="合成基金数")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="每只基金的交易日数")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="每个场景重复运行的次数（取中位数）")
+    parser.add_argument('--seed', type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument('--latency', type=float, default=0.0, help="替身服务器每个请求的延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="替身服务器返回 500 的请求比例")
+    parser.add_argument('--rate-limit', type=int, default=None, help="替身服务器每秒最多处理的请求数，超出返回 429")
+    parser.add_argument('--output', default=BENCHMARK_FILE, help="结果 JSON 文件")
+    parser.add_argument('--baseline', default=None, help="与之比较的基线 JSON 文件（之前某次运行的结果）")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="允许的变慢比例")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="基金监控与分析的性能基准测试（合成数据 + 本地天天基金替身）")
+    add_arguments(parser)
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--end', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        # 场景子进程：日志写入工作目录，标准输出最后一行为 JSON 结果
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                            handlers=[logging.FileHandler('benchmark.log', encoding='utf-8')])
+        print(json.dumps(run_scenario(args.child, args.funds, args.days, args.seed, args.end, args.repeat)))
+        sys.exit(0)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(args))
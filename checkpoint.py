@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from sharding import json_default
+
+logger = logging.getLogger(__name__)
+
+# 检查点目录：每个批量任务（分片运行时每个分片）一个 JSON Lines 文件
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', 'checkpoints')
+# 每只基金的结果写入后立即 flush，至少每隔这么多秒 fsync 一次
+CHECKPOINT_SYNC_INTERVAL = float(os.getenv('CHECKPOINT_SYNC_INTERVAL', 30))
+
+
+def fingerprint(value):
+    """任意可 JSON 序列化的值（基金列表、规则表等）的短指纹，用于判断检查点是否属于同一次运行"""
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=json_default)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def checkpoint_path(job, shard=None, base_dir=CHECKPOINT_DIR):
+    name = job if shard is None else f"{job}.{shard.index}-of-{shard.count}"
+    return os.path.join(base_dir, f"{name}.jsonl")
+
+
+class Checkpoint:
+    """
+    长时间批量运行的检查点（JSON Lines）：首行记录运行窗口（期望的净值日期、大盘趋势、基金列表指纹等），
+    之后每完成一只基金追加一行结果，进程崩溃或超时被终止时已完成的结果都在磁盘上。
+    resume 为 True 且文件中的运行窗口与本次一致时载入已完成的结果，调用方跳过这些基金；
+    窗口不一致（新的交易日、基金列表或规则变化）时从头开始，保证恢复后的报告与不中断运行的一致。
+    """
+
+    def __init__(self, path, window, resume=False, sync_interval=CHECKPOINT_SYNC_INTERVAL):
+        self.path = path
+        self.window = window
+        self.sync_interval = sync_interval
+        self.results = self._load() if resume else {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # 总是重写文件：去掉上次中断时可能写了一半的最后一行
+        self._file = open(path, 'w', encoding='utf-8')
+        self._write({'window': window})
+        for fund_code, result in self.results.items():
+            self._write({'fund_code': fund_code, 'result': result})
+        self._sync()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.info("检查点 %s 不存在，从头开始", self.path)
+            return {}
+        results = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = {}
+            if header.get('window') != self.window:
+                logger.info("检查点 %s 属于另一个运行窗口 %s（本次 %s），从头开始", self.path, header.get('window'), self.window)
+                return {}
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("检查点 %s 中有不完整的记录（上次运行被中断），忽略", self.path)
+                    continue
+                results[record['fund_code']] = record['result']
+        logger.info("从检查点 %s 恢复 %d 只基金的结果", self.path, len(results))
+        return results
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=json_default) + '\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced = time.monotonic()
+
+    def record(self, fund_code, result):
+        """记录一只基金的最终结果；已在检查点中的基金不重复写入"""
+        with self._lock:
+            if self._file is None or fund_code in self.results:
+                return
+            self.results[fund_code] = result
+            self._write({'fund_code': fund_code, 'result': result})
+            self._file.flush()
+            if time.monotonic() - self._synced >= self.sync_interval:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
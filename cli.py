@@ -0,0 +1,399 @@
+"""
+统一命令行入口：
+
+    python cli.py analyze [--limit N] [--workers N]     批量基金评分（fund_analyzer）
+    python cli.py monitor [--filter-mode ...]           更新净值并生成技术指标监控报告（market_monitor）
+    python cli.py download-index                        增量更新沪深300指数数据
+    python cli.py report [--filter-mode ...]            只用本地数据重新生成监控报告，不访问网络
+    python cli.py merge analyze|monitor                 合并 --shard 各分片的结果，生成完整报告
+    python cli.py backtest [--stop-loss 0.1]            用监控信号规则回测本地全部基金的历史
+    python cli.py sweep [--random N] [--grid 文件]      多进程扫描信号阈值和指标窗口，输出参数排名
+    python cli.py bench [--baseline 文件]               用合成数据和本地天天基金替身运行性能基准测试
+    python cli.py check-imports [--budget 秒]           检查导入耗时和延迟导入是否生效
+
+analyze / monitor / download-index 的网页响应保存在 HTTP 磁盘缓存中（见 http_cache.py），
+加 --http-cache replay 可只用缓存离线重跑，不访问网络。
+
+analyze / monitor 加 --shard i/N 时只处理按基金代码哈希分到第 i 个（从 0 开始）分片的基金，
+部分结果写入 shards/<命令>/<i>-of-<N>/，N 个分片可以在多个进程或 CI 任务中并行运行，
+全部完成后用 merge 生成与单进程运行相同的 analysis_report.md / market_monitor_report.md。
+
+analyze / monitor 运行时把每只基金的结果写入 checkpoints/ 下的检查点，被中断或超时后加 --resume 重跑，
+同一运行窗口（同一天 / 同一期望净值日期，基金列表和规则不变）内已完成的基金直接沿用，报告与不中断运行相同。
+
+本模块只依赖标准库，各子命令在执行时才导入对应的模块，
+因此短命令不必为 akshare、selenium、aiohttp 等重型依赖付出启动时间。
+"""
+import os
+import re
+import sys
+import argparse
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# 导入 cli 本身时不应加载的重型依赖
+HEAVY_MODULES = ('pandas', 'numpy', 'akshare', 'selenium', 'bs4', 'aiohttp', 'requests')
+# 各入口模块在导入时不应加载的依赖（只在真正用到时才导入）
+DEFERRED_IMPORTS = {
+    'cli': HEAVY_MODULES,
+    'market_monitor': ('akshare', 'selenium', 'bs4', 'aiohttp'),
+    'download_index_data': ('akshare', 'selenium', 'bs4', 'aiohttp'),
+    'fund_analyzer': ('akshare', 'selenium', 'bs4', 'aiohttp', 'requests'),
+    'backtest': ('akshare', 'selenium', 'bs4', 'aiohttp', 'requests'),
+    'sweep': ('akshare', 'selenium', 'bs4', 'aiohttp', 'requests'),
+    'benchmark': ('akshare', 'selenium', 'bs4', 'aiohttp', 'requests'),
+}
+# 本地未安装时 check-imports 可以跳过的第三方依赖；其他导入错误（如本仓库模块出错）一律算失败
+THIRD_PARTY_PACKAGES = ('pandas', 'numpy', 'aiohttp', 'tenacity', 'akshare', 'selenium', 'bs4', 'requests', 'yaml', 'pyinstrument')
+# 导入 cli 的耗时上限（秒）
+DEFAULT_IMPORT_BUDGET = float(os.getenv('CLI_IMPORT_BUDGET', 0.2))
+
+
+def _configure_metrics(args):
+    """按命令行参数为指定阶段启用性能剖析"""
+    from run_metrics import get_metrics
+    if args.profile_stage:
+        get_metrics().configure_profiler(args.profile_stage, args.profiler)
+    return get_metrics()
+
+
+def _configure_http_cache(args):
+    """按命令行参数设置 HTTP 缓存模式（未指定时使用 HTTP_CACHE_MODE 等环境变量）"""
+    if args.http_cache or args.http_cache_dir:
+        from http_cache import configure_http_cache
+        configure_http_cache(args.http_cache, args.http_cache_dir)
+
+
+def _shard(args, command):
+    """按 --shard 参数创建分片，未指定时返回 None"""
+    if not args.shard:
+        return None
+    from sharding import Shard
+    return Shard.parse(args.shard, command, args.shard_dir)
+
+
+def _write_metrics(args, default_file, job, shard=None):
+    """写出运行汇总；分片运行时默认写到分片目录"""
+    from run_metrics import get_metrics
+    summary_file = args.summary or (shard.path(default_file) if shard is not None else default_file)
+    get_metrics().write_summary(summary_file, args.prometheus, job=job)
+
+
+def _run_analyze(args):
+    import fund_analyzer
+    fund_analyzer.setup_logging()
+    _configure_metrics(args)
+    _configure_http_cache(args)
+    fund_codes, fund_info = fund_analyzer.load_fund_list(args.funds_url or fund_analyzer.FUNDS_LIST_URL)
+    if not fund_codes:
+        logger.info("没有基金列表可供分析，程序结束。")
+        return 0
+    fund_codes = fund_codes[:args.limit]
+    logger.info("分析前 %d 个基金", len(fund_codes))
+    shard = _shard(args, 'analyze')
+    analyzer = fund_analyzer.FundAnalyzer(max_workers=args.workers, shard=shard, resume=args.resume)
+    analyzer.run_analysis(fund_codes, fund_info)
+    _write_metrics(args, fund_analyzer.RUN_SUMMARY_FILE, 'fund_analyzer', shard)
+    return 0
+
+
+def _run_monitor(args, offline=False):
+    import market_monitor
+    market_monitor.setup_logging()
+    logger.info("脚本启动%s", "（离线模式）" if offline else "")
+    _configure_metrics(args)
+    _configure_http_cache(args)
+    shard = _shard(args, 'monitor') if not offline else None
+    monitor = market_monitor.MarketMonitor(
+        filter_mode=args.filter_mode,
+        rsi_threshold=args.rsi_threshold,
+        holdings=args.holdings,
+        offline=offline,
+        rules_file=args.rules,
+        stream_file=args.stream,
+        repair_gaps=args.repair_gaps,
+        shard=shard,
+        resume=getattr(args, 'resume', False),
+    )
+    monitor.get_fund_data()
+    monitor.generate_report()
+    _write_metrics(args, market_monitor.RUN_SUMMARY_FILE, 'market_monitor', shard)
+    logger.info("脚本执行完成")
+    return 0
+
+
+def _run_report(args):
+    return _run_monitor(args, offline=True)
+
+
+def _run_merge(args):
+    _configure_metrics(args)
+    if args.target == 'analyze':
+        import fund_analyzer
+        fund_analyzer.setup_logging()
+        fund_analyzer.merge_shards(args.shard_dir)
+        _write_metrics(args, fund_analyzer.RUN_SUMMARY_FILE, 'fund_analyzer_merge')
+        return 0
+    import market_monitor
+    market_monitor.setup_logging()
+    monitor = market_monitor.MarketMonitor(
+        filter_mode=args.filter_mode,
+        rsi_threshold=args.rsi_threshold,
+        holdings=args.holdings,
+        rules_file=args.rules,
+    )
+    monitor.merge_shards(args.shard_dir)
+    monitor.generate_report()
+    _write_metrics(args, market_monitor.RUN_SUMMARY_FILE, 'market_monitor_merge')
+    return 0
+
+
+def _run_download_index(args):
+    import download_index_data
+    download_index_data.setup_logging()
+    _configure_metrics(args)
+    _configure_http_cache(args)
+    download_index_data.fetch_and_save_index_data()
+    _write_metrics(args, download_index_data.RUN_SUMMARY_FILE, 'download_index')
+    return 0
+
+
+def _run_backtest(args):
+    import backtest
+    from signal_rules import SignalRules
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stop_loss = args.stop_loss if args.stop_loss > 0 else None
+    backtest.backtest_store(stop_loss=stop_loss, signal=args.signal, rules=SignalRules.load(args.rules))
+    return 0
+
+
+def _run_sweep(args):
+    import sweep
+    from signal_rules import SignalRules
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rules = SignalRules.load(args.rules)
+    grid = sweep.load_grid(args.grid, rules) if args.grid else None
+    sweep.sweep_store(
+        grid=grid,
+        random_samples=args.random or None,
+        seed=args.seed,
+        processes=args.processes,
+        stop_loss=args.stop_loss if args.stop_loss > 0 else None,
+        signal=args.signal,
+        objective=args.objective,
+        output_file=args.output,
+        rules=rules,
+    )
+    return 0
+
+
+def _run_bench(args):
+    import benchmark
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    return benchmark.main(args)
+
+
+class MissingDependency(RuntimeError):
+    """导入模块时缺少本地未安装的第三方依赖"""
+
+    def __init__(self, module, package):
+        super().__init__(f"导入 {module} 需要未安装的 {package}")
+        self.package = package
+
+
+_MISSING_MODULE_RE = re.compile(r"^ModuleNotFoundError: No module named '([^']+)'$")
+
+
+def _import_profile(module):
+    """
+    在新的子进程中用 -X importtime 导入模块。
+    返回 (导入过程中加载的顶层包名集合, 该模块的累计导入耗时秒数)。
+    缺少 THIRD_PARTY_PACKAGES 中的依赖时抛出 MissingDependency，其他导入错误抛出 RuntimeError。
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if proc.returncode != 0:
+        last_line = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else str(proc.returncode)
+        missing = _MISSING_MODULE_RE.match(last_line)
+        if missing and missing.group(1).split('.')[0] in THIRD_PARTY_PACKAGES:
+            raise MissingDependency(module, missing.group(1).split('.')[0])
+        raise RuntimeError(f"导入 {module} 失败: {last_line}")
+    loaded = set()
+    cumulative = 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # 表头
+        name = parts[2].strip()
+        loaded.add(name.split('.')[0])
+        if name == module:
+            cumulative = int(parts[1]) / 1e6
+    return loaded, cumulative
+
+
+def _run_check_imports(args):
+    failed = False
+    for module, forbidden in DEFERRED_IMPORTS.items():
+        try:
+            loaded, seconds = _import_profile(module)
+        except MissingDependency as e:
+            # 本地未安装第三方依赖时只提示，不算失败
+            print(f"{module:<22} 跳过: {e}")
+            continue
+        except RuntimeError as e:
+            print(f"{module:<22} 失败: {e}")
+            failed = True
+            continue
+        eager = sorted(set(forbidden) & loaded)
+        status = "OK"
+        if eager:
+            status = f"导入时加载了 {', '.join(eager)}"
+            failed = True
+        if module == 'cli' and seconds > args.budget:
+            status = f"导入耗时超过预算 {args.budget:.3f}s"
+            failed = True
+        print(f"{module:<22} {seconds * 1000:8.1f} ms  {status}")
+    return 1 if failed else 0
+
+
+def _add_report_arguments(parser):
+    parser.add_argument('--filter-mode', choices=['all', 'strong_buy', 'low_rsi_buy'], default='all', help="报告过滤模式")
+    parser.add_argument('--rsi-threshold', type=float, default=None, help="low_rsi_buy 模式下的 RSI 阈值")
+    parser.add_argument('--holdings', nargs='*', default=None, help="持仓基金代码，在报告中优先显示")
+
+
+def _add_monitor_arguments(parser):
+    _add_report_arguments(parser)
+    parser.add_argument('--stream', default=None, help="逐批把已算出的信号追加到该 CSV 文件，不必等全部基金处理完")
+    parser.add_argument('--repair-gaps', action='store_true',
+                        help="对照交易日历找出本地历史中间缺失的日期区间，按区间并发补齐（读取每只基金的完整历史）")
+    _add_rules_argument(parser)
+    _add_metrics_arguments(parser)
+    _add_http_cache_arguments(parser)
+
+
+def _add_metrics_arguments(parser):
+    parser.add_argument('--summary', default=None, help="运行汇总 JSON 文件（各阶段耗时、HTTP 计数、延迟分布），默认按命令命名")
+    parser.add_argument('--prometheus', default=None, help="同时写出 Prometheus textfile（供 node_exporter 采集）")
+    parser.add_argument('--profile-stage', default=None,
+                        help="对该阶段做性能剖析 (load/staleness/fetch/parse/merge_save/indicators/evaluate/report)")
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile', help="剖析器")
+
+
+def _add_http_cache_arguments(parser):
+    parser.add_argument('--http-cache', choices=['normal', 'record', 'replay', 'off'], default=None,
+                        help="HTTP 缓存模式：normal 复用未过期页面，record 总是访问网络并刷新缓存，"
+                             "replay 只用缓存不访问网络，off 不使用缓存（默认 HTTP_CACHE_MODE 或 normal）")
+    parser.add_argument('--http-cache-dir', default=None, help="HTTP 缓存目录，默认 HTTP_CACHE_DIR 或 http_cache")
+
+
+def _add_shard_arguments(parser, with_shard=True):
+    if with_shard:
+        parser.add_argument('--shard', default=None, metavar='i/N',
+                            help="只处理按基金代码哈希分到第 i 个（从 0 开始）分片的基金，部分结果写入分片目录，由 merge 合并")
+    parser.add_argument('--shard-dir', default=os.getenv('SHARD_DIR', 'shards'), help="分片结果的根目录")
+
+
+def _add_resume_argument(parser):
+    parser.add_argument('--resume', action='store_true',
+                        help="从检查点续跑：跳过本运行窗口内已完成的基金（被中断或超时后使用）")
+
+
+def _add_rules_argument(parser):
+    parser.add_argument('--rules', default=None, help="信号规则文件（JSON/YAML），默认使用 SIGNAL_RULES_FILE 或内置规则")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="基金分析与市场监控命令行工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze = subparsers.add_parser('analyze', help="批量基金评分，生成 analysis_report.md")
+    analyze.add_argument('--limit', type=int, default=1500, help="最多分析的基金数量")
+    analyze.add_argument('--workers', type=int, default=int(os.getenv('ANALYZER_WORKERS', 8)), help="并发评估的线程数")
+    analyze.add_argument('--funds-url', default=None, help="基金列表 CSV 地址，默认使用 fund_analyzer.FUNDS_LIST_URL")
+    _add_metrics_arguments(analyze)
+    _add_http_cache_arguments(analyze)
+    _add_shard_arguments(analyze)
+    _add_resume_argument(analyze)
+    analyze.set_defaults(func=_run_analyze)
+
+    monitor = subparsers.add_parser('monitor', help="更新净值并生成市场监控报告")
+    _add_monitor_arguments(monitor)
+    _add_shard_arguments(monitor)
+    _add_resume_argument(monitor)
+    monitor.set_defaults(func=_run_monitor)
+
+    download = subparsers.add_parser('download-index', help="增量更新沪深300指数数据")
+    _add_metrics_arguments(download)
+    _add_http_cache_arguments(download)
+    download.set_defaults(func=_run_download_index)
+
+    report = subparsers.add_parser('report', help="只用本地数据生成监控报告（不访问网络）")
+    _add_monitor_arguments(report)
+    report.set_defaults(func=_run_report)
+
+    merge = subparsers.add_parser('merge', help="合并 analyze / monitor --shard 各分片的结果，生成完整报告")
+    merge.add_argument('target', choices=['analyze', 'monitor'], help="要合并的命令")
+    _add_report_arguments(merge)
+    _add_rules_argument(merge)
+    _add_metrics_arguments(merge)
+    _add_shard_arguments(merge, with_shard=False)
+    merge.set_defaults(func=_run_merge)
+
+    backtest = subparsers.add_parser('backtest', help="回测本地全部基金，生成 backtest_results.csv 和 backtest_report.md")
+    backtest.add_argument('--stop-loss', type=float, default=0.10, help="单笔止损比例，0 表示不止损")
+    backtest.add_argument('--signal', choices=['action_signal', 'advice'], default='action_signal', help="驱动交易的信号")
+    _add_rules_argument(backtest)
+    backtest.set_defaults(func=_run_backtest)
+
+    sweep = subparsers.add_parser('sweep', help="并行扫描信号阈值和指标窗口，生成参数排名表")
+    sweep.add_argument('--grid', default=None, help="搜索空间 JSON 文件 {参数名: [候选值, ...]}，默认使用 sweep.DEFAULT_GRID")
+    sweep.add_argument('--random', type=int, default=500, help="随机搜索的组合数，0 表示完整网格搜索")
+    sweep.add_argument('--seed', type=int, default=None, help="随机搜索的随机种子")
+    sweep.add_argument('--processes', type=int, default=None, help="工作进程数，默认等于 CPU 核数")
+    sweep.add_argument('--stop-loss', type=float, default=0.10, help="单笔止损比例，0 表示不止损")
+    sweep.add_argument('--signal', choices=['action_signal', 'advice'], default='action_signal', help="驱动交易的信号")
+    sweep.add_argument('--objective', default='sharpe_ratio',
+                       choices=['sharpe_ratio', 'cum_return', 'median_cum_return', 'cagr', 'max_drawdown', 'win_rate'],
+                       help="排序依据（各基金的平均值）")
+    sweep.add_argument('--output', default='sweep_results.csv', help="结果 CSV 文件")
+    _add_rules_argument(sweep)
+    sweep.set_defaults(func=_run_sweep)
+
+    bench = subparsers.add_parser('bench', help="性能基准测试：合成基金数据 + 本地天天基金替身，结果保存为 JSON 并可与基线比较")
+    bench.add_argument('--scenarios', default=None, help="逗号分隔的场景 (monitor,monitor_fresh,analyzer,indicators,index)，默认全部")
+    bench.add_argument('--funds', type=int, default=200, help="合成基金数")
+    bench.add_argument('--days', type=int, default=750, help="每只基金的交易日数")
+    bench.add_argument('--repeat', type=int, default=3, help="每个场景重复运行的次数（取中位数）")
+    bench.add_argument('--seed', type=int, default=0, help="合成数据的随机种子")
+    bench.add_argument('--latency', type=float, default=0.0, help="替身服务器每个请求的延迟（秒）")
+    bench.add_argument('--error-rate', type=float, default=0.0, help="替身服务器返回 500 的请求比例")
+    bench.add_argument('--rate-limit', type=int, default=None, help="替身服务器每秒最多处理的请求数，超出返回 429")
+    bench.add_argument('--output', default='benchmark_results.json', help="结果 JSON 文件")
+    bench.add_argument('--baseline', default=None, help="与之比较的基线 JSON 文件，有场景变慢超过 --tolerance 时返回 1")
+    bench.add_argument('--tolerance', type=float, default=0.2, help="允许的变慢比例")
+    bench.set_defaults(func=_run_bench)
+
+    check = subparsers.add_parser('check-imports', help="检查导入耗时预算和延迟导入")
+    check.add_argument('--budget', type=float, default=DEFAULT_IMPORT_BUDGET, help="导入 cli 的耗时上限（秒）")
+    check.set_defaults(func=_run_check_imports)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        logger.error("命令 %s 运行失败: %s", args.command, e, exc_info=True)
+        raise
+
+
+if __name__ == '__main__':
+    sys.exit(main())
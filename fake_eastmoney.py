@@ -0,0 +1,209 @@
+import re
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_PAGE_RE = re.compile(r'^/(jjjl|ccmx)_(\d{6})\.html$')
+
+LSJZ_HEADER = ("<table class='w782 comm lsjz'><thead><tr><th class='first'>净值日期</th><th>单位净值</th><th>累计净值</th>"
+               "<th>日增长率</th><th>申购状态</th><th>赎回状态</th><th class='tor last'>分红送配</th></tr></thead><tbody>")
+LSJZ_EMPTY_ROW = "<tr><td colspan='7' align='center'>暂无数据!</td></tr>"
+
+
+class FakeEastMoney:
+    """
+    本地的天天基金 (fundf10.eastmoney.com) 替身，用于基准测试和离线调试，不访问真实网络。
+    提供 F10DataApi.aspx?type=lsjz 分页净值（支持 page/per/sdate/edate）、jjjl_{代码}.html 基金经理页
+    和 ccmx_{代码}.html 持仓明细页；可以模拟响应延迟、服务端限流 (429) 和随机错误 (500)。
+    frames 为 {基金代码: DataFrame[date, net_value]}，可在运行中通过 update() 替换。
+    """
+
+    def __init__(self, frames, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, rate_limit=None, seed=0):
+        self.latency = latency  # 每个请求的固定延迟（秒）
+        self.error_rate = error_rate  # 返回 500 的请求比例
+        self.rate_limit = rate_limit  # 每秒最多处理的请求数，超出时返回 429，None 表示不限流
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (当前秒, 当前秒内已处理的请求数)
+        self.stats = {}
+        self.reset_stats()
+        self._series = {}
+        self.update(frames)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def update(self, frames):
+        """替换服务端数据；每只基金按日期降序保存为数组，便于分页"""
+        series = {}
+        for fund_code, df in frames.items():
+            df = df.sort_values(by='date', ascending=False)
+            series[fund_code] = (df['date'].values.astype('datetime64[D]'), df['net_value'].to_numpy(dtype=np.float64))
+        with self._lock:
+            self._series = series
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'lsjz': 0, 'jjjl': 0, 'ccmx': 0, 'errors': 0, 'throttled': 0, 'not_found': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-eastmoney', daemon=True)
+        self._thread.start()
+        logger.info("本地天天基金替身已启动: %s", self.base_url)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _admit(self):
+        """按限流和错误率决定本次请求的结果：None 表示正常处理，否则为 HTTP 状态码"""
+        with self._lock:
+            self.stats['requests'] += 1
+            if self.rate_limit:
+                second = int(time.monotonic())
+                start, count = self._window
+                if second != start:
+                    start, count = second, 0
+                self._window = (start, count + 1)
+                if count >= self.rate_limit:
+                    self.stats['throttled'] += 1
+                    return 429
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 500
+        return None
+
+    def lsjz(self, fund_code, page=1, per=20, sdate=None, edate=None):
+        """按真实接口的格式返回一页历史净值（JS 变量 apidata）"""
+        with self._lock:
+            dates, values = self._series.get(fund_code, (np.empty(0, dtype='datetime64[D]'), np.empty(0)))
+        if sdate or edate:
+            # 日期降序：edate 之后的行在前，sdate 之前的行在后
+            hi = len(dates) - np.searchsorted(dates[::-1], np.datetime64(edate), side='right') if edate else 0
+            lo = len(dates) - np.searchsorted(dates[::-1], np.datetime64(sdate), side='left') if sdate else len(dates)
+            dates, values = dates[hi:lo], values[hi:lo]
+        per = max(1, per)
+        records = len(dates)
+        pages = -(-records // per)
+        start = (page - 1) * per
+        rows = ''.join(
+            f"<tr><td>{day}</td><td class='tor bold'>{value:.4f}</td><td class='tor bold'>{value:.4f}</td>"
+            f"<td class='tor bold red'>0.10%</td><td>开放申购</td><td>开放赎回</td><td class='red unbold'></td></tr>"
+            for day, value in zip(dates[start:start + per], values[start:start + per])
+        )
+        content = LSJZ_HEADER + (rows or LSJZ_EMPTY_ROW) + "</tbody></table>"
+        return f'var apidata={{ content:"{content}",records:{records},pages:{pages},curpage:{page}}};'
+
+    def manager_page(self, fund_code):
+        """基金经理页：'基金经理变动一览' 标题后的表格，第一行为现任经理"""
+        seed = int(fund_code)
+        years, days = seed % 7, seed % 300
+        return (
+            "<html><body><div class='boxitem'>"
+            "<h4><label>基金经理变动一览</label></h4>"
+            "<table class='w782 comm jloff'><tr><th>起始期</th><th>截止期</th><th>基金经理</th><th>任职期间</th><th>任职回报</th></tr>"
+            f"<tr><td>2020-01-01</td><td>至今</td><td>经理{seed % 97}</td><td>{years}年又{days}天</td><td>{seed % 200 - 50:.2f}%</td></tr>"
+            "</table></div></body></html>"
+        )
+
+    def holdings_page(self, fund_code):
+        """持仓明细页：'股票投资明细' 标题后的持仓表格（静态页面，无需浏览器渲染）"""
+        seed = int(fund_code)
+        rows = ''.join(
+            f"<tr><td>{i + 1}</td><td>{600000 + (seed + i * 37) % 4000:06d}</td><td>股票{i + 1}</td><td>10.00</td>"
+            f"<td>{(seed + i) % 9 + 1:.2f}%</td><td>100.00</td><td>{(seed * (i + 1)) % 50000 + 100:,.2f}</td></tr>"
+            for i in range(10)
+        )
+        return (
+            "<html><body><div id='cctable'><div class='box'>"
+            "<h4>股票投资明细</h4>"
+            "<table><tr><th>序号</th><th>股票代码</th><th>股票名称</th><th>最新价</th><th>占净值比例</th><th>持股数（万股）</th><th>持仓市值（万元）</th></tr>"
+            + rows + "</table></div></div></body></html>"
+        )
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                status = server._admit()
+                if status is not None:
+                    return self._send(status, "Too Many Requests" if status == 429 else "Internal Server Error")
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path.endswith('/F10DataApi.aspx') and query.get('type') == 'lsjz' and 'code' in query:
+                    server._count('lsjz')
+                    body = server.lsjz(query['code'], int(query.get('page', 1)), int(query.get('per', 20)),
+                                       query.get('sdate') or None, query.get('edate') or None)
+                    return self._send(200, body)
+                match = _PAGE_RE.match(url.path)
+                if match:
+                    kind, fund_code = match.groups()
+                    server._count(kind)
+                    body = server.manager_page(fund_code) if kind == 'jjjl' else server.holdings_page(fund_code)
+                    return self._send(200, body)
+                server._count('not_found')
+                self._send(404, "Not Found")
+
+            def _send(self, status, body):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    from benchmark import synthetic_universe
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="启动本地天天基金替身（合成净值数据）")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--funds', type=int, default=200, help="合成基金数")
+    parser.add_argument('--days', type=int, default=750, help="每只基金的交易日数")
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 500 的请求比例")
+    parser.add_argument('--rate-limit', type=int, default=None, help="每秒最多处理的请求数，超出返回 429")
+    args = parser.parse_args()
+    server = FakeEastMoney(synthetic_universe(args.funds, args.days), port=args.port, latency=args.latency,
+                           error_rate=args.error_rate, rate_limit=args.rate_limit)
+    server.start()
+    print(f"EASTMONEY_F10_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,108 @@
+import os
+import json
+import zlib
+import logging
+from datetime import datetime
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 校验文件末尾的字节数：净值文件只在末尾追加，重写时末尾也会变化，配合文件大小即可判断内容是否变化
+TAIL_CHECKSUM_BYTES = 4096
+
+
+def tail_checksum(file_path, size=None):
+    """文件最后 TAIL_CHECKSUM_BYTES 字节的 CRC32，不读取整个文件"""
+    if size is None:
+        size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, size - TAIL_CHECKSUM_BYTES))
+        return f"tail-crc32:{zlib.crc32(f.read(TAIL_CHECKSUM_BYTES)):08x}"
+
+
+class FreshnessIndex:
+    """
+    基金本地数据的新鲜度索引（JSON 文件）。
+    每只基金记录最新日期、行数、文件大小/修改时间/校验和，以及最近一次抓取的时间和结果，
+    预加载时只需查索引即可判断是否需要下载，而不必打开数据文件。
+    """
+
+    def __init__(self, path, nav_store):
+        self.path = path
+        self.nav_store = nav_store
+        self.entries = {}
+        self.save_path = None  # 分片运行时写到分片目录，由合并步骤并回 path
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+                logger.info("已加载新鲜度索引，共 %d 只基金", len(self.entries))
+            except Exception as e:
+                logger.warning("新鲜度索引 %s 读取失败，将重新建立: %s", self.path, e)
+                self.entries = {}
+        return self
+
+    def save(self):
+        path = self.save_path or self.path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(self.entries.items())), f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def lookup(self, fund_code):
+        """
+        返回有效的索引记录；数据文件不存在或内容已变化（大小或末尾校验和不一致）时返回 None。
+        不依赖修改时间：git checkout 后修改时间都会变化，索引文件本身也不应因此改变。
+        """
+        entry = self.entries.get(fund_code)
+        if not entry or not entry.get('last_date'):
+            return None
+        file_path = self.nav_store.path(fund_code)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if stat.st_size != entry.get('size'):
+            return None
+        if tail_checksum(file_path, stat.st_size) != entry.get('checksum'):
+            return None
+        return entry
+
+    def latest_date(self, entry):
+        return pd.Timestamp(entry['last_date'])
+
+    def record(self, fund_code, last_date=None, rows=None):
+        """写入后更新某只基金的记录；未给出的最新日期和行数从存储中读取（行数需要读取整个文件，调用方应尽量给出）"""
+        file_path = self.nav_store.path(fund_code)
+        if not os.path.exists(file_path):
+            self.entries.pop(fund_code, None)
+            return None
+        if last_date is None:
+            last_date = self.nav_store.last_date(fund_code)
+        if rows is None:
+            rows = self.nav_store.row_count(fund_code)
+        stat = os.stat(file_path)
+        entry = self.entries.setdefault(fund_code, {})
+        entry.pop('mtime_ns', None)  # 旧版本索引的字段
+        entry.update({
+            'last_date': pd.Timestamp(last_date).strftime('%Y-%m-%d') if last_date is not None else None,
+            'rows': int(rows),
+            'size': stat.st_size,
+            'checksum': tail_checksum(file_path, stat.st_size),
+        })
+        return entry
+
+    def record_attempt(self, fund_code, status):
+        """记录最近一次网络抓取的时间和结果（'ok' / 'no_data' / 'error'）"""
+        entry = self.entries.setdefault(fund_code, {})
+        entry['last_fetch'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        entry['last_fetch_status'] = status
+
+    def fetched_since(self, fund_code, moment):
+        """最近一次抓取是否在 moment 之后且成功完成（有新数据或确认无新数据）"""
+        entry = self.entries.get(fund_code)
+        if not entry or entry.get('last_fetch_status') not in ('ok', 'no_data'):
+            return False
+        return datetime.strptime(entry['last_fetch'], '%Y-%m-%d %H:%M:%S') >= moment
@@ -1,77 +1,70 @@
 import pandas as pd
-import akshare as ak
 from datetime import datetime, timedelta
 import numpy as np
 import time
-import requests
-from bs4 import BeautifulSoup
 import re
-import json
 import os
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-
-# 配置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('fund_analyzer.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rate_limiter import get_bucket, get_host, CircuitOpenError
+from fund_cache import FundCache
+from selenium_fetcher import SeleniumFetcher
+from risk_metrics import nav_matrix, risk_metrics
+from run_metrics import get_metrics
+from http_cache import get_http_cache, HttpCacheMiss
+from sharding import SHARD_DIR, load_shards, merge_repository
+from checkpoint import Checkpoint, checkpoint_path, fingerprint
+
 logger = logging.getLogger('FundAnalyzer')
 
-class SeleniumFetcher:
-    """
-    使用 Selenium 模拟浏览器进行数据抓取。
-    """
-    def __init__(self):
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # 无头模式，不显示浏览器窗口
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
-        # 指定 Chromium 二进制路径和 ChromeDriver 路径
-        chrome_options.binary_location = os.getenv('CHROME_BINARY_PATH', '/usr/bin/chromium-browser')
-        service = ChromeService(executable_path=os.getenv('CHROMEDRIVER_PATH', '/usr/bin/chromedriver'))
-        try:
-            # 尝试使用环境变量中的 ChromeDriver
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        except WebDriverException as e:
-            logger.error(f"Selenium WebDriver 初始化失败: {e}")
-            self.driver = None
-
-    def get_page_source(self, url, wait_for_element=None, timeout=30):
-        if not self.driver:
-            return None
-        try:
-            self.driver.get(url)
-            if wait_for_element:
-                WebDriverWait(self.driver, timeout).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, wait_for_element))
-                )
-            return self.driver.page_source
-        except (TimeoutException, WebDriverException) as e:
-            logger.error(f"Selenium 抓取失败: {e}")
-            return None
+# 推荐基金列表
+FUNDS_LIST_URL = 'https://raw.githubusercontent.com/qjlxg/rep/main/recommended_cn_funds.csv'
+# 天天基金 F10 站点地址（基金经理页、持仓明细页），可指向本地替身（见 fake_eastmoney.py）
+F10_BASE_URL = os.getenv('EASTMONEY_F10_URL', 'http://fundf10.eastmoney.com').rstrip('/')
+
+
+def setup_logging():
+    """配置日志记录（只在作为脚本或命令行子命令运行时调用，导入模块时不产生日志文件）"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('fund_analyzer.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
 
-    def __del__(self):
-        if self.driver:
-            self.driver.quit()
+# 并发评估的工作线程数（可通过环境变量调整）
+ANALYZER_WORKERS = int(os.getenv('ANALYZER_WORKERS', 8))
+AKSHARE_CONCURRENCY = int(os.getenv('AKSHARE_CONCURRENCY', 4))
+AKSHARE_RATE = float(os.getenv('AKSHARE_RATE', 4))  # 每秒请求数
+# akshare 各接口的 (限速桶名称, 最大并发数, 每秒请求数)
+SOURCE_LIMITS = {
+    'nav': ('akshare:fund_open_fund_info_em', AKSHARE_CONCURRENCY, AKSHARE_RATE),
+    'manager': ('akshare:fund_manager_em', AKSHARE_CONCURRENCY, AKSHARE_RATE),
+    'holdings': ('akshare:fund_portfolio_hold_em', AKSHARE_CONCURRENCY, AKSHARE_RATE),
+}
+# 网页抓取与 lsjz 抓取器（MarketMonitor、指数下载）共用天天基金的站点请求预算（限速 + 自适应并发 + 熔断）
+WEB_HOST = (urlsplit(F10_BASE_URL).netloc, float(os.getenv('FETCH_RATE', 5)), int(os.getenv('FETCH_CONCURRENCY', 8)))
+# 旧版 JSON 缓存文件，首次创建 SQLite 缓存时自动导入
+LEGACY_CACHE_FILE = 'fund_cache.json'
+# 后台刷新过期缓存的线程数
+REFRESH_WORKERS = int(os.getenv('CACHE_REFRESH_WORKERS', 2))
+CACHE_LABELS = {'fund': '数据', 'manager': '经理数据', 'holdings': '持仓数据'}
+# 运行汇总（各阶段耗时、HTTP 计数和每只基金的评估耗时分布）
+RUN_SUMMARY_FILE = 'fund_analyzer_summary.json'
+ANALYSIS_REPORT_FILE = 'analysis_report.md'
+# 分片运行时各分片写出的评分记录（合并后生成报告）
+SHARD_SCORES_FILE = 'scores.json'
 
 class FundAnalyzer:
     """
     一个用于自动化分析中国公募基金的类。
     """
-    def __init__(self, risk_free_rate=0.01858, cache_file='fund_cache.json', cache_data=True):
+    def __init__(self, risk_free_rate=0.01858, cache_file='fund_cache.db', cache_data=True, max_workers=ANALYZER_WORKERS, stale_while_revalidate=True, nav_repository=None, http_cache=None, shard=None, resume=False):
         self.fund_data = {}
         self.manager_data = {}
         self.holdings_data = {}
@@ -80,9 +73,50 @@ class FundAnalyzer:
         self.cache_file = cache_file
         self.cache_data = cache_data
         self.cache = self._load_cache()
+        # 缓存过期时先使用旧值，再在后台刷新
+        self.stale_while_revalidate = stale_while_revalidate
+        self._refresh_executor = None
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
         # 直接使用用户提供的无风险利率，不再进行抓取
         self.risk_free_rate = risk_free_rate
-        self.selenium_fetcher = SeleniumFetcher()
+        self._nav_repository = nav_repository  # 与 MarketMonitor 共用的本地净值仓库
+        self._nav_lock = threading.Lock()
+        self._batch_nav_metrics = {}  # run_analysis 开始时由本地净值矩阵一次性计算的指标
+        self._selenium_fetcher = None  # 首次需要渲染页面时才创建浏览器池
+        self._selenium_lock = threading.Lock()
+        self.max_workers = max_workers
+        # 网页请求的磁盘缓存（重放模式下不访问网络）
+        self.http_cache = http_cache or get_http_cache()
+        # 每个 akshare 数据源一个并发上限（信号量）和一个限速令牌桶
+        self._sources = {
+            source: (threading.BoundedSemaphore(concurrency), get_bucket(bucket_name, rate, capacity=concurrency))
+            for source, (bucket_name, concurrency, rate) in SOURCE_LIMITS.items()
+        }
+        self._web_host = get_host(*WEB_HOST)
+        # 分片（sharding.Shard）：只评估属于该分片的基金，评分写入分片目录，报告由 merge_shards 统一生成
+        self.shard = shard
+        self._positions = {}  # 各基金在完整基金列表中的位置，合并后按此恢复报告顺序
+        # 每只基金的评分写入检查点；resume 为 True 时跳过同一运行窗口内已完成的基金
+        self.resume = resume
+        self.checkpoint = None
+
+    @property
+    def nav_repository(self):
+        if self._nav_repository is None:
+            with self._nav_lock:
+                if self._nav_repository is None:
+                    from nav_repository import NavRepository
+                    self._nav_repository = NavRepository()
+        return self._nav_repository
+
+    @property
+    def selenium_fetcher(self):
+        if self._selenium_fetcher is None:
+            with self._selenium_lock:
+                if self._selenium_fetcher is None:
+                    self._selenium_fetcher = SeleniumFetcher()
+        return self._selenium_fetcher
 
     def _log(self, message, level='info'):
         """统一的日志记录方法"""
@@ -94,131 +128,342 @@ class FundAnalyzer:
             logger.error(message)
 
     def _load_cache(self):
-        """从文件加载缓存数据"""
-        if self.cache_data and os.path.exists(self.cache_file):
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        """打开 SQLite 缓存（按需读取，不在启动时加载全部数据）"""
+        if self.cache_data:
+            return FundCache(self.cache_file, legacy_json=LEGACY_CACHE_FILE)
+        return None
 
     def _save_cache(self):
-        """将缓存数据保存到文件"""
-        if self.cache_data:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=4)
+        """提交尚未写入的缓存记录"""
+        if self.cache is not None:
+            self.cache.flush()
+
+    def _cache_put(self, namespace, fund_code, value):
+        """写入缓存，由缓存层累计一批后在一个事务里提交；基金经理变更时同时作废该基金的净值指标和持仓缓存"""
+        if self.cache is None:
+            return
+        if namespace == 'manager':
+            previous = self.cache.get('manager', fund_code)
+            if previous and previous.get('name') not in (None, 'N/A') and previous.get('name') != value.get('name'):
+                self._log(f"基金 {fund_code} 经理由 {previous.get('name')} 变更为 {value.get('name')}，作废相关缓存")
+                self.cache.invalidate('fund', fund_code)
+                self.cache.invalidate('holdings', fund_code)
+        self.cache.put(namespace, fund_code, value)
+
+    def _cached(self, namespace, fund_code, fetch):
+        """
+        按缓存策略取值：未过期直接使用缓存；已过期时，若开启 stale_while_revalidate 则先返回旧值并在后台刷新，
+        否则同步调用 fetch 重新获取。获取失败时返回 None。
+        """
+        entry = self.cache.lookup(namespace, fund_code) if self.cache is not None else None
+        if entry is not None:
+            value, expired = entry
+            if not expired:
+                self._log(f"使用缓存的基金 {fund_code} {CACHE_LABELS[namespace]}")
+                return value
+            if self.stale_while_revalidate:
+                self._log(f"基金 {fund_code} {CACHE_LABELS[namespace]}缓存已过期，先使用旧值并在后台刷新")
+                self._schedule_refresh(namespace, fund_code, fetch)
+                return value
+        value = fetch(fund_code)
+        if value is not None:
+            self._cache_put(namespace, fund_code, value)
+        return value
+
+    def _schedule_refresh(self, namespace, fund_code, fetch):
+        """在后台线程中刷新一条过期缓存，只更新缓存，不影响本次运行的评分"""
+        with self._refresh_lock:
+            if (namespace, fund_code) in self._refreshing:
+                return
+            self._refreshing.add((namespace, fund_code))
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+
+        def refresh():
+            try:
+                value = fetch(fund_code)
+                if value is not None:
+                    self._cache_put(namespace, fund_code, value)
+            except Exception as e:
+                self._log(f"后台刷新基金 {fund_code} {CACHE_LABELS[namespace]}失败: {e}", 'warning')
+
+        self._refresh_executor.submit(refresh)
+
+    def _wait_for_refreshes(self):
+        """等待后台刷新全部完成并提交缓存"""
+        with self._refresh_lock:
+            executor, self._refresh_executor = self._refresh_executor, None
+        if executor is not None:
+            self._log(f"等待 {len(self._refreshing)} 条过期缓存在后台刷新完成...")
+            executor.shutdown(wait=True)
+            self._refreshing.clear()
+        self._save_cache()
+
+    def invalidate_cache(self, namespace, fund_code=None):
+        """手动作废缓存；fund_code 为空时作废整个命名空间"""
+        if self.cache is not None:
+            self.cache.invalidate(namespace, fund_code)
+
+    @contextmanager
+    def _source_slot(self, source):
+        """占用某个数据源的一个并发名额，并按该数据源的速率限速"""
+        semaphore, bucket = self._sources[source]
+        with semaphore:
+            get_metrics().record_throttle(source, bucket.acquire())
+            yield
+
+    def _web_get(self, url, headers, parse):
+        """
+        获取网页并用 parse 解析：先查 HTTP 缓存，未命中时在天天基金的站点请求预算内发出 GET 请求并记录 HTTP 指标。
+        只有 parse 返回非 None 时才写入缓存，错误页或反爬页面不会被缓存。返回 parse 的结果。
+        HTTP 错误时抛出 requests 的异常，站点熔断时抛出 CircuitOpenError，重放模式下缓存中没有时抛出 HttpCacheMiss。
+        """
+        text = self.http_cache.get(url)
+        if text is not None:
+            return parse(text)
+        import requests
+        metrics = get_metrics()
+        with self._web_host.request() as call:
+            metrics.record_throttle('web', call.throttle_wait)
+            started = time.perf_counter()
+            nbytes = 0
+            try:
+                response = requests.get(url, headers=headers, timeout=10)
+                call.status, nbytes = response.status_code, len(response.content)
+                response.raise_for_status()
+            finally:
+                metrics.record_http('web', call.status, nbytes, time.perf_counter() - started)
+        result = parse(response.text)
+        if result is not None:
+            self.http_cache.put(url, None, response.text)
+        return result
+
+    def _rendered_get(self, url, wait_for_element, parse):
+        """浏览器渲染后的页面，同样经过 HTTP 缓存（以 rendered=1 与静态页面区分），解析成功才写入缓存"""
+        params = {'rendered': 1}
+        page_source = self.http_cache.get(url, params)
+        if page_source is not None:
+            return parse(page_source)
+        # 浏览器渲染耗时不反映站点负载，只占用限速额度，不参与自适应并发的调整
+        get_metrics().record_throttle('web', self._web_host.bucket.acquire())
+        page_source = self.selenium_fetcher.get_page_source(url, wait_for_element=wait_for_element)
+        if not page_source:
+            return None
+        result = parse(page_source)
+        if result is not None:
+            self.http_cache.put(url, params, page_source)
+        return result
+
+    def _akshare(self):
+        """akshare 模块；HTTP 缓存为重放模式时不访问网络，直接抛出 HttpCacheMiss"""
+        if self.http_cache.replay:
+            raise HttpCacheMiss("重放模式下不调用 akshare")
+        import akshare as ak
+        return ak
 
     def _get_fund_data(self, fund_code: str):
         """
         获取基金的单位净值和累计净值数据，用于计算夏普比率和最大回撤。
-        优先使用 akshare，失败则通过网页抓取。
+        优先由本地净值仓库计算，本地历史不足时使用 akshare。
+        本次已批量计算出的指标直接使用并写入缓存，不经过 stale-while-revalidate 返回上次的旧值。
         """
-        if fund_code in self.cache.get('fund', {}):
-            self.fund_data[fund_code] = self.cache['fund'][fund_code]
-            self._log(f"使用缓存的基金 {fund_code} 数据")
-            return True
+        if fund_code in self._batch_nav_metrics:
+            fund_data = self._batch_nav_metrics[fund_code]
+            self._log(f"基金 {fund_code} 数据已由本地净值批量计算：{fund_data}")
+            self._cache_put('fund', fund_code, fund_data)
+        else:
+            fund_data = self._cached('fund', fund_code, self._fetch_fund_data)
+        if fund_data is None:
+            self.fund_data[fund_code] = {'latest_nav': np.nan, 'sharpe_ratio': np.nan, 'max_drawdown': np.nan}
+            return False
+        self.fund_data[fund_code] = fund_data
+        return True
+
+    def _nav_metrics(self, nav):
+        """由按日期升序的单位净值序列计算最新净值、夏普比率和最大回撤"""
+        if len(nav) < 252:  # 至少一年数据
+            raise ValueError("数据不足，无法计算可靠的夏普比率和回撤")
+
+        returns = nav.pct_change().dropna()
+        
+        annual_returns = returns.mean() * 252
+        annual_volatility = returns.std() * (252**0.5)
+        sharpe_ratio = (annual_returns - self.risk_free_rate) / annual_volatility if annual_volatility != 0 else 0
+        
+        rolling_max = nav.cummax()
+        daily_drawdown = (nav - rolling_max) / rolling_max
+        max_drawdown = daily_drawdown.min() * -1
+        
+        return {
+            'latest_nav': float(nav.iloc[-1]),
+            'sharpe_ratio': float(sharpe_ratio),
+            'max_drawdown': float(max_drawdown)
+        }
 
+    def _fetch_fund_data(self, fund_code: str):
+        """
+        计算基金的夏普比率和最大回撤，失败时返回 None。
+        优先使用本地净值仓库（run_analysis 开始时已补齐尾部）；本地历史不足时才用 akshare 下载完整历史，
+        并写入仓库，之后只需增量更新。
+        """
+        try:
+            local_df = self.nav_repository.history(fund_code)
+            if len(local_df) >= 252:
+                result = self._nav_metrics(local_df.set_index('date')['net_value'])
+                self._log(f"基金 {fund_code} 数据已由本地净值计算：{result}")
+                return result
+        except Exception as e:
+            self._log(f"由本地净值计算基金 {fund_code} 指标失败，改用 akshare: {e}", 'warning')
+
+        if self.http_cache.replay:
+            self._log(f"重放模式下基金 {fund_code} 本地净值不足，跳过 akshare 下载", 'warning')
+            return None
+        import akshare as ak
         self._log(f"正在获取基金 {fund_code} 的实时数据...")
         for attempt in range(3):  # 手动重试机制，最多3次
             try:
-                fund_data = ak.fund_open_fund_info_em(symbol=fund_code, indicator="单位净值走势")
+                with self._source_slot('nav'):
+                    fund_data = ak.fund_open_fund_info_em(symbol=fund_code, indicator="单位净值走势")
                 fund_data['净值日期'] = pd.to_datetime(fund_data['净值日期'])
                 fund_data.set_index('净值日期', inplace=True)
                 
                 # 数据清洗：去除异常值和缺失值
                 fund_data = fund_data.dropna()
-                if len(fund_data) < 252:  # 至少一年数据
-                    raise ValueError("数据不足，无法计算可靠的夏普比率和回撤")
-
-                returns = fund_data['单位净值'].pct_change().dropna()
-                
-                annual_returns = returns.mean() * 252
-                annual_volatility = returns.std() * (252**0.5)
-                sharpe_ratio = (annual_returns - self.risk_free_rate) / annual_volatility if annual_volatility != 0 else 0
-                
-                rolling_max = fund_data['单位净值'].cummax()
-                daily_drawdown = (fund_data['单位净值'] - rolling_max) / rolling_max
-                max_drawdown = daily_drawdown.min() * -1
-                
-                self.fund_data[fund_code] = {
-                    'latest_nav': float(fund_data['单位净值'].iloc[-1]),
-                    'sharpe_ratio': float(sharpe_ratio),
-                    'max_drawdown': float(max_drawdown)
-                }
-                if self.cache_data:
-                    self.cache.setdefault('fund', {})[fund_code] = self.fund_data[fund_code]
-                    self._save_cache()
-                self._log(f"基金 {fund_code} 数据已获取：{self.fund_data[fund_code]}")
-                return True
+                self._save_nav_history(fund_code, fund_data['单位净值'])
+                result = self._nav_metrics(fund_data['单位净值'])
+                self._log(f"基金 {fund_code} 数据已获取：{result}")
+                return result
             except Exception as e:
                 self._log(f"获取基金 {fund_code} 数据失败 (尝试 {attempt+1}/3): {e}")
                 time.sleep(2)  # 等待2秒后重试
-        self.fund_data[fund_code] = {'latest_nav': np.nan, 'sharpe_ratio': np.nan, 'max_drawdown': np.nan}
-        return False
+        return None
+
+    def _save_nav_history(self, fund_code, nav):
+        """把 akshare 下载的完整净值历史写入共享净值仓库，失败不影响评分"""
+        if nav.empty:
+            return
+        try:
+            history = pd.DataFrame({'date': nav.index, 'net_value': nav.values})
+            mode = self.nav_repository.save(fund_code, history)
+            self._log(f"基金 {fund_code} 净值历史已写入本地仓库 ({mode})")
+        except Exception as e:
+            self._log(f"写入基金 {fund_code} 净值历史失败: {e}", 'warning')
+
+    def _nav_targets(self, fund_codes):
+        """净值指标缓存缺失或过期、需要重新计算的基金"""
+        if self.cache is None:
+            return list(fund_codes)
+        return [code for code in fund_codes if (self.cache.lookup('fund', code) or (None, True))[1]]
+
+    def _sync_nav(self, fund_codes):
+        """
+        评分前批量补齐本地净值的尾部（只针对净值指标缓存缺失或过期的基金）。
+        本地没有历史的基金不在这里下载，由 _fetch_fund_data 通过 akshare 一次性获取完整历史。
+        """
+        fund_codes = self._nav_targets(fund_codes)
+        if not fund_codes:
+            return
+        try:
+            status = self.nav_repository.sync(fund_codes, download_missing=False)
+            counts = pd.Series(list(status.values())).value_counts().to_dict()
+            self._log(f"本地净值仓库同步完成: {counts}")
+        except Exception as e:
+            self._log(f"同步本地净值仓库失败，将直接通过 akshare 获取: {e}", 'warning')
+
+    def _compute_nav_metrics(self, fund_codes):
+        """
+        把本地已有历史的基金对齐成日期 × 基金矩阵，一次性计算成立以来的夏普比率和最大回撤，
+        代替逐只基金的 pandas 计算。历史不足 252 条的基金留给 _fetch_fund_data 处理。
+        """
+        fund_codes = self._nav_targets(fund_codes)
+        if not fund_codes:
+            return
+        try:
+            frames = {code: self.nav_repository.history(code) for code in fund_codes}
+            nav = nav_matrix({code: df for code, df in frames.items() if len(df) >= 252})
+            if nav.empty:
+                return
+            table = risk_metrics(nav, {'inception': None}, risk_free_rate=self.risk_free_rate)
+            latest = nav.ffill().iloc[-1]
+            for code, row in table.iterrows():
+                self._batch_nav_metrics[code] = {
+                    'latest_nav': float(latest[code]),
+                    'sharpe_ratio': float(row['sharpe_inception']),
+                    'max_drawdown': float(row['max_drawdown_inception'])
+                }
+            self._log(f"已由本地净值矩阵批量计算 {len(self._batch_nav_metrics)} 只基金的指标")
+        except Exception as e:
+            self._log(f"批量计算本地净值指标失败，改为逐只计算: {e}", 'warning')
+
+    def _parse_manager_html(self, html, manager_url):
+        """从基金经理页面解析最新任职的经理，页面中没有经理变动表格时返回 None"""
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # 找到包含“基金经理变动一览”文本的标签
+        title_label = soup.find('label', string='基金经理变动一览')
+        if not title_label:
+            self._log(f"在 {manager_url} 中未找到基金经理变动表格的标题。")
+            return None
+        
+        # 从父容器中找到表格
+        manager_table = title_label.find_parent().find_next_sibling('table')
+        if not manager_table:
+            self._log(f"在 {manager_url} 中未找到基金经理变动表格。")
+            return None
+        
+        rows = manager_table.find_all('tr')
+        if len(rows) < 2:
+            self._log("基金经理变动表格数据不完整。")
+            return None
+        
+        # 找到第一行数据，即最新任职的经理
+        latest_manager_row = rows[1]
+        cols = latest_manager_row.find_all('td')
+        
+        if len(cols) < 5:
+            self._log("基金经理变动表格列数不正确。")
+            return None
+        
+        manager_name = cols[2].text.strip()
+        tenure_str = cols[3].text.strip()
+        cumulative_return_str = cols[4].text.strip()
+        
+        # 解析任职天数和累计回报
+        tenure_days = np.nan
+        if '年又' in tenure_str:
+            tenure_parts = tenure_str.split('年又')
+            years = float(re.search(r'\d+', tenure_parts[0]).group())
+            days = float(re.search(r'\d+', tenure_parts[1]).group())
+            tenure_days = years * 365 + days
+        elif '天' in tenure_str:
+            tenure_days = float(re.search(r'\d+', tenure_str).group())
+        elif '年' in tenure_str:
+            tenure_days = float(re.search(r'\d+', tenure_str).group()) * 365
+        else:
+            tenure_days = np.nan
+            
+        cumulative_return = float(re.search(r'[-+]?\d*\.?\d+', cumulative_return_str).group()) if '%' in cumulative_return_str else np.nan
+
+        return {
+            'name': manager_name,
+            'tenure_years': float(tenure_days) / 365.0 if pd.notna(tenure_days) else np.nan,
+            'cumulative_return': cumulative_return
+        }
 
     def _scrape_manager_data_from_web(self, fund_code: str) -> dict:
         """
         从天天基金网通过网页抓取获取基金经理数据
         """
+        import requests
         self._log(f"尝试通过网页抓取获取基金 {fund_code} 的基金经理数据...")
-        manager_url = f"http://fundf10.eastmoney.com/jjjl_{fund_code}.html"
+        manager_url = f"{F10_BASE_URL}/jjjl_{fund_code}.html"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         try:
-            response = requests.get(manager_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # 找到包含“基金经理变动一览”文本的标签
-            title_label = soup.find('label', string='基金经理变动一览')
-            if not title_label:
-                self._log(f"在 {manager_url} 中未找到基金经理变动表格的标题。")
-                return None
-            
-            # 从父容器中找到表格
-            manager_table = title_label.find_parent().find_next_sibling('table')
-            if not manager_table:
-                self._log(f"在 {manager_url} 中未找到基金经理变动表格。")
-                return None
-            
-            rows = manager_table.find_all('tr')
-            if len(rows) < 2:
-                self._log("基金经理变动表格数据不完整。")
-                return None
-            
-            # 找到第一行数据，即最新任职的经理
-            latest_manager_row = rows[1]
-            cols = latest_manager_row.find_all('td')
-            
-            if len(cols) < 5:
-                self._log("基金经理变动表格列数不正确。")
-                return None
-            
-            manager_name = cols[2].text.strip()
-            tenure_str = cols[3].text.strip()
-            cumulative_return_str = cols[4].text.strip()
-            
-            # 解析任职天数和累计回报
-            tenure_days = np.nan
-            if '年又' in tenure_str:
-                tenure_parts = tenure_str.split('年又')
-                years = float(re.search(r'\d+', tenure_parts[0]).group())
-                days = float(re.search(r'\d+', tenure_parts[1]).group())
-                tenure_days = years * 365 + days
-            elif '天' in tenure_str:
-                tenure_days = float(re.search(r'\d+', tenure_str).group())
-            elif '年' in tenure_str:
-                tenure_days = float(re.search(r'\d+', tenure_str).group()) * 365
-            else:
-                tenure_days = np.nan
-                
-            cumulative_return = float(re.search(r'[-+]?\d*\.?\d+', cumulative_return_str).group()) if '%' in cumulative_return_str else np.nan
-
-            return {
-                'name': manager_name,
-                'tenure_years': float(tenure_days) / 365.0 if pd.notna(tenure_days) else np.nan,
-                'cumulative_return': cumulative_return
-            }
-        except requests.exceptions.RequestException as e:
+            return self._web_get(manager_url, headers, lambda html: self._parse_manager_html(html, manager_url))
+        except (requests.exceptions.RequestException, HttpCacheMiss, CircuitOpenError) as e:
             self._log(f"网页抓取基金 {fund_code} 经理数据失败: {e}")
             return None
         except Exception as e:
@@ -229,15 +474,21 @@ class FundAnalyzer:
         """
         获取基金经理数据（首先尝试使用 akshare，失败则通过网页抓取）
         """
-        if fund_code in self.cache.get('manager', {}):
-            self.manager_data[fund_code] = self.cache['manager'][fund_code]
-            self._log(f"使用缓存的基金 {fund_code} 经理数据")
-            return True
+        manager_data = self._cached('manager', fund_code, self._fetch_manager_data)
+        if manager_data is None:
+            self.manager_data[fund_code] = {'name': 'N/A', 'tenure_years': np.nan, 'cumulative_return': np.nan}
+            return False
+        self.manager_data[fund_code] = manager_data
+        return True
 
+    def _fetch_manager_data(self, fund_code: str):
+        """获取基金经理数据，失败时返回 None"""
         self._log(f"正在获取基金 {fund_code} 的基金经理数据...")
         try:
+            ak = self._akshare()
             # 修复：akshare接口已变更为fund_manager_em
-            manager_info = ak.fund_manager_em(symbol=fund_code)
+            with self._source_slot('manager'):
+                manager_info = ak.fund_manager_em(symbol=fund_code)
             if not manager_info.empty:
                 latest_manager = manager_info.sort_values(by='上任日期', ascending=False).iloc[0]
                 name = latest_manager.get('姓名', 'N/A')
@@ -245,31 +496,22 @@ class FundAnalyzer:
                 cumulative_return = latest_manager.get('任职回报', '0%')
                 cumulative_return = float(str(cumulative_return).replace('%', '')) if isinstance(cumulative_return, str) else float(cumulative_return)
                 
-                self.manager_data[fund_code] = {
+                result = {
                     'name': name,
                     'tenure_years': float(tenure_days) / 365.0 if pd.notna(tenure_days) else np.nan,
                     'cumulative_return': cumulative_return
                 }
-                if self.cache_data:
-                    self.cache.setdefault('manager', {})[fund_code] = self.manager_data[fund_code]
-                    self._save_cache()
-                self._log(f"基金 {fund_code} 经理数据已通过akshare获取：{self.manager_data[fund_code]}")
-                return True
+                self._log(f"基金 {fund_code} 经理数据已通过akshare获取：{result}")
+                return result
         except Exception as e:
             self._log(f"使用akshare获取基金 {fund_code} 经理数据失败: {e}")
 
         # 如果akshare失败，尝试网页抓取
         scraped_data = self._scrape_manager_data_from_web(fund_code)
         if scraped_data:
-            self.manager_data[fund_code] = scraped_data
-            self._log(f"基金 {fund_code} 经理数据已通过网页抓取获取：{self.manager_data[fund_code]}")
-            if self.cache_data:
-                self.cache.setdefault('manager', {})[fund_code] = self.manager_data[fund_code]
-                self._save_cache()
-            return True
-        else:
-            self.manager_data[fund_code] = {'name': 'N/A', 'tenure_years': np.nan, 'cumulative_return': np.nan}
-            return False
+            self._log(f"基金 {fund_code} 经理数据已通过网页抓取获取：{scraped_data}")
+            return scraped_data
+        return None
 
     def get_market_sentiment(self):
         """获取市场情绪（仅调用一次，基于上证指数）"""
@@ -278,6 +520,7 @@ class FundAnalyzer:
             return True
         self._log("正在获取市场情绪数据...")
         try:
+            ak = self._akshare()
             index_data = ak.stock_zh_index_daily_em(symbol="sh000001")
             index_data['date'] = pd.to_datetime(index_data['date'])
             last_week_data = index_data.iloc[-7:]
@@ -303,80 +546,87 @@ class FundAnalyzer:
         """
         新增方法：抓取基金的股票持仓数据。
         """
-        if fund_code in self.cache.get('holdings', {}):
-            self.holdings_data[fund_code] = self.cache['holdings'][fund_code]
-            self._log(f"使用缓存的基金 {fund_code} 持仓数据")
-            return True
+        holdings = self._cached('holdings', fund_code, self._fetch_holdings_data)
+        if holdings is None:
+            self.holdings_data[fund_code] = []
+            return False
+        self.holdings_data[fund_code] = holdings
+        return True
 
+    def _fetch_holdings_data(self, fund_code: str):
+        """获取持仓数据（akshare 优先，失败则网页抓取），失败时返回 None"""
         self._log(f"正在获取基金 {fund_code} 的持仓数据...")
         
         # 优先使用 akshare 接口
         try:
-            holdings_df = ak.fund_portfolio_hold_em(symbol=fund_code)
+            ak = self._akshare()
+            with self._source_slot('holdings'):
+                holdings_df = ak.fund_portfolio_hold_em(symbol=fund_code)
             if not holdings_df.empty:
-                self.holdings_data[fund_code] = holdings_df.to_dict('records')
                 self._log(f"基金 {fund_code} 持仓数据已通过akshare获取。")
-                if self.cache_data:
-                    self.cache.setdefault('holdings', {})[fund_code] = self.holdings_data[fund_code]
-                    self._save_cache()
-                return True
+                return holdings_df.to_dict('records')
         except Exception as e:
             self._log(f"通过akshare获取基金 {fund_code} 持仓数据失败: {e}")
 
         # 如果 akshare 失败，尝试网页抓取
-        holdings_url = f"http://fundf10.eastmoney.com/ccmx_{fund_code}.html"
+        holdings_url = f"{F10_BASE_URL}/ccmx_{fund_code}.html"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
         try:
-            response = requests.get(holdings_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 修复：使用更稳健的 find_next 方法，并精确匹配h4标签
-            holdings_header = soup.find('h4', string=lambda t: t and '股票投资明细' in t)
-            if not holdings_header:
-                raise ValueError("未找到持仓表格标题。")
-            
-            holdings_table = holdings_header.find_next('table')
-            if not holdings_table:
+            holdings = self._web_get(holdings_url, headers, self._parse_holdings_html)
+            if holdings is None:
+                # 持仓表格由 JS 渲染、静态页面中没有时，才启动浏览器获取渲染后的页面
+                self._log(f"基金 {fund_code} 持仓页面需要渲染，改用浏览器抓取...")
+                holdings = self._rendered_get(holdings_url, '#cctable table', self._parse_holdings_html)
+            if holdings is None:
                 raise ValueError("未找到持仓表格。")
-            
-            rows = holdings_table.find_all('tr')[1:] # 跳过表头
-            
-            holdings = []
-            for row in rows:
-                cols = row.find_all('td')
-                if len(cols) >= 5: # 确保列数正确
-                    holdings.append({
-                        '股票代码': cols[1].text.strip(),
-                        '股票名称': cols[2].text.strip(),
-                        '占净值比例': float(cols[4].text.strip().replace('%', '')),
-                        '持仓市值（万元）': float(cols[6].text.strip().replace(',', '')),
-                    })
-            self.holdings_data[fund_code] = holdings
             self._log(f"基金 {fund_code} 持仓数据已通过网页抓取获取。")
-            if self.cache_data:
-                self.cache.setdefault('holdings', {})[fund_code] = self.holdings_data[fund_code]
-                self._save_cache()
-            return True
+            return holdings
         except Exception as e:
             self._log(f"获取基金 {fund_code} 持仓数据失败: {e}")
-            self.holdings_data[fund_code] = []
-            return False
+            return None
             
+    def _parse_holdings_html(self, html):
+        """从持仓明细页面解析股票持仓，页面中没有持仓表格时返回 None"""
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # 修复：使用更稳健的 find_next 方法，并精确匹配h4标签
+        holdings_header = soup.find('h4', string=lambda t: t and '股票投资明细' in t)
+        if not holdings_header:
+            return None
+
+        holdings_table = holdings_header.find_next('table')
+        if not holdings_table:
+            return None
+
+        rows = holdings_table.find_all('tr')[1:] # 跳过表头
+
+        holdings = []
+        for row in rows:
+            cols = row.find_all('td')
+            if len(cols) >= 5: # 确保列数正确
+                holdings.append({
+                    '股票代码': cols[1].text.strip(),
+                    '股票名称': cols[2].text.strip(),
+                    '占净值比例': float(cols[4].text.strip().replace('%', '')),
+                    '持仓市值（万元）': float(cols[6].text.strip().replace(',', '')),
+                })
+        return holdings
+
     def _evaluate_fund(self, fund_code, fund_name, fund_type):
         """
-        评估单个基金的综合分数。
+        评估单个基金的综合分数，返回该基金的报告记录。
+        可在多个线程中并发调用：只读取共享的市场情绪，不修改 report_data。
         """
         self._log(f"--- 正在分析基金 {fund_code} ---")
         
         # 尝试获取基本信息，如果失败则跳过整个分析
         if not self._get_fund_data(fund_code):
             self._log(f"基金 {fund_code} 基本信息获取失败，跳过分析。")
-            self.report_data.append({'fund_code': fund_code, 'fund_name': fund_name, 'decision': 'Skip', 'score': np.nan})
-            return
+            return {'fund_code': fund_code, 'fund_name': fund_name, 'decision': 'Skip', 'score': np.nan}
             
         # 获取基金经理数据
         self.get_fund_manager_data(fund_code)
@@ -444,60 +694,82 @@ class FundAnalyzer:
         # 决策逻辑
         decision = '推荐' if total_score > 30 else '观望'
         
-        self.report_data.append({
+        self._log(f"评分详情: {scores}")
+        self._log(f"基金 {fund_code} 评估完成，总分: {total_score}，决策: {decision}")
+        return {
             'fund_code': fund_code,
             'fund_name': fund_name,
             'decision': decision,
             'score': total_score,
             'scores_details': scores,
             'values_details': values
-        })
-        self._log(f"评分详情: {scores}")
-        self._log(f"基金 {fund_code} 评估完成，总分: {total_score}，决策: {decision}")
+        }
 
     def _save_report_to_markdown(self):
-        """将分析报告保存为 Markdown 文件"""
-        if not self.report_data:
+        """将分析报告保存为 Markdown 文件；分片运行时只写出本分片的评分和净值更新"""
+        if self.shard is not None:
+            self.shard.write_json(SHARD_SCORES_FILE, [dict(item, position=self._positions[item['fund_code']]) for item in self.report_data])
+            self.shard.finish([item['fund_code'] for item in self.report_data], self.nav_repository)
             return
-        
-        report_path = "analysis_report.md"
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write("--- 批量基金分析报告 ---\n\n")
-            f.write(f"生成日期: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write("--- 汇总结果 ---\n\n")
-            
-            results_df = pd.DataFrame(self.report_data)
-            valid_results = results_df[results_df['decision'] != 'Skip']
-            
-            if not valid_results.empty:
-                f.write("### 推荐基金\n\n")
-                recommended = valid_results[valid_results['decision'] == '推荐'].sort_values(by='score', ascending=False)
-                if not recommended.empty:
-                    f.write(recommended[['fund_code', 'fund_name', 'score']].to_markdown(index=False) + "\n\n")
-                else:
-                    f.write("无\n\n")
-                    
-                f.write("### 观望基金\n\n")
-                watchlist = valid_results[valid_results['decision'] == '观望'].sort_values(by='score', ascending=False)
-                if not watchlist.empty:
-                    f.write(watchlist[['fund_code', 'fund_name', 'score']].to_markdown(index=False) + "\n\n")
-                else:
-                    f.write("无\n\n")
-            
-            f.write("--- 详细分析 ---\n\n")
-            for item in self.report_data:
-                f.write(f"### 基金 {item['fund_code']} - {item.get('fund_name', 'N/A')}\n")
-                f.write(f"- 最终决策: **{item['decision']}**\n")
-                f.write(f"- 综合分数: **{item['score']:.2f}**\n")
-                
-                if item['decision'] != 'Skip':
-                    f.write("- **评分细项**:\n")
-                    for k, v in item.get('scores_details', {}).items():
-                        f.write(f"  - {k}: {v}\n")
-                    f.write("- **数据值**:\n")
-                    for k, v in item.get('values_details', {}).items():
-                        f.write(f"  - {k}: {v}\n")
-                f.write("\n---\n\n")
+        write_analysis_report(self.report_data)
+
+    def _timed_evaluate(self, fund_code, fund_name, fund_type):
+        """评估单个基金并记录耗时，用于每只基金的延迟分布"""
+        started = time.perf_counter()
+        try:
+            return self._evaluate_fund(fund_code, fund_name, fund_type)
+        finally:
+            get_metrics().observe('evaluate_latency_seconds', time.perf_counter() - started)
+
+    def _evaluate_funds(self, fund_codes: list, fund_info: dict) -> list:
+        """
+        用线程池并发评估多只基金，并定期输出进度。
+        返回的记录顺序与 fund_codes 一致，与完成先后无关。
+        """
+        total = len(fund_codes)
+        results = [None] * total
+        if total == 0:
+            return results
+        report_every = max(1, total // 20)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fund') as executor:
+            futures = {
+                executor.submit(self._timed_evaluate, code, fund_info.get(code, 'N/A'), '混合型'): i  # 假设类型
+                for i, code in enumerate(fund_codes)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    self._log(f"基金 {fund_codes[i]} 分析出错: {e}", 'error')
+                    results[i] = {'fund_code': fund_codes[i], 'fund_name': fund_info.get(fund_codes[i], 'N/A'), 'decision': 'Skip', 'score': np.nan}
+                # 跳过的基金不记入检查点，续跑时重试
+                if self.checkpoint is not None and results[i]['decision'] != 'Skip':
+                    self.checkpoint.record(fund_codes[i], results[i])
+                if done % report_every == 0 or done == total:
+                    elapsed = time.monotonic() - started
+                    remaining = elapsed / done * (total - done)
+                    self._log(f"分析进度: {done}/{total} ({done / total:.0%})，已用时 {elapsed:.0f} 秒，预计剩余 {remaining:.0f} 秒")
+        return results
+
+    def _open_checkpoint(self, fund_codes):
+        """
+        打开本次运行的检查点，返回可以直接沿用的评分记录 {基金代码: 记录}。
+        运行窗口为当天日期、市场情绪、基金列表和无风险利率，任何一项变化都从头开始。
+        """
+        window = {
+            'date': datetime.now().date().isoformat(),
+            'market_trend': self.market_data.get('trend'),
+            'funds': fingerprint(fund_codes),
+            'risk_free_rate': self.risk_free_rate,
+        }
+        self.checkpoint = Checkpoint(checkpoint_path('fund_analyzer', self.shard), window, resume=self.resume)
+        wanted = set(fund_codes)
+        resumed = {code: record for code, record in self.checkpoint.results.items() if code in wanted}
+        if resumed:
+            self._log(f"断点续跑：{len(resumed)} 个基金已在本运行窗口内完成评估，跳过")
+        return resumed
 
     def run_analysis(self, fund_codes: list, fund_info: dict):
         """
@@ -507,9 +779,31 @@ class FundAnalyzer:
         
         # 仅调用一次获取市场情绪
         self.get_market_sentiment()
+
+        # 与 MarketMonitor 共用本地净值，只补齐尾部
+        fund_codes = list(fund_codes)
+        if self.shard is not None:
+            self._positions = {code: i for i, code in enumerate(fund_codes)}
+            fund_codes = self.shard.select(fund_codes)
+            self.shard.prepare()
+            self.shard.redirect(self.nav_repository)
+        resumed = self._open_checkpoint(fund_codes)
+        pending = [code for code in fund_codes if code not in resumed]
+        metrics = get_metrics()
+        self._sync_nav(pending)
+        with metrics.stage('indicators'):
+            self._compute_nav_metrics(pending)
         
-        for code in fund_codes:
-            self._evaluate_fund(code, fund_info.get(code, 'N/A'), '混合型') # 假设类型
+        # 多线程并发评估，各数据源分别限流；结果按输入顺序排列（检查点中已完成的基金沿用上次的记录）
+        with metrics.stage('evaluate'):
+            evaluated = iter(self._evaluate_funds(pending, fund_info))
+            self.report_data.extend(resumed[code] if code in resumed else next(evaluated) for code in fund_codes)
+        self.checkpoint.close()
+        self._wait_for_refreshes()
+        self.nav_repository.save_index()
+        if self._selenium_fetcher is not None:
+            self._selenium_fetcher.close()
+            self._selenium_fetcher = None
         
         # 生成并保存最终报告
         results_df = pd.DataFrame(self.report_data)
@@ -519,35 +813,103 @@ class FundAnalyzer:
         else:
             self._log("\n没有基金获得有效评分。")
         
-        self._save_report_to_markdown()
+        with metrics.stage('report'):
+            self._save_report_to_markdown()
         
         return results_df
 
-if __name__ == '__main__':
-    # 请确保已安装所有库，特别是 Selenium 和 ChromeDriver
-    # pip install selenium akshare pandas numpy requests beautifulsoup4 lxml
-    # 还需要手动下载与您的 Chrome 版本匹配的 ChromeDriver 并配置环境变量或修改路径
-    
-    funds_list_url = 'https://raw.githubusercontent.com/qjlxg/rep/main/recommended_cn_funds.csv'
+def write_analysis_report(report_data, report_path=ANALYSIS_REPORT_FILE):
+    """将评分记录（按基金列表顺序）保存为 Markdown 报告"""
+    if not report_data:
+        return
     
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("--- 批量基金分析报告 ---\n\n")
+        f.write(f"生成日期: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write("--- 汇总结果 ---\n\n")
+        
+        results_df = pd.DataFrame(report_data)
+        valid_results = results_df[results_df['decision'] != 'Skip']
+        
+        if not valid_results.empty:
+            f.write("### 推荐基金\n\n")
+            recommended = valid_results[valid_results['decision'] == '推荐'].sort_values(by='score', ascending=False)
+            if not recommended.empty:
+                f.write(recommended[['fund_code', 'fund_name', 'score']].to_markdown(index=False) + "\n\n")
+            else:
+                f.write("无\n\n")
+                
+            f.write("### 观望基金\n\n")
+            watchlist = valid_results[valid_results['decision'] == '观望'].sort_values(by='score', ascending=False)
+            if not watchlist.empty:
+                f.write(watchlist[['fund_code', 'fund_name', 'score']].to_markdown(index=False) + "\n\n")
+            else:
+                f.write("无\n\n")
+        
+        f.write("--- 详细分析 ---\n\n")
+        for item in report_data:
+            f.write(f"### 基金 {item['fund_code']} - {item.get('fund_name', 'N/A')}\n")
+            f.write(f"- 最终决策: **{item['decision']}**\n")
+            f.write(f"- 综合分数: **{item['score']:.2f}**\n")
+            
+            if item['decision'] != 'Skip':
+                f.write("- **评分细项**:\n")
+                for k, v in item.get('scores_details', {}).items():
+                    f.write(f"  - {k}: {v}\n")
+                f.write("- **数据值**:\n")
+                for k, v in item.get('values_details', {}).items():
+                    f.write(f"  - {k}: {v}\n")
+            f.write("\n---\n\n")
+
+
+def merge_shards(base_dir=SHARD_DIR, report_path=ANALYSIS_REPORT_FILE, nav_repository=None):
+    """合并 analyze --shard 各分片的评分和净值更新，按完整基金列表的顺序生成 analysis_report.md"""
+    shards = load_shards('analyze', base_dir)
+    if nav_repository is None:
+        from nav_repository import NavRepository
+        nav_repository = NavRepository()
+    metrics = get_metrics()
+    with metrics.stage('merge'):
+        merge_repository(shards, nav_repository)
+        records = sorted((record for shard, _ in shards for record in shard.read_json(SHARD_SCORES_FILE)),
+                         key=lambda record: record['position'])
+        for record in records:
+            del record['position']
+    with metrics.stage('report'):
+        write_analysis_report(records, report_path)
+    logger.info(f"已合并 {len(shards)} 个分片共 {len(records)} 只基金的评分: {report_path}")
+    return records
+
+
+def load_fund_list(funds_list_url=FUNDS_LIST_URL):
+    """从 CSV 导入基金代码列表，返回 (基金代码列表, {代码: 名称})；失败时返回空列表"""
     try:
         logger.info("正在从 CSV 导入基金代码列表...")
         df_funds = pd.read_csv(funds_list_url, encoding='gb18030')
         
         # 修正列名引用
-        fund_codes_to_analyze = [str(code).zfill(6) for code in df_funds['代码'].unique().tolist()]
-        fund_info_dict = dict(zip(fund_codes_to_analyze, df_funds['名称'].tolist()))
+        fund_codes = [str(code).zfill(6) for code in df_funds['代码'].unique().tolist()]
+        fund_info = dict(zip(fund_codes, df_funds['名称'].tolist()))
         
-        logger.info(f"导入成功，共 {len(fund_codes_to_analyze)} 个基金代码")
+        logger.info(f"导入成功，共 {len(fund_codes)} 个基金代码")
+        return fund_codes, fund_info
     except Exception as e:
         logger.error(f"导入基金列表失败: {e}")
-        fund_codes_to_analyze = []
-        fund_info_dict = {}
+        return [], {}
+
+
+if __name__ == '__main__':
+    # 请确保已安装所有库，特别是 Selenium 和 ChromeDriver
+    # pip install selenium akshare pandas numpy requests beautifulsoup4 lxml
+    # 还需要手动下载与您的 Chrome 版本匹配的 ChromeDriver 并配置环境变量或修改路径
+    setup_logging()
+    fund_codes_to_analyze, fund_info_dict = load_fund_list()
     
     if fund_codes_to_analyze:
         test_fund_codes = fund_codes_to_analyze[:1500] # 减少测试基金数量，避免频繁网络请求
         logger.info(f"分析前 {len(test_fund_codes)} 个基金：{test_fund_codes}...")
         analyzer = FundAnalyzer()
         analyzer.run_analysis(test_fund_codes, fund_info_dict)
+        get_metrics().write_summary(RUN_SUMMARY_FILE, job='fund_analyzer')
     else:
         logger.info("没有基金列表可供分析，程序结束。")
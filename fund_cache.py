@@ -0,0 +1,178 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from trading_calendar import TradingCalendar, NAV_PUBLISH_TIME
+
+logger = logging.getLogger(__name__)
+
+# 缓存写入累计多少条后提交一次事务
+DEFAULT_BATCH_SIZE = 50
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# 旧版 JSON 缓存没有更新时间，导入后视为已过期
+LEGACY_UPDATED_AT = '1970-01-01 00:00:00'
+
+# 基金经理数据的有效期
+MANAGER_TTL = timedelta(days=7)
+# 持仓披露日（月, 日）：季报在季度结束后 15 个工作日内披露，另有中报（8月底）和年报（3月底）
+HOLDINGS_DISCLOSURE_DATES = ((1, 22), (3, 31), (4, 22), (7, 22), (8, 31), (10, 22))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+def _json_default(obj):
+    # akshare 返回的 numpy 标量等
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+
+class CachePolicy:
+    """
+    各命名空间的过期规则：
+    - fund：净值衍生指标，最近一个交易日的净值公布后过期；
+    - holdings：持仓，每个定期报告披露日之后过期；
+    - manager：基金经理，MANAGER_TTL 后过期。
+    其他命名空间不过期。
+    """
+
+    def __init__(self, calendar=None):
+        self.calendar = calendar
+
+    def _last_disclosure(self, now):
+        candidates = [datetime(year, month, day) for year in (now.year - 1, now.year) for month, day in HOLDINGS_DISCLOSURE_DATES]
+        return max(d for d in candidates if d <= now)
+
+    def is_expired(self, namespace, updated_at, now=None):
+        now = now or datetime.now()
+        if namespace == 'fund':
+            if self.calendar is None:
+                self.calendar = TradingCalendar.from_index_file()
+            return updated_at < datetime.combine(self.calendar.expected_latest_date(now), NAV_PUBLISH_TIME)
+        if namespace == 'holdings':
+            return updated_at < self._last_disclosure(now)
+        if namespace == 'manager':
+            return now - updated_at >= MANAGER_TTL
+        return False
+
+
+class FundCache:
+    """
+    基于 SQLite 的键值缓存，按 (namespace, key) 单条更新，并记录更新时间供 CachePolicy 判断是否过期。
+    写入先放入内存缓冲，累计 batch_size 条后在一个事务里提交，事务保证写入原子性；
+    读取按需查询，启动时不加载整个缓存。多线程共享一个连接，由锁串行化。
+    """
+
+    def __init__(self, path='fund_cache.db', batch_size=DEFAULT_BATCH_SIZE, legacy_json=None, policy=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.policy = policy or CachePolicy()
+        self._lock = threading.RLock()
+        self._pending = {}
+        is_new = not os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        if is_new and legacy_json and os.path.exists(legacy_json):
+            self.import_json(legacy_json)
+
+    def import_json(self, json_path):
+        """导入旧版 fund_cache.json（{namespace: {key: value}}）"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.warning("旧缓存文件 %s 读取失败，跳过导入: %s", json_path, e)
+            return 0
+        count = 0
+        for namespace, entries in legacy.items():
+            if not isinstance(entries, dict):
+                continue
+            for key, value in entries.items():
+                self.put(namespace, key, value, updated_at=LEGACY_UPDATED_AT)
+                count += 1
+        self.flush()
+        logger.info("已从 %s 导入 %d 条缓存记录", json_path, count)
+        return count
+
+    def get_entry(self, namespace, key):
+        """返回 (value, updated_at)，不存在时返回 None"""
+        with self._lock:
+            if (namespace, key) in self._pending:
+                value, updated_at = self._pending[(namespace, key)]
+                return value, datetime.strptime(updated_at, TIME_FORMAT)
+            row = self._conn.execute(
+                "SELECT value, updated_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), datetime.strptime(row[1], TIME_FORMAT)
+
+    def get(self, namespace, key, default=None):
+        entry = self.get_entry(namespace, key)
+        return default if entry is None else entry[0]
+
+    def lookup(self, namespace, key, now=None):
+        """返回 (value, 是否已过期)，不存在时返回 None"""
+        entry = self.get_entry(namespace, key)
+        if entry is None:
+            return None
+        value, updated_at = entry
+        return value, self.policy.is_expired(namespace, updated_at, now)
+
+    def put(self, namespace, key, value, updated_at=None):
+        with self._lock:
+            self._pending[(namespace, key)] = (value, updated_at or datetime.now().strftime(TIME_FORMAT))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def invalidate(self, namespace, key=None):
+        """删除某条缓存；key 为空时清空整个命名空间"""
+        with self._lock:
+            if key is None:
+                for pending_key in [k for k in self._pending if k[0] == namespace]:
+                    del self._pending[pending_key]
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+            else:
+                self._pending.pop((namespace, key), None)
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def keys(self, namespace):
+        with self._lock:
+            self.flush()
+            return [row[0] for row in self._conn.execute("SELECT key FROM cache WHERE namespace = ?", (namespace,))]
+
+    def flush(self):
+        """在一个事务里提交缓冲中的全部写入"""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [
+                (namespace, key, json.dumps(value, ensure_ascii=False, default=_json_default), updated_at)
+                for (namespace, key), (value, updated_at) in self._pending.items()
+            ]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO cache (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                    rows
+                )
+            self._pending.clear()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
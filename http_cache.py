@@ -0,0 +1,276 @@
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit, parse_qsl
+from run_metrics import get_metrics
+from trading_calendar import NAV_PUBLISH_TIME
+
+logger = logging.getLogger(__name__)
+
+# 缓存模式：
+# - normal：未过期的缓存直接使用，否则访问网络并写入缓存；
+# - record：总是访问网络，并用响应刷新缓存（为离线重放准备数据）；
+# - replay：只从缓存读取（忽略过期时间），缓存中没有时抛出 HttpCacheMiss，不访问网络；
+# - off：不读也不写缓存。
+MODES = ('normal', 'record', 'replay', 'off')
+HTTP_CACHE_MODE = os.getenv('HTTP_CACHE_MODE', 'normal')
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', 'http_cache')
+HTTP_CACHE_MAX_BYTES = int(float(os.getenv('HTTP_CACHE_MAX_MB', 256)) * 1024 * 1024)
+# 各接口的有效期（秒）；lsjz 按页码分页的结果每个交易日都会整体后移，只能短期复用（且不跨净值公布时间）
+ENDPOINT_TTL = {
+    'lsjz': int(os.getenv('HTTP_CACHE_LSJZ_TTL', 3600)),
+    'jjjl': 7 * 24 * 3600,  # 基金经理页，与 FundCache 的 MANAGER_TTL 一致
+    'ccmx': 24 * 3600,  # 持仓明细页
+}
+DEFAULT_TTL = 24 * 3600
+# edate 早于抓取日期超过 LSJZ_SETTLE_DAYS 天的 lsjz 历史区间基本不再变化，按 LSJZ_RANGE_TTL 长期缓存；
+# 仍保留有效期，滞后公布（QDII）或事后修正的净值最终还能被重新抓取到
+LSJZ_SETTLE_DAYS = int(os.getenv('HTTP_CACHE_LSJZ_SETTLE_DAYS', 7))
+LSJZ_RANGE_TTL = int(os.getenv('HTTP_CACHE_LSJZ_RANGE_TTL', 30 * 24 * 3600))
+# 访问时间累计多少条后写回索引
+TOUCH_BATCH_SIZE = 50
+# 超出容量时淘汰到容量的该比例以下，避免每次写入都触发淘汰
+EVICT_TARGET = 0.9
+
+_PAGE_RE = re.compile(r'/(jjjl|ccmx)_\d+\.html$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+class HttpCacheMiss(LookupError):
+    """重放模式下请求的页面不在缓存中"""
+
+
+def canonical_url(url, params=None):
+    """请求的规范化 URL：查询参数（含 params）按名称排序，作为缓存键"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend((str(k), str(v)) for k, v in params.items() if v is not None)
+    base = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    return base + '?' + urlencode(sorted(query)) if query else base
+
+
+def endpoint_of(url):
+    """按 URL 识别接口：lsjz 等 F10DataApi 类型、jjjl / ccmx 页面，其他返回 'other'"""
+    parts = urlsplit(url)
+    if parts.path.endswith('/F10DataApi.aspx'):
+        return dict(parse_qsl(parts.query)).get('type', 'other')
+    match = _PAGE_RE.search(parts.path)
+    return match.group(1) if match else 'other'
+
+
+def _next_publish(fetched_at):
+    """抓取之后下一次净值公布的时间戳"""
+    fetched = datetime.fromtimestamp(fetched_at)
+    publish = datetime.combine(fetched.date(), NAV_PUBLISH_TIME)
+    if publish <= fetched:
+        publish += timedelta(days=1)
+    return publish.timestamp()
+
+
+def expires_at(url, fetched_at):
+    """
+    页面的过期时间（时间戳）。
+    lsjz 页面：edate 早于抓取日期 LSJZ_SETTLE_DAYS 天以上的历史区间缓存 LSJZ_RANGE_TTL，
+    其他页面最迟在下一次净值公布时过期。
+    """
+    endpoint = endpoint_of(url)
+    expires = fetched_at + ENDPOINT_TTL.get(endpoint, DEFAULT_TTL)
+    if endpoint == 'lsjz':
+        edate = dict(parse_qsl(urlsplit(url).query)).get('edate')
+        settled = datetime.fromtimestamp(fetched_at).date() - timedelta(days=LSJZ_SETTLE_DAYS)
+        if edate and edate < settled.isoformat():
+            return fetched_at + LSJZ_RANGE_TTL
+        expires = min(expires, _next_publish(fetched_at))
+    return expires
+
+
+class HttpCache:
+    """
+    HTTP 响应的磁盘缓存，以规范化 URL 为键。响应体按内容的 SHA-256 存放在 objects/ 下（zlib 压缩），
+    内容相同的页面只保存一份；SQLite 索引记录每个 URL 对应的内容、抓取时间、过期时间和最近访问时间。
+    总大小超过 max_bytes 时按最近访问时间淘汰（LRU）。多线程共享一个连接，由锁串行化。
+    """
+
+    def __init__(self, path=HTTP_CACHE_DIR, mode=HTTP_CACHE_MODE, max_bytes=HTTP_CACHE_MAX_BYTES):
+        if mode not in MODES:
+            raise ValueError(f"未知的缓存模式: {mode}")
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._touched = {}
+        self._conn = None
+        if mode != 'off':
+            os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.path, 'index.db'), check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(_SCHEMA)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self._conn.commit()
+            self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @property
+    def replay(self):
+        return self.mode == 'replay'
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest)
+
+    def get(self, url, params=None):
+        """
+        返回缓存的响应文本；没有可用缓存时返回 None，调用方应访问网络后调用 put。
+        重放模式下忽略过期时间，缓存中没有时抛出 HttpCacheMiss。
+        """
+        if self.mode in ('off', 'record'):
+            return None
+        key = canonical_url(url, params)
+        endpoint = endpoint_of(key)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT digest, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        text = None
+        if row is not None and (self.replay or row[1] > now):
+            try:
+                with open(self._object_path(row[0]), 'rb') as f:
+                    text = zlib.decompress(f.read()).decode('utf-8')
+            except (OSError, zlib.error) as e:
+                logger.warning("缓存文件损坏或已删除，忽略: %s (%s)", key, e)
+        metrics = get_metrics()
+        if text is None:
+            metrics.inc('http_cache_misses', endpoint=endpoint)
+            if self.replay:
+                raise HttpCacheMiss(f"重放模式下缓存中没有: {key}")
+            return None
+        metrics.inc('http_cache_hits', endpoint=endpoint)
+        with self._lock:
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                self._flush_touched()
+        return text
+
+    def put(self, url, params, text):
+        """保存一个成功（HTTP 200）响应；重放和关闭模式下不写入"""
+        if self.mode in ('off', 'replay'):
+            return
+        key = canonical_url(url, params)
+        data = zlib.compress(text.encode('utf-8'))
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        now = time.time()
+        with self._lock:
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                tmp_path = f'{object_path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, object_path)
+            old = self._conn.execute("SELECT digest, size FROM entries WHERE key = ?", (key,)).fetchone()
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO entries (key, url, endpoint, digest, size, fetched_at, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET digest = excluded.digest, "
+                    "size = excluded.size, fetched_at = excluded.fetched_at, expires_at = excluded.expires_at, "
+                    "accessed_at = excluded.accessed_at",
+                    (key, url, endpoint_of(key), digest, len(data), now, expires_at(key, now), now)
+                )
+            self._touched.pop(key, None)
+            self._total += len(data) - (old[1] if old else 0)
+            if old and old[0] != digest:
+                self._remove_object(old[0])
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _remove_object(self, digest):
+        """没有其他 URL 引用时删除内容文件"""
+        if self._conn.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return
+        try:
+            os.remove(self._object_path(digest))
+        except OSError:
+            pass
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        with self._conn:
+            self._conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._touched.items()])
+        self._touched.clear()
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小降到容量的 EVICT_TARGET 以下"""
+        self._flush_touched()
+        target = self.max_bytes * EVICT_TARGET
+        evicted = []
+        for key, digest, size in self._conn.execute("SELECT key, digest, size FROM entries ORDER BY accessed_at"):
+            if self._total <= target:
+                break
+            evicted.append((key, digest))
+            self._total -= size
+        with self._conn:
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+        for digest in {digest for _, digest in evicted}:
+            self._remove_object(digest)
+        get_metrics().inc('http_cache_evictions', len(evicted))
+        logger.info("HTTP 缓存超过 %.0f MB，已淘汰 %d 个最久未访问的页面", self.max_bytes / 1024 / 1024, len(evicted))
+
+    def stats(self):
+        """缓存中的页面数和总大小（字节）"""
+        if self._conn is None:
+            return {'entries': 0, 'bytes': 0}
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {'entries': entries, 'bytes': self._total}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touched()
+                self._conn.close()
+                self._conn = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache():
+    """进程内共享的 HTTP 缓存（首次使用时按环境变量创建）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HttpCache()
+    return _cache
+
+
+def configure_http_cache(mode=None, path=None, max_bytes=None):
+    """替换进程内共享的 HTTP 缓存（命令行 --http-cache 等），未指定的参数使用环境变量的默认值"""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = HttpCache(path or HTTP_CACHE_DIR, mode or HTTP_CACHE_MODE,
+                           HTTP_CACHE_MAX_BYTES if max_bytes is None else max_bytes)
+        logger.info("HTTP 缓存模式: %s (%s)", _cache.mode, _cache.path)
+    return _cache
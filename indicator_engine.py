@@ -0,0 +1,164 @@
+import logging
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# 与 MarketMonitor._calculate_indicators 保持一致的参数
+MIN_ROWS = 26
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BB_WINDOW, BB_WIDTH = 20, 2
+RSI_WINDOW = 14
+MA_WINDOW = 50
+
+# 滑动窗口计算时单块最多展开的元素数，控制内存占用
+_CHUNK_ELEMENTS = 4_000_000
+
+LATEST_COLUMNS = ['net_value', 'macd', 'signal', 'bb_mid', 'bb_std', 'bb_upper', 'bb_lower', 'rsi', 'ma50', 'ma_ratio']
+
+
+def align_tail_matrix(frames, rows=None):
+    """
+    将多只基金的净值按“观测序号”右对齐为 (行 × 基金) 矩阵。
+    每列是该基金最后 rows 个净值（rows 为空时取全部历史），历史较短的基金在顶部补 NaN。
+    这样每列上的计算与逐只基金单独计算的结果完全一致。
+    返回 (fund_codes, values, dates)，dates 为同形状的 datetime64[D] 矩阵。
+    """
+    fund_codes = list(frames.keys())
+    series = []
+    for fund_code in fund_codes:
+        df = frames[fund_code]
+        if df is None or df.empty:
+            series.append((np.empty(0, dtype='datetime64[D]'), np.empty(0)))
+            continue
+        df = df.sort_values(by='date', ascending=True)
+        if rows:
+            df = df.tail(rows)
+        series.append((df['date'].values.astype('datetime64[D]'), df['net_value'].to_numpy(dtype=np.float64)))
+
+    length = max((len(v) for _, v in series), default=0)
+    values = np.full((length, len(fund_codes)), np.nan)
+    dates = np.full((length, len(fund_codes)), np.datetime64('NaT'), dtype='datetime64[D]')
+    for j, (d, v) in enumerate(series):
+        if len(v):
+            values[length - len(v):, j] = v
+            dates[length - len(v):, j] = d
+    return fund_codes, values, dates
+
+
+def ewm_mean(values, span):
+    """按列计算 adjust=False 的指数加权均值，从每列第一个有效值开始递推"""
+    alpha = 2.0 / (span + 1.0)
+    out = np.full_like(values, np.nan)
+    prev = np.full(values.shape[1], np.nan)
+    for i in range(values.shape[0]):
+        x = values[i]
+        # 尚未开始的列（前导 NaN）直接取当前值，中途缺失的值沿用上一期结果
+        prev = np.where(np.isnan(prev), x, np.where(np.isnan(x), prev, (1 - alpha) * prev + alpha * x))
+        out[i] = prev
+    return out
+
+
+def _rolling_windows(values, window, func):
+    """对每列做 min_periods=1 的滑动窗口计算，按列分块以控制内存"""
+    rows, cols = values.shape
+    out = np.full_like(values, np.nan)
+    if rows == 0 or cols == 0:
+        return out
+    padded = np.vstack([np.full((window - 1, cols), np.nan), values])
+    chunk = max(1, _CHUNK_ELEMENTS // max(1, rows * window))
+    for start in range(0, cols, chunk):
+        view = sliding_window_view(padded[:, start:start + chunk], window, axis=0)
+        out[:, start:start + chunk] = func(view)
+    return out
+
+
+def _window_mean(view):
+    valid = ~np.isnan(view)
+    count = valid.sum(axis=-1)
+    total = np.where(valid, view, 0.0).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _window_std(view):
+    valid = ~np.isnan(view)
+    count = valid.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, view, 0.0).sum(axis=-1) / count
+        dev = np.where(valid, view - mean[..., None], 0.0)
+        var = (dev * dev).sum(axis=-1) / (count - 1)
+    return np.where(count > 1, np.sqrt(var), np.nan)
+
+
+def rolling_mean(values, window):
+    return _rolling_windows(values, window, _window_mean)
+
+
+def rolling_std(values, window):
+    return _rolling_windows(values, window, _window_std)
+
+
+def compute_indicator_matrices(values, bb_window=BB_WINDOW, rsi_window=RSI_WINDOW, ma_window=MA_WINDOW):
+    """
+    对 (行 × 基金) 净值矩阵一次性计算 MACD、布林带、RSI、MA50。
+    窗口参数默认与 MarketMonitor 一致，参数扫描时可以替换。
+    返回字典，每个值都是与 values 同形状的矩阵。
+    """
+    exp_fast = ewm_mean(values, MACD_FAST)
+    exp_slow = ewm_mean(values, MACD_SLOW)
+    macd = exp_fast - exp_slow
+    signal = ewm_mean(macd, MACD_SIGNAL)
+
+    bb_mid = rolling_mean(values, bb_window)
+    bb_std = rolling_std(values, bb_window)
+
+    # 与 pandas 的 delta.where(delta > 0, 0) 一致：首个观测的涨跌记为 0，补位的 NaN 不计入窗口
+    valid = ~np.isnan(values)
+    delta = np.diff(values, axis=0, prepend=np.nan)
+    gain = np.where(valid, np.where(delta > 0, delta, 0.0), np.nan)
+    loss = np.where(valid, np.where(delta < 0, -delta, 0.0), np.nan)
+    avg_gain = rolling_mean(gain, rsi_window)
+    avg_loss = rolling_mean(loss, rsi_window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+        rsi = 100 - (100 / (1 + rs))
+
+    ma50 = rolling_mean(values, ma_window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ma_ratio = values / ma50
+
+    return {
+        'net_value': values,
+        'macd': macd,
+        'signal': signal,
+        'bb_mid': bb_mid,
+        'bb_std': bb_std,
+        'bb_upper': bb_mid + bb_std * BB_WIDTH,
+        'bb_lower': bb_mid - bb_std * BB_WIDTH,
+        'rsi': rsi,
+        'ma50': ma50,
+        'ma_ratio': ma_ratio,
+    }
+
+
+def latest_indicators(frames, rows=None):
+    """
+    批量计算所有基金最新一行的指标。
+    frames 为 {基金代码: 含 date/net_value 的 DataFrame}，rows 与逐只计算时的 tail 行数一致。
+    数据少于 MIN_ROWS 行的基金不会出现在结果中。
+    """
+    fund_codes, values, dates = align_tail_matrix(frames, rows)
+    counts = (~np.isnan(values)).sum(axis=0) if values.size else np.zeros(len(fund_codes), dtype=int)
+    keep = counts >= MIN_ROWS
+    if not keep.any():
+        return pd.DataFrame(columns=['date'] + LATEST_COLUMNS)
+
+    values, dates = values[:, keep], dates[:, keep]
+    matrices = compute_indicator_matrices(values)
+    result = pd.DataFrame({name: matrices[name][-1] for name in LATEST_COLUMNS},
+                          index=pd.Index([c for c, k in zip(fund_codes, keep) if k], name='fund_code'))
+    result.insert(0, 'date', pd.to_datetime(dates[-1]))
+    logger.info("向量化指标计算完成: %d 只基金 (跳过 %d 只数据不足的基金)", int(keep.sum()), int((~keep).sum()))
+    return result
@@ -0,0 +1,200 @@
+import os
+import json
+import logging
+from collections import deque
+import numpy as np
+import pandas as pd
+from indicator_engine import MACD_FAST, MACD_SLOW, MACD_SIGNAL, BB_WINDOW, BB_WIDTH, RSI_WINDOW, MA_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# 与 MarketMonitor 计算信号时使用的 tail 行数一致
+STATE_WINDOW = 100
+
+
+def _alpha(span):
+    return 2.0 / (span + 1.0)
+
+
+class IndicatorState:
+    """
+    单只基金的增量指标状态。
+
+    EWM 从首个观测开始逐条递推，同时用长度为 window 的环形缓冲保存最近的净值和 EWM 值。
+    由于 adjust=False 的 EWM 是线性递推，“只看最后 window 行重新计算”的结果可以由
+    递推值减去窗口起点的种子偏差得到，因此每条新数据的更新是 O(1) 的，
+    且 latest() 的结果与对 tail(window) 重新计算完全一致。
+    """
+
+    def __init__(self, window=STATE_WINDOW):
+        self.window = window
+        self.last_date = None
+        self.count = 0
+        self.values = deque(maxlen=window)
+        self.ema_fast = deque(maxlen=window)
+        self.ema_slow = deque(maxlen=window)
+        self.ema_signal = deque(maxlen=window)  # 对全程 MACD 的 EWM
+
+    def update(self, date, net_value):
+        """推进一个观测"""
+        net_value = float(net_value)
+        if self.count == 0:
+            fast = slow = net_value
+            signal = 0.0
+        else:
+            fast = (1 - _alpha(MACD_FAST)) * self.ema_fast[-1] + _alpha(MACD_FAST) * net_value
+            slow = (1 - _alpha(MACD_SLOW)) * self.ema_slow[-1] + _alpha(MACD_SLOW) * net_value
+            signal = (1 - _alpha(MACD_SIGNAL)) * self.ema_signal[-1] + _alpha(MACD_SIGNAL) * (fast - slow)
+        self.values.append(net_value)
+        self.ema_fast.append(fast)
+        self.ema_slow.append(slow)
+        self.ema_signal.append(signal)
+        self.last_date = pd.Timestamp(date).normalize()
+        self.count += 1
+
+    def update_frame(self, df):
+        """
+        用新增的行推进状态。新数据中存在不晚于 last_date 的日期（历史被改写）时不做任何更新并返回 False。
+        """
+        if df is None or df.empty:
+            return True
+        df = df.sort_values(by='date', ascending=True)
+        if self.last_date is not None and pd.Timestamp(df['date'].iloc[0]) <= self.last_date:
+            return False
+        for date, net_value in zip(df['date'], df['net_value']):
+            self.update(date, net_value)
+        return True
+
+    @classmethod
+    def from_history(cls, df, window=STATE_WINDOW):
+        """从历史数据重建状态，只需要最后 window 行"""
+        state = cls(window)
+        if df is not None and not df.empty:
+            state.update_frame(df.sort_values(by='date', ascending=True).tail(window))
+        return state
+
+    def _windowed_macd(self):
+        """把全程递推的 EWM 换算成只从窗口第一行开始计算的 MACD 和信号线"""
+        n = len(self.values) - 1
+        r_fast, r_slow, r_signal = 1 - _alpha(MACD_FAST), 1 - _alpha(MACD_SLOW), 1 - _alpha(MACD_SIGNAL)
+        x_s = self.values[0]
+        # 窗口起点处全程 EWM 相对于“以 x_s 为种子”的偏差
+        c_fast = self.ema_fast[0] - x_s
+        c_slow = self.ema_slow[0] - x_s
+        macd_s = self.ema_fast[0] - self.ema_slow[0]
+
+        macd = (self.ema_fast[-1] - r_fast ** n * c_fast) - (self.ema_slow[-1] - r_slow ** n * c_slow)
+
+        def geometric_ewm(q):
+            # 以 1 为种子对 q^k (k=0..n) 做 EWM 后的第 n 项
+            if abs(q - r_signal) < 1e-15:
+                return r_signal ** n * (1 + n * _alpha(MACD_SIGNAL))
+            return r_signal ** n + _alpha(MACD_SIGNAL) * q * (q ** n - r_signal ** n) / (q - r_signal)
+
+        signal = (self.ema_signal[-1] - r_signal ** n * (self.ema_signal[0] - macd_s)
+                  - c_fast * geometric_ewm(r_fast) + c_slow * geometric_ewm(r_slow))
+        return macd, signal
+
+    def latest(self):
+        """返回与 indicator_engine.latest_indicators 相同字段的最新指标"""
+        values = np.fromiter(self.values, dtype=np.float64)
+        net_value = values[-1]
+        macd, signal = self._windowed_macd()
+
+        bb_values = values[-BB_WINDOW:]
+        bb_mid = bb_values.mean()
+        bb_std = bb_values.std(ddof=1) if len(bb_values) > 1 else np.nan
+
+        # 窗口第一行的涨跌记为 0，与 pandas 的 delta.where(...) 行为一致
+        deltas = np.diff(values[-(RSI_WINDOW + 1):])
+        if len(values) <= RSI_WINDOW:
+            deltas = np.concatenate([[0.0], deltas])
+        avg_gain = np.where(deltas > 0, deltas, 0.0).mean()
+        avg_loss = np.where(deltas < 0, -deltas, 0.0).mean()
+        rsi = 100 - (100 / (1 + avg_gain / avg_loss)) if avg_loss != 0 else np.nan
+
+        ma50 = values[-MA_WINDOW:].mean()
+        return {
+            'date': self.last_date,
+            'net_value': net_value,
+            'macd': macd,
+            'signal': signal,
+            'bb_mid': bb_mid,
+            'bb_std': bb_std,
+            'bb_upper': bb_mid + bb_std * BB_WIDTH,
+            'bb_lower': bb_mid - bb_std * BB_WIDTH,
+            'rsi': rsi,
+            'ma50': ma50,
+            'ma_ratio': net_value / ma50,
+        }
+
+    def to_dict(self):
+        return {
+            'window': self.window,
+            'last_date': self.last_date.strftime('%Y-%m-%d') if self.last_date is not None else None,
+            'count': self.count,
+            'values': list(self.values),
+            'ema_fast': list(self.ema_fast),
+            'ema_slow': list(self.ema_slow),
+            'ema_signal': list(self.ema_signal),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data.get('window', STATE_WINDOW))
+        state.last_date = pd.Timestamp(data['last_date']) if data.get('last_date') else None
+        state.count = data.get('count', 0)
+        for name in ('values', 'ema_fast', 'ema_slow', 'ema_signal'):
+            getattr(state, name).extend(data.get(name, []))
+        return state
+
+
+class IndicatorStateCache:
+    """所有基金指标状态的持久化缓存（JSON 文件）"""
+
+    def __init__(self, path, window=STATE_WINDOW):
+        self.path = path
+        self.window = window
+        self.states = {}
+        self.save_path = None  # 分片运行时写到分片目录，由合并步骤并回 path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self.states = {code: IndicatorState.from_dict(data) for code, data in raw.items()
+                           if data.get('window', STATE_WINDOW) == self.window}
+            logger.info("已加载 %d 只基金的指标状态缓存", len(self.states))
+        except Exception as e:
+            logger.warning("指标状态缓存 %s 读取失败，将重新计算: %s", self.path, e)
+            self.states = {}
+        return self
+
+    def save(self):
+        path = self.save_path or self.path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({code: state.to_dict() for code, state in sorted(self.states.items())}, f)
+        os.replace(tmp_path, path)
+        logger.info("指标状态缓存已保存: %s (%d 只基金)", path, len(self.states))
+
+    def get(self, fund_code, latest_local_date=None):
+        """取出状态；给出 latest_local_date 时，状态日期与之不一致则视为失效"""
+        state = self.states.get(fund_code)
+        if state is None or state.count == 0:
+            return None
+        if latest_local_date is not None and state.last_date != pd.Timestamp(latest_local_date).normalize():
+            return None
+        return state
+
+    def invalidate(self, fund_code):
+        """历史数据被改写（如补齐中间缺口）后丢弃状态，下次使用时重新计算"""
+        self.states.pop(fund_code, None)
+
+    def rebuild(self, fund_code, df):
+        """根据历史数据完整重建某只基金的状态"""
+        state = IndicatorState.from_history(df, self.window)
+        self.states[fund_code] = state
+        return state
@@ -0,0 +1,233 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import timedelta
+from urllib.parse import urlsplit
+import pandas as pd
+import aiohttp
+import tenacity
+from rate_limiter import get_host, retry_wait, CircuitOpenError, THROTTLE_STATUSES
+from lsjz_parser import parse_lsjz_page, LsjzFormatError
+from run_metrics import get_metrics
+from http_cache import get_http_cache
+
+logger = logging.getLogger(__name__)
+
+# 天天基金 F10 站点地址，可指向本地替身（见 fake_eastmoney.py）
+F10_BASE_URL = os.getenv('EASTMONEY_F10_URL', 'http://fundf10.eastmoney.com').rstrip('/')
+LSJZ_URL = F10_BASE_URL + "/F10DataApi.aspx"
+
+# 每页行数、并发数和全局请求速率均可通过环境变量调整
+DEFAULT_PAGE_SIZE = int(os.getenv('LSJZ_PAGE_SIZE', 49))
+DEFAULT_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', 8))
+DEFAULT_RATE = float(os.getenv('FETCH_RATE', 5))  # 每秒请求数
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36'
+}
+
+
+def _is_retryable(error):
+    """
+    连接失败、超时、限流、5xx、熔断和无法解析的页面（多为反爬或临时错误页）可以重试；
+    其他 4xx（如 404）重试也不会成功
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in THROTTLE_STATUSES or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, LsjzFormatError))
+
+
+def _before_retry(retry_state):
+    get_metrics().record_retry('lsjz')
+    logger.info("重试基金 %s 第 %s 页，第 %d 次", retry_state.args[2], retry_state.args[3], retry_state.attempt_number)
+
+
+class LsjzFetcher:
+    """
+    基于 asyncio + aiohttp 的历史净值 (F10DataApi.aspx?type=lsjz) 抓取器。
+    所有请求共用一个 keep-alive 连接池，并遵守进程内共享的站点请求预算（令牌桶 + AIMD 自适应并发 + 熔断，
+    见 rate_limiter.HostLimiter），多只基金并发抓取，单只基金的多页也并发获取；失败按抖动指数退避重试。
+    每页先查 HTTP 缓存（见 http_cache.py），命中时不访问网络。
+    """
+
+    def __init__(self, per=DEFAULT_PAGE_SIZE, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, timeout=30, headers=None, http_cache=None):
+        self.per = per
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.headers = headers or HEADERS
+        # 按实际访问的站点（含端口）共享请求预算，指向本地替身时不与真实站点混用
+        self.host = get_host(urlsplit(LSJZ_URL).netloc, rate, concurrency)
+        self.http_cache = http_cache or get_http_cache()
+
+    @tenacity.retry(
+        stop=tenacity.stop_after_attempt(5),
+        wait=retry_wait,
+        retry=tenacity.retry_if_exception(_is_retryable),
+        before_sleep=_before_retry,
+        reraise=True
+    )
+    async def _get_page(self, session, fund_code, page_index, sdate=None, edate=None):
+        metrics = get_metrics()
+        params = {'type': 'lsjz', 'code': fund_code, 'page': page_index, 'per': self.per}
+        # 日期区间（含两端）；接口按日期降序分页，不给出时为全部历史
+        if sdate is not None:
+            params['sdate'] = sdate.isoformat()
+        if edate is not None:
+            params['edate'] = edate.isoformat()
+        # 命中缓存时不占用限速额度；重放模式下缓存中没有会抛出 HttpCacheMiss（不重试）。
+        # 缓存读写是同步的 SQLite 和文件操作，放到线程中执行，不阻塞事件循环
+        text = await asyncio.to_thread(self.http_cache.get, LSJZ_URL, params)
+        cached = text is not None
+        if not cached:
+            text = await self._download(session, params)
+        with metrics.stage('parse'):
+            df, total_pages = parse_lsjz_page(text)
+        if df is None:
+            raise LsjzFormatError(f"基金 {fund_code} 第 {page_index} 页返回内容格式不正确，可能接口变更或被限制访问")
+        # 解析成功后才写入缓存，错误页或反爬页面不会被缓存
+        if not cached:
+            await asyncio.to_thread(self.http_cache.put, LSJZ_URL, params, text)
+        return df, total_pages
+
+    async def _download(self, session, params):
+        metrics = get_metrics()
+        async with self.host.request_async() as call:
+            metrics.record_throttle('lsjz', call.throttle_wait)
+            started = time.perf_counter()
+            nbytes = 0
+            try:
+                async with session.get(LSJZ_URL, params=params) as response:
+                    call.status = response.status
+                    nbytes = len(await response.read())
+                    response.raise_for_status()
+                    text = await response.text()
+            finally:
+                metrics.record_http('lsjz', call.status, nbytes, time.perf_counter() - started)
+        return text
+
+    async def _fetch_range(self, session, fund_code, sdate=None, edate=None):
+        """
+        获取单只基金 [sdate, edate] 区间内的全部净值（为空表示不限），按日期升序返回。
+        拿到第一页的总页数后并发获取剩余页；任一页失败（重试用尽）时取消其余页并抛出异常，
+        不返回中间缺页的结果。
+        """
+        df_page, total_pages = await self._get_page(session, fund_code, 1, sdate, edate)
+        frames = [df_page]
+        if total_pages > 1:
+            tasks = [asyncio.ensure_future(self._get_page(session, fund_code, p, sdate, edate)) for p in range(2, total_pages + 1)]
+            try:
+                pages = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            frames.extend(df for df, _ in pages)
+        logger.debug("基金 %s 区间 %s ~ %s 共 %d 页", fund_code, sdate or '最早', edate or '最新', total_pages)
+        result = pd.concat(frames, ignore_index=True)
+        result = result.drop_duplicates(subset=['date'], keep='first').sort_values(by='date', ascending=True).reset_index(drop=True)
+        return result[['date', 'net_value']]
+
+    async def _fetch_history(self, session, fund_code, latest_local_date=None):
+        """
+        获取单只基金 latest_local_date 之后的全部净值；latest_local_date 为空时获取全部历史。
+        增量更新按起始日期 (sdate) 请求，只返回本地缺少的尾部，不必逐页向前翻找。
+        """
+        sdate = latest_local_date + timedelta(days=1) if latest_local_date is not None else None
+        result = await self._fetch_range(session, fund_code, sdate)
+        if latest_local_date is not None and not result.empty:
+            result = result[result['date'].dt.date > latest_local_date].reset_index(drop=True)
+        logger.debug("基金 %s 获取到 %d 行新数据", fund_code, len(result))
+        return result
+
+    def _session(self):
+        """创建共用 keep-alive 连接池的会话；连接数按自适应并发的上限设置，实际并发由站点预算控制"""
+        connector = aiohttp.TCPConnector(limit=self.host.max_concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        return aiohttp.ClientSession(headers=self.headers, timeout=timeout, connector=connector)
+
+    async def _fetch_into(self, targets, sink, blocking_sink=False):
+        """
+        并发获取多只基金，每只基金完成后立即调用 sink(基金代码, DataFrame 或 Exception)。
+        同时处理的基金数不超过站点的最大并发，sink 阻塞（如有界队列已满）时会暂停新的抓取，
+        因此内存中待处理的结果数量有上限。blocking_sink 为 True 时 sink 在线程中调用，不阻塞事件循环。
+        """
+        fund_slots = asyncio.Semaphore(self.host.max_concurrency)
+        async with self._session() as session:
+            async def fetch_one(fund_code):
+                async with fund_slots:
+                    started = time.perf_counter()
+                    try:
+                        result = await self._fetch_history(session, fund_code, targets[fund_code])
+                    except Exception as e:
+                        result = e
+                    get_metrics().observe('fetch_latency_seconds', time.perf_counter() - started)
+                    if blocking_sink:
+                        await asyncio.to_thread(sink, fund_code, result)
+                    else:
+                        sink(fund_code, result)
+
+            await asyncio.gather(*(fetch_one(code) for code in targets))
+
+    async def _fetch_many(self, targets):
+        results = {}
+        await self._fetch_into(targets, results.__setitem__)
+        return {code: results[code] for code in targets}
+
+    async def _fetch_ranges(self, ranges):
+        jobs = [(fund_code, sdate, edate) for fund_code, fund_ranges in ranges.items() for sdate, edate in fund_ranges]
+        range_slots = asyncio.Semaphore(self.host.max_concurrency)
+        async with self._session() as session:
+            async def fetch_one(fund_code, sdate, edate):
+                async with range_slots:
+                    return await self._fetch_range(session, fund_code, sdate, edate)
+
+            fetched = await asyncio.gather(*(fetch_one(*job) for job in jobs), return_exceptions=True)
+        parts = {fund_code: [] for fund_code in ranges}
+        for (fund_code, _, _), result in zip(jobs, fetched):
+            parts[fund_code].append(result)
+        results = {}
+        for fund_code, frames in parts.items():
+            errors = [frame for frame in frames if isinstance(frame, Exception)]
+            if errors:
+                results[fund_code] = errors[0]
+                continue
+            merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['date', 'net_value'])
+            results[fund_code] = merged.drop_duplicates(subset=['date']).sort_values(by='date').reset_index(drop=True)
+        return results
+
+    def fetch_ranges(self, ranges):
+        """
+        按日期区间获取净值（用于补齐本地历史中间的缺口）。
+        ranges 为 {基金代码: [(sdate, edate), ...]}，date 或 None（不限）；所有基金的所有区间并发请求，
+        返回 {基金代码: 各区间合并后的 DataFrame 或 Exception（任一区间失败时）}。
+        """
+        if not ranges:
+            return {}
+        return asyncio.run(self._fetch_ranges(ranges))
+
+    def fetch_many(self, targets):
+        """
+        并发获取多只基金的新数据。
+        targets 为 {基金代码: 本地最新日期(date) 或 None}，
+        返回 {基金代码: DataFrame 或 Exception}。
+        """
+        if not targets:
+            return {}
+        return asyncio.run(self._fetch_many(targets))
+
+    def fetch_stream(self, targets, sink):
+        """
+        流式获取多只基金的新数据：每只基金完成后立即调用 sink(基金代码, DataFrame 或 Exception)，
+        sink 可以是有界队列的 put，队列满时抓取会自动放慢。全部完成后返回。
+        """
+        if targets:
+            asyncio.run(self._fetch_into(targets, sink, blocking_sink=True))
+
+    def fetch_one(self, fund_code, latest_local_date=None):
+        """获取单只基金的新数据，失败时抛出异常"""
+        result = self.fetch_many({fund_code: latest_local_date})[fund_code]
+        if isinstance(result, Exception):
+            raise result
+        return result
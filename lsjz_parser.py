@@ -0,0 +1,106 @@
+import re
+import logging
+from io import StringIO
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_RE = re.compile(r'content:"(.*?)"', re.S)
+_PAGES_RE = re.compile(r'pages:(\d+)')
+_TBODY_RE = re.compile(r'<tbody[^>]*>(.*?)</tbody>', re.S | re.I)
+_ROW_RE = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S | re.I)
+# 数据行的前两列：净值日期、单位净值
+_DATA_ROW_RE = re.compile(
+    r'<tr[^>]*>\s*<td[^>]*>\s*(\d{4}-\d{2}-\d{2})\s*</td>\s*<td[^>]*>\s*([-+]?[\d.]*)\s*\*?\s*</td>',
+    re.S | re.I
+)
+
+# read_html 兜底解析时识别的表头
+_DATE_HEADERS = ('净值日期', '日期')
+_VALUE_HEADERS = ('单位净值', '净值')
+
+
+class LsjzFormatError(ValueError):
+    """lsjz 接口返回内容无法识别"""
+
+
+def _extract_content(text):
+    content_match = _CONTENT_RE.search(text)
+    pages_match = _PAGES_RE.search(text)
+    if not content_match or not pages_match:
+        raise LsjzFormatError("API返回内容格式不正确，可能已无数据或接口变更")
+    return content_match.group(1).replace('\\"', '"'), int(pages_match.group(1))
+
+
+def _to_arrays(dates, values):
+    dates = np.array(dates, dtype='datetime64[D]')
+    try:
+        values = np.array(values, dtype=np.float64)
+    except ValueError:
+        # 个别行净值为空（如暂停估值），逐个转换并丢弃
+        values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    return dates[valid], values[valid]
+
+
+def _parse_fast(html):
+    """正则直接提取日期和单位净值；行数对不上时返回 None，交给兜底解析"""
+    tbody_match = _TBODY_RE.search(html)
+    body = tbody_match.group(1) if tbody_match else html
+    rows = _ROW_RE.findall(body)
+    matches = _DATA_ROW_RE.findall(body)
+    # 形如“暂无数据”的单元格合并行不算数据行
+    data_rows = [row for row in rows if 'colspan' not in row.lower()]
+    if len(matches) != len(data_rows):
+        return None
+    return _to_arrays([m[0] for m in matches], [m[1] for m in matches])
+
+
+def _pick_column(columns, candidates, fallback_position):
+    for col in columns:
+        name = col[-1] if isinstance(col, tuple) else col
+        if str(name).strip() in candidates:
+            return col
+    return columns[fallback_position]
+
+
+def _parse_read_html(html):
+    """兼容兜底：用 read_html 解析，按表头名或位置取日期和净值列，不依赖列数"""
+    tables = pd.read_html(StringIO(html))
+    if not tables or len(tables[0].columns) < 2:
+        return np.empty(0, dtype='datetime64[D]'), np.empty(0)
+    df = tables[0]
+    columns = list(df.columns)
+    date_col = _pick_column(columns, _DATE_HEADERS, 0)
+    value_col = _pick_column(columns, _VALUE_HEADERS, 1)
+    dates = pd.to_datetime(df[date_col], errors='coerce')
+    values = pd.to_numeric(df[value_col], errors='coerce')
+    valid = dates.notna() & values.notna()
+    return dates[valid].values.astype('datetime64[D]'), values[valid].to_numpy(dtype=np.float64)
+
+
+def parse_lsjz_arrays(text):
+    """
+    解析 lsjz 接口的一页返回，直接得到 NumPy 数组。
+    返回 (日期 datetime64[D] 数组, 单位净值 float64 数组, 总页数)，格式无法识别时抛出 LsjzFormatError。
+    """
+    html, total_pages = _extract_content(text)
+    parsed = _parse_fast(html)
+    if parsed is None:
+        logger.warning("lsjz 页面格式与预期不符，改用 read_html 解析")
+        parsed = _parse_read_html(html)
+    dates, values = parsed
+    return dates, values, total_pages
+
+
+def parse_lsjz_page(text):
+    """
+    解析 lsjz 接口返回的一页数据。
+    返回 (DataFrame[date, net_value], 总页数)；返回内容格式不正确时返回 (None, 0)。
+    """
+    try:
+        dates, values, total_pages = parse_lsjz_arrays(text)
+    except LsjzFormatError:
+        return None, 0
+    return pd.DataFrame({'date': pd.to_datetime(dates), 'net_value': values}), total_pages
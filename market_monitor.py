@@ -2,33 +2,70 @@ import pandas as pd
 import numpy as np
 import re
 import os
+import csv
+import queue
 import logging
-from datetime import datetime, timedelta, time
-import random
-from io import StringIO
-import requests
-import tenacity
-import concurrent.futures
-import time as time_module
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('market_monitor.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import threading
+from datetime import datetime
+from indicator_engine import latest_indicators, MIN_ROWS
+from indicator_state import IndicatorStateCache
+from nav_repository import NavRepository
+from trading_calendar import TradingCalendar
+from signal_rules import SignalRules, TREND_NEUTRAL
+from run_metrics import get_metrics
+from sharding import SHARD_DIR, load_shards, merge_repository
+from checkpoint import Checkpoint, checkpoint_path, fingerprint
+
 logger = logging.getLogger(__name__)
 
 # 定义本地数据存储目录
 DATA_DIR = 'fund_data'
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+
+# 计算信号只需要最近的这些行
+SIGNAL_HISTORY_ROWS = 100
+# 增量指标状态缓存文件（位于净值存储目录下）
+INDICATOR_STATE_FILE = 'indicator_state.json'
+# 运行汇总（各阶段耗时、HTTP 计数和延迟分布）
+RUN_SUMMARY_FILE = 'market_monitor_summary.json'
+# 流水线各阶段之间队列的容量（基金数），限制内存中待处理的数据量
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '32'))
+# 写入 / 计算阶段每批最多处理的基金数
+PIPELINE_BATCH_SIZE = int(os.getenv('PIPELINE_BATCH_SIZE', '16'))
+# 分片运行时各分片写出的信号（合并后生成报告）
+SHARD_SIGNALS_FILE = 'signals.json'
+# 流式输出文件的列
+STREAM_COLUMNS = ['fund_code', 'latest_net_value', 'rsi', 'ma_ratio', 'macd_diff', 'advice', 'action_signal', 'market_trend']
+# 流水线结束标记
+_DONE = object()
+
+def _next_batch(q, limit):
+    """阻塞等待至少一项，再取出队列中已到达的其余项（最多 limit 项），返回 (列表, 是否已结束)"""
+    items = [q.get()]
+    while len(items) < limit and items[-1] is not _DONE:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            break
+    done = items[-1] is _DONE
+    if done:
+        items.pop()
+    return items, done
+
+
+def setup_logging():
+    """配置日志（只在作为脚本或命令行子命令运行时调用，导入模块时不创建日志文件）"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('market_monitor.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
 
 class MarketMonitor:
-    def __init__(self, report_file='analysis_report.md', output_file='market_monitor_report.md', filter_mode='all', rsi_threshold=None, holdings=None):
+    def __init__(self, report_file='analysis_report.md', output_file='market_monitor_report.md', filter_mode='all', rsi_threshold=None, holdings=None, nav_store=None, fetcher=None, calendar=None, offline=False, rules_file=None, stream_file=None, repair_gaps=False, shard=None, resume=False):
         self.report_file = report_file
         self.output_file = output_file
         self.filter_mode = filter_mode  # 'all', 'strong_buy', 'low_rsi_buy'
@@ -38,9 +75,34 @@ class MarketMonitor:
         self.fund_data = {}
         self.index_data = pd.DataFrame()  # 大盘数据
         self.index_indicators = None  # 大盘指标
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36'
-        }
+        self.market_trend = None  # 大盘趋势，每次运行只计算一次
+        # 表驱动的信号规则（默认内置规则，可用 JSON/YAML 文件替换）
+        self.rules = SignalRules.load(rules_file)
+        # 与 FundAnalyzer 共用的本地净值仓库（存储后端 + 新鲜度索引 + 按需创建的抓取器）
+        self.repository = NavRepository(nav_store=nav_store, fetcher=fetcher, calendar=calendar, data_dir=DATA_DIR)
+        self.nav_store = self.repository.store
+        self.freshness = self.repository.freshness
+        self.indicator_states = IndicatorStateCache(os.path.join(self.nav_store.data_dir, INDICATOR_STATE_FILE), SIGNAL_HISTORY_ROWS)
+        self.offline = offline  # 离线模式：只使用本地数据，不访问网络
+        self.repair_gaps = repair_gaps  # 先按交易日历补齐本地历史中间缺失的日期区间
+        self._repaired = set()
+        self.calendar = calendar  # 交易日历，默认在加载大盘数据后构建
+        self.stream_file = stream_file  # 信号流式输出文件（CSV），为空时不输出
+        # 分片（sharding.Shard）：只处理属于该分片的基金，部分结果写入分片目录，报告由 merge_shards 统一生成
+        self.shard = shard
+        if shard is not None:
+            shard.redirect(self.repository)
+            self.indicator_states.save_path = shard.path(INDICATOR_STATE_FILE)
+        # 每只基金的信号写入检查点；resume 为 True 时跳过同一运行窗口内已完成的基金
+        self.resume = resume
+        self.checkpoint = None
+        self._stream = None
+        self._emit_lock = threading.Lock()
+        self.metrics = get_metrics()  # 各阶段耗时和 HTTP 计数，运行结束后写出运行汇总
+
+    @property
+    def fetcher(self):
+        return self.repository.fetcher
 
     def _load_index_data(self):
         """加载大盘数据"""
@@ -52,6 +114,7 @@ class MarketMonitor:
                 logger.info("大盘数据加载成功，共 %d 行，最新日期: %s", len(self.index_data), self.index_data['date'].max().date())
                 # 计算大盘指标
                 self.index_indicators = self._calculate_indicators(self.index_data)
+                self.market_trend = None
                 if self.index_indicators is not None:
                     logger.info("大盘指标计算完成")
                 else:
@@ -64,33 +127,21 @@ class MarketMonitor:
             self.index_data = pd.DataFrame()
 
     def _get_index_market_trend(self):
-        """获取大盘趋势信号"""
-        if self.index_indicators is None or self.index_indicators.empty:
-            return "中性"
-        
-        latest_index = self.index_indicators.iloc[-1]
-        ma_ratio = latest_index['ma_ratio']
-        macd_diff = latest_index['macd'] - latest_index['signal']
-        rsi = latest_index['rsi']
-        
-        if not np.isnan(ma_ratio) and ma_ratio > 1 and not np.isnan(macd_diff) and macd_diff > 0 and not np.isnan(rsi) and rsi < 70:
-            return "强势"
-        elif not np.isnan(ma_ratio) and ma_ratio < 0.95 or not np.isnan(macd_diff) and macd_diff < 0 or not np.isnan(rsi) and rsi > 70:
-            return "弱势"
-        else:
-            return "中性"
+        """获取大盘趋势信号（按规则表计算，结果在本次运行内复用）"""
+        if self.market_trend is None:
+            if self.index_indicators is None or self.index_indicators.empty:
+                return TREND_NEUTRAL
+            self.market_trend = str(self.rules.market_trend(self.index_indicators.iloc[[-1]])[0])
+            logger.info("大盘趋势: %s", self.market_trend)
+        return self.market_trend
 
     def _get_expected_latest_date(self):
-        """根据当前时间确定期望的最新数据日期"""
+        """根据交易日历和当前时间确定期望的最新数据日期（周末和节假日不会产生新净值）"""
         now = datetime.now()
-        # 假设净值更新时间为晚上21:00
-        update_time = time(21, 0)
-        if now.time() < update_time:
-            # 如果当前时间早于21:00，则期望最新日期为昨天
-            expected_date = now.date() - timedelta(days=1)
-        else:
-            # 否则，期望最新日期为今天
-            expected_date = now.date()
+        if self.calendar is None:
+            self.calendar = TradingCalendar(self.index_data['date'] if not self.index_data.empty else None)
+            self.repository.calendar = self.calendar
+        expected_date = self.calendar.expected_latest_date(now)
         logger.info("当前时间: %s, 期望最新数据日期: %s", now.strftime('%Y-%m-%d %H:%M:%S'), expected_date)
         return expected_date
 
@@ -125,120 +176,27 @@ class MarketMonitor:
             logger.error("解析报告文件失败: %s", e)
             raise
 
-    def _read_local_data(self, fund_code):
-        """读取本地文件，如果存在则返回DataFrame"""
-        file_path = os.path.join(DATA_DIR, f"{fund_code}.csv")
-        if os.path.exists(file_path):
-            try:
-                df = pd.read_csv(file_path, parse_dates=['date'])
-                if not df.empty and 'date' in df.columns and 'net_value' in df.columns:
-                    df = df.sort_values(by='date', ascending=True).reset_index(drop=True)
-                    logger.info("本地已存在基金 %s 数据，共 %d 行，最新日期为: %s", fund_code, len(df), df['date'].max().date())
-                    return df
-            except Exception as e:
-                logger.warning("读取本地文件 %s 失败: %s", file_path, e)
+    def _read_local_data(self, fund_code, tail=None):
+        """读取本地净值数据，tail 不为空时只读取最后 tail 行，不存在则返回空DataFrame"""
+        try:
+            df = self.nav_store.read(fund_code, tail=tail)
+            if not df.empty:
+                logger.debug("本地已存在基金 %s 数据，读取 %d 行，最新日期为: %s", fund_code, len(df), df['date'].max().date())
+                return df
+        except Exception as e:
+            logger.warning("读取基金 %s 本地数据失败: %s", fund_code, e)
         return pd.DataFrame()
 
     def _save_to_local_file(self, fund_code, df):
-        """将DataFrame保存到本地文件，覆盖旧文件"""
-        file_path = os.path.join(DATA_DIR, f"{fund_code}.csv")
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        df.to_csv(file_path, index=False)
-        logger.info("基金 %s 数据已成功保存到本地文件: %s", fund_code, file_path)
-
-    @tenacity.retry(
-        stop=tenacity.stop_after_attempt(5),
-        wait=tenacity.wait_fixed(10),
-        retry=tenacity.retry_if_exception_type((requests.exceptions.RequestException, ValueError)),
-        before_sleep=lambda retry_state: logger.info(f"重试基金 {retry_state.args[0]}，第 {retry_state.attempt_number} 次")
-    )
-    def _fetch_fund_data(self, fund_code, latest_local_date=None):
-        """
-        从网络获取基金数据，实现真正的增量更新。
-        如果 latest_local_date 不为空，则只获取其之后的数据。
-        """
-        all_new_data = []
-        page_index = 1
-        has_new_data = False
-        
-        while True:
-            url = f"http://fundf10.eastmoney.com/F10DataApi.aspx?type=lsjz&code={fund_code}&page={page_index}&per=20"
-            logger.info("正在获取基金 %s 的第 %d 页数据...", fund_code, page_index)
-            
-            try:
-                response = requests.get(url, headers=self.headers, timeout=30)
-                response.raise_for_status()
-                
-                content_match = re.search(r'content:"(.*?)"', response.text, re.S)
-                pages_match = re.search(r'pages:(\d+)', response.text)
-                
-                if not content_match or not pages_match:
-                    logger.error("基金 %s API返回内容格式不正确，可能已无数据或接口变更", fund_code)
-                    break
-
-                raw_content_html = content_match.group(1).replace('\\"', '"')
-                total_pages = int(pages_match.group(1))
-                
-                tables = pd.read_html(StringIO(raw_content_html))
-                
-                if not tables:
-                    logger.warning("基金 %s 在第 %d 页未找到数据表格，爬取结束", fund_code, page_index)
-                    break
-                
-                df_page = tables[0]
-                df_page.columns = ['date', 'net_value', 'cumulative_net_value', 'daily_growth_rate', 'purchase_status', 'redemption_status', 'dividend']
-                df_page = df_page[['date', 'net_value']].copy()
-                df_page['date'] = pd.to_datetime(df_page['date'], errors='coerce')
-                df_page['net_value'] = pd.to_numeric(df_page['net_value'], errors='coerce')
-                df_page = df_page.dropna(subset=['date', 'net_value'])
-                
-                # 如果是增量更新模式，检查是否已获取到本地最新数据之前的数据
-                if latest_local_date:
-                    new_df_page = df_page[df_page['date'].dt.date > latest_local_date]
-                    if new_df_page.empty:
-                        # 如果当前页没有新数据，且之前已经发现过新数据，则停止爬取
-                        if has_new_data:
-                            logger.info("基金 %s 已获取所有新数据，爬取结束。", fund_code)
-                            break
-                        # 如果当前页没有新数据，且是第一页，则说明没有新数据
-                        elif page_index == 1:
-                            logger.info("基金 %s 无新数据，爬取结束。", fund_code)
-                            break
-                    else:
-                        has_new_data = True
-                        all_new_data.append(new_df_page)
-                        logger.info("第 %d 页: 发现 %d 行新数据", page_index, len(new_df_page))
-                else:
-                    # 如果是首次下载，则获取所有数据
-                    all_new_data.append(df_page)
+        """将DataFrame保存到本地存储，覆盖旧数据"""
+        self.nav_store.write(fund_code, df)
+        logger.info("基金 %s 数据已成功保存到本地存储: %s", fund_code, self.nav_store.data_dir)
 
-                logger.info("基金 %s 总页数: %d, 当前页: %d, 当前页行数: %d", fund_code, total_pages, page_index, len(df_page))
-                
-                # 如果是增量更新模式，且当前页数据比最新数据日期早，则结束循环
-                if latest_local_date and (df_page['date'].dt.date <= latest_local_date).any():
-                    logger.info("基金 %s 已追溯到本地数据，增量爬取结束。", fund_code)
-                    break
-
-                if page_index >= total_pages:
-                    logger.info("基金 %s 已获取所有历史数据，共 %d 页，爬取结束", fund_code, total_pages)
-                    break
-                
-                page_index += 1
-                time_module.sleep(random.uniform(1, 2))  # 延长sleep到1-2秒，减少限速风险
-                
-            except requests.exceptions.RequestException as e:
-                logger.error("基金 %s API请求失败: %s", fund_code, str(e))
-                raise
-            except Exception as e:
-                logger.error("基金 %s API数据解析失败: %s", fund_code, str(e))
-                raise
-
-        # 合并新数据并返回
-        if all_new_data:
-            new_combined_df = pd.concat(all_new_data, ignore_index=True)
-            return new_combined_df[['date', 'net_value']]
-        else:
-            return pd.DataFrame()
+    def _append_to_local_file(self, fund_code, new_df, latest_local=None):
+        """增量写入新数据（仅在历史被修正时才重写整个文件），并更新新鲜度索引"""
+        mode = self.repository.save(fund_code, new_df, latest_local)
+        logger.debug("基金 %s 新数据已写入本地存储 (%s)", fund_code, mode)
+        return mode
 
     def _calculate_indicators(self, df):
         """计算技术指标并生成结果字典"""
@@ -276,202 +234,452 @@ class MarketMonitor:
 
         return df
 
+    def _failed_signal(self, fund_code, market_trend=None):
+        """数据不足或处理失败时返回的默认信号"""
+        return {
+            'fund_code': fund_code,
+            'latest_net_value': "数据获取失败",
+            'rsi': np.nan,
+            'ma_ratio': np.nan,
+            'macd_diff': np.nan,
+            'bb_upper': np.nan,
+            'bb_lower': np.nan,
+            'advice': "观察",
+            'action_signal': 'N/A',
+            'market_trend': market_trend or self._get_index_market_trend()
+        }
+
+    def _signals_from_rows(self, rows, market_trend=None):
+        """
+        用规则表一次性计算多只基金的投资建议和行动信号，结合大盘趋势调整。
+        rows 为 {基金代码: 最新一行指标}，返回 {基金代码: 信号字典}。
+        """
+        if not rows:
+            return {}
+        if market_trend is None:
+            market_trend = self._get_index_market_trend()
+        latest = pd.DataFrame.from_dict({code: dict(row) for code, row in rows.items()}, orient='index')
+        advice = self.rules.evaluate('advice', latest, market_trend)
+        action_signal = self.rules.evaluate('action_signal', latest, market_trend)
+        macd_diff = latest['macd'] - latest['signal']
+
+        results = {}
+        for i, fund_code in enumerate(latest.index):
+            results[fund_code] = {
+                'fund_code': fund_code,
+                'latest_net_value': latest['net_value'].iloc[i],
+                'rsi': latest['rsi'].iloc[i],
+                'ma_ratio': latest['ma_ratio'].iloc[i],
+                'macd_diff': macd_diff.iloc[i],
+                'bb_upper': latest['bb_upper'].iloc[i],
+                'bb_lower': latest['bb_lower'].iloc[i],
+                'advice': str(advice[i]),
+                'action_signal': str(action_signal[i]),
+                'market_trend': market_trend
+            }
+        return results
+
+    def _signals_from_latest(self, fund_code, latest_data, market_trend=None):
+        """根据最新一行指标生成投资建议和行动信号，结合大盘趋势调整"""
+        return self._signals_from_rows({fund_code: latest_data}, market_trend)[fund_code]
+
     def _get_latest_signals(self, fund_code, df):
         """根据最新数据计算信号，结合大盘趋势调整"""
         try:
             processed_df = self._calculate_indicators(df)
             if processed_df is None:
                 logger.warning("基金 %s 数据不足，跳过计算", fund_code)
-                return {
-                    'fund_code': fund_code, 'latest_net_value': "数据获取失败", 'rsi': np.nan, 'ma_ratio': np.nan,
-                    'macd_diff': np.nan, 'bb_upper': np.nan, 'bb_lower': np.nan, 'advice': "观察", 'action_signal': 'N/A'
-                }
-            
-            latest_data = processed_df.iloc[-1]
-            latest_net_value = latest_data['net_value']
-            latest_rsi = latest_data['rsi']
-            latest_ma50_ratio = latest_data['ma_ratio']
-            latest_macd_diff = latest_data['macd'] - latest_data['signal']
-            latest_bb_upper = latest_data['bb_upper']
-            latest_bb_lower = latest_data['bb_lower']
-
-            # 获取大盘趋势
-            market_trend = self._get_index_market_trend()
-
-            advice = "观察"
-            if (not np.isnan(latest_rsi) and latest_rsi > 70) or \
-               (not np.isnan(latest_bb_upper) and latest_net_value > latest_bb_upper) or \
-               (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio > 1.2):
-                advice = "等待回调"
-                # 如果大盘弱势，进一步确认卖出
-                if market_trend == "弱势":
-                    advice = "强烈等待回调"
-            elif (not np.isnan(latest_rsi) and latest_rsi < 30) or \
-                 (not np.isnan(latest_bb_lower) and latest_net_value < latest_bb_lower) or \
-                 (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio < 0.8):
-                advice = "可分批买入"
-                # 如果大盘强势，加强买入
-                if market_trend == "强势":
-                    advice = "强烈分批买入"
-            elif (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio > 1) and \
-                 (not np.isnan(latest_macd_diff) and latest_macd_diff > 0):
-                advice = "可分批买入"
-                if market_trend == "强势":
-                    advice = "强烈分批买入"
-            elif (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio < 1) and \
-                 (not np.isnan(latest_macd_diff) and latest_macd_diff < 0):
-                advice = "等待回调"
-                if market_trend == "弱势":
-                    advice = "强烈等待回调"
-
-            action_signal = "持有/观察"
-            if not np.isnan(latest_ma50_ratio) and latest_ma50_ratio < 0.95:
-                action_signal = "强卖出/规避"
-                if market_trend == "弱势":
-                    action_signal = "强烈强卖出/规避"
-            elif (not np.isnan(latest_rsi) and latest_rsi > 70) and \
-                 (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio > 1.2) and \
-                 (not np.isnan(latest_macd_diff) and latest_macd_diff < 0):
-                action_signal = "强卖出/规避"
-                if market_trend == "弱势":
-                    action_signal = "强烈强卖出/规避"
-            elif (not np.isnan(latest_rsi) and latest_rsi > 65) or \
-                 (not np.isnan(latest_bb_upper) and latest_net_value > latest_bb_upper) or \
-                 (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio > 1.2):
-                action_signal = "弱卖出/规避"
-                if market_trend == "弱势":
-                    action_signal = "强卖出/规避"
-            elif (not np.isnan(latest_rsi) and latest_rsi < 35) and \
-                 (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio < 0.9) and \
-                 (not np.isnan(latest_macd_diff) and latest_macd_diff > 0):
-                action_signal = "强买入"
-                if market_trend == "强势":
-                    action_signal = "强烈强买入"
-            elif (not np.isnan(latest_rsi) and latest_rsi < 45) or \
-                 (not np.isnan(latest_bb_lower) and latest_net_value < latest_bb_lower) or \
-                 (not np.isnan(latest_ma50_ratio) and latest_ma50_ratio < 1):
-                action_signal = "弱买入"
-                if market_trend == "强势":
-                    action_signal = "强买入"
-            
-            # 在结果中添加大盘趋势
-            return {
-                'fund_code': fund_code,
-                'latest_net_value': latest_net_value,
-                'rsi': latest_rsi,
-                'ma_ratio': latest_ma50_ratio,
-                'macd_diff': latest_macd_diff,
-                'bb_upper': latest_bb_upper,
-                'bb_lower': latest_bb_lower,
-                'advice': advice,
-                'action_signal': action_signal,
-                'market_trend': market_trend
-            }
+                return self._failed_signal(fund_code)
+            return self._signals_from_latest(fund_code, processed_df.iloc[-1])
         except Exception as e:
             logger.error("处理基金 %s 时发生异常: %s", fund_code, str(e))
-            return {
-                'fund_code': fund_code,
-                'latest_net_value': "数据获取失败",
-                'rsi': np.nan,
-                'ma_ratio': np.nan,
-                'macd_diff': np.nan,
-                'bb_upper': np.nan,
-                'bb_lower': np.nan,
-                'advice': "观察",
-                'action_signal': 'N/A',
-                'market_trend': self._get_index_market_trend()
-            }
+            return self._failed_signal(fund_code)
+
+    def _latest_from_state(self, fund_code, state):
+        """从增量指标状态取最新一行指标，无需读取历史数据；数据不足时返回 None"""
+        if state is None or state.count < MIN_ROWS:
+            logger.warning("基金 %s 数据不足，跳过计算", fund_code)
+            return None
+        return state.latest()
+
+    def _latest_rows_batch(self, frames):
+        """
+        使用向量化指标引擎一次性计算多只基金的最新一行指标。
+        返回 (指标行字典, 已确定的信号字典)，后者包含数据不足或计算失败的基金。
+        """
+        try:
+            latest = latest_indicators(frames, rows=SIGNAL_HISTORY_ROWS)
+        except Exception as e:
+            logger.error("批量计算指标失败，改为逐只计算: %s", e)
+            return {}, {fund_code: self._get_latest_signals(fund_code, df) for fund_code, df in frames.items()}
+
+        rows, signals = {}, {}
+        for fund_code in frames:
+            if fund_code not in latest.index:
+                logger.warning("基金 %s 数据不足，跳过计算", fund_code)
+                signals[fund_code] = self._failed_signal(fund_code)
+            else:
+                rows[fund_code] = latest.loc[fund_code]
+        return rows, signals
 
     def get_fund_data(self):
         """主控函数：优先从本地加载，仅在数据非最新或不完整时下载"""
-        # 加载大盘数据
-        self._load_index_data()
-        
-        # 步骤1: 解析推荐基金代码
-        self._parse_report()
+        with self.metrics.stage('load'):
+            # 加载大盘数据
+            self._load_index_data()
+
+            # 步骤1: 解析推荐基金代码
+            self._parse_report()
+            if self.shard is not None:
+                self.shard.prepare()
+                self.fund_codes = self.shard.select(self.fund_codes)
         if not self.fund_codes:
             logger.error("没有提取到任何基金代码，无法继续处理")
             return
 
+        resumed = self._open_checkpoint()
+        fund_codes = [fund_code for fund_code in self.fund_codes if fund_code not in resumed]
+        if self.repair_gaps and not self.offline:
+            self._repair_gaps(fund_codes)
+
         # 步骤2: 预加载本地数据并检查是否需要下载
         logger.info("开始预加载本地缓存数据...")
+        with self.metrics.stage('staleness'):
+            fund_codes_to_fetch, fresh_frames, local_status, latest_rows = self._check_local_data(fund_codes)
+        logger.info("预加载完成：%d 个基金本地数据可直接使用，%d 个基金需要获取新数据",
+                    len(fund_codes) - len(fund_codes_to_fetch), len(fund_codes_to_fetch))
+
+        self._open_stream()
+        # 检查点中已完成的基金直接使用上次算出的信号
+        self._emit_signals(resumed)
+        # 本地已是最新但没有指标状态的基金：批量计算指标，并建立状态供下次增量更新
+        with self.metrics.stage('indicators'):
+            if fresh_frames:
+                rows, signals = self._latest_rows_batch(fresh_frames)
+                latest_rows.update(rows)
+                self._emit_signals(signals)
+                for fund_code, local_df in fresh_frames.items():
+                    self.indicator_states.rebuild(fund_code, local_df)
+            # 本地已是最新的基金先输出信号
+            self._emit_rows(latest_rows)
+
+        # 步骤3: 抓取、写入、计算三个阶段流水线并行，信号逐批输出
+        if fund_codes_to_fetch:
+            self._run_pipeline(fund_codes_to_fetch, local_status)
+        else:
+            logger.info("所有基金数据均来自本地缓存，无需网络下载。")
+        self._close_stream()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+
+        try:
+            self.indicator_states.save()
+        except Exception as e:
+            logger.warning("保存指标状态缓存失败: %s", e)
+        self.repository.save_index()
+        
+        if len(self.fund_data) > 0:
+            logger.info("所有基金数据处理完成。")
+        else:
+            logger.error("所有基金数据均获取失败。")
+
+    def _open_checkpoint(self):
+        """
+        打开本次运行的检查点（离线模式不使用），返回可以直接沿用的信号 {基金代码: 信号}。
+        运行窗口由期望的最新净值日期、大盘趋势、基金列表和信号规则确定，任何一项变化都从头开始。
+        """
+        if self.offline:
+            return {}
+        window = {
+            'expected_date': self._get_expected_latest_date().isoformat(),
+            'market_trend': self._get_index_market_trend(),
+            'funds': fingerprint(self.fund_codes),
+            'rules': fingerprint(self.rules.spec),
+        }
+        self.checkpoint = Checkpoint(checkpoint_path('market_monitor', self.shard), window, resume=self.resume)
+        resumed = {fund_code: signal for fund_code, signal in self.checkpoint.results.items() if fund_code in self.fund_codes}
+        if resumed:
+            logger.info("断点续跑：%d 个基金已在本运行窗口内完成，跳过", len(resumed))
+        return resumed
+
+    def _repair_gaps(self, fund_codes):
+        """按日期区间补齐本地历史中的缺口（含尾部）；历史被改写的基金的指标状态随后作废并重建"""
+        self._get_expected_latest_date()  # 构建交易日历供仓库使用
+        status = self.repository.sync(fund_codes, repair_gaps=True)
+        self._repaired = {fund_code for fund_code, result in status.items() if result == 'updated'}
+        logger.info("缺口补齐完成：%d 只基金的本地历史已更新", len(self._repaired))
+
+    def _check_local_data(self, fund_codes=None):
+        """
+        检查每只基金（默认全部 fund_codes）的本地数据是否最新且足够，返回 (需要下载的基金, 本地最新但没有指标状态的数据,
+        {基金代码: (本地最新日期, 最近若干行)}, 本地最新基金的最新一行指标)。
+        """
         fund_codes_to_fetch = []
+        fresh_frames = {}
         expected_latest_date = self._get_expected_latest_date()
         min_data_points = 26  # 确保有足够数据计算技术指标
 
-        for fund_code in self.fund_codes:
-            local_df = self._read_local_data(fund_code)
-            
-            if not local_df.empty:
-                latest_local_date = local_df['date'].max().date()
-                data_points = len(local_df)
-                
-                # 检查数据是否最新且完整
-                if latest_local_date >= expected_latest_date and data_points >= min_data_points:
-                    logger.info("基金 %s 的本地数据已是最新 (%s, 期望: %s) 且数据量足够 (%d 行)，直接加载。",
-                                 fund_code, latest_local_date, expected_latest_date, data_points)
-                    self.fund_data[fund_code] = self._get_latest_signals(fund_code, local_df.tail(100))
-                    continue
-                else:
-                    if latest_local_date < expected_latest_date:
-                        logger.info("基金 %s 本地数据已过时（最新日期为 %s，期望 %s），需要从网络获取新数据。",
-                                     fund_code, latest_local_date, expected_latest_date)
-                    if data_points < min_data_points:
-                        logger.info("基金 %s 本地数据量不足（仅 %d 行，需至少 %d 行），需要从网络获取。",
-                                     fund_code, data_points, min_data_points)
-            else:
+        self.indicator_states.load()
+        for fund_code in self._repaired:
+            self.indicator_states.invalidate(fund_code)
+        self.freshness.load()
+        local_status = {}
+        latest_rows = {}  # 本地已是最新的基金的最新一行指标，统一用规则表计算信号
+        for fund_code in self.fund_codes if fund_codes is None else fund_codes:
+            latest_local, data_points, local_df = self._local_status(fund_code)
+            local_status[fund_code] = (latest_local, local_df)
+            if latest_local is None:
                 logger.info("基金 %s 本地数据不存在，需要从网络获取。", fund_code)
-            
+                fund_codes_to_fetch.append(fund_code)
+                continue
+            latest_local_date = latest_local.date()
+            # 指标状态与本地最新日期一致时，无需读取历史数据
+            state = self.indicator_states.get(fund_code, latest_local)
+
+            # 检查数据是否最新且完整
+            is_latest = latest_local_date >= expected_latest_date
+            if not is_latest and data_points >= min_data_points and not self.repository.is_stale(fund_code, latest_local, expected_latest_date):
+                # 期望日期的净值公布后已成功抓取过（如 QDII 净值滞后），不再重复请求
+                logger.info("基金 %s 最新日期为 %s，但在 %s 净值公布后已检查过，本次不再下载。",
+                             fund_code, latest_local_date, expected_latest_date)
+                is_latest = True
+            if is_latest and data_points >= min_data_points:
+                logger.debug("基金 %s 的本地数据已是最新 (%s, 期望: %s) 且数据量足够 (%d 行)，直接加载。",
+                             fund_code, latest_local_date, expected_latest_date, data_points)
+                if state is not None:
+                    self._collect_latest(fund_code, self._latest_from_state(fund_code, state), latest_rows)
+                else:
+                    if local_df is None:
+                        local_df = self._read_local_data(fund_code, tail=SIGNAL_HISTORY_ROWS)
+                    fresh_frames[fund_code] = local_df
+                continue
+            if latest_local_date < expected_latest_date:
+                logger.info("基金 %s 本地数据已过时（最新日期为 %s，期望 %s），需要从网络获取新数据。",
+                             fund_code, latest_local_date, expected_latest_date)
+            if data_points < min_data_points:
+                logger.info("基金 %s 本地数据量不足（仅 %d 行，需至少 %d 行），需要从网络获取。",
+                             fund_code, data_points, min_data_points)
             fund_codes_to_fetch.append(fund_code)
+        return fund_codes_to_fetch, fresh_frames, local_status, latest_rows
 
-        # 步骤3: 多线程网络下载和处理
-        if fund_codes_to_fetch:
-            logger.info("开始使用多线程获取 %d 个基金的新数据...", len(fund_codes_to_fetch))
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                future_to_code = {executor.submit(self._process_single_fund, code): code for code in fund_codes_to_fetch}
-                for future in concurrent.futures.as_completed(future_to_code):
-                    fund_code = future_to_code[future]
+    def _run_pipeline(self, fund_codes, local_status):
+        """
+        流水线处理需要下载的基金：
+        抓取线程把每只基金的新数据放入有界队列 -> 写入线程成批追加到本地存储 ->
+        计算阶段（当前线程）增量更新指标状态，每批用规则表计算一次信号并立即输出。
+        队列有界，抓取快于写入或计算时会自动放慢，内存中只保留少量待处理的基金；
+        总耗时接近最慢的一个阶段，而不是各阶段之和。
+        """
+        fetched = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        written = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        targets = {}
+        for fund_code in fund_codes:
+            latest_local = local_status[fund_code][0]
+            targets[fund_code] = latest_local.date() if latest_local is not None else None
+        if self.offline:
+            logger.info("离线模式：%d 个基金的本地数据非最新或不完整，不下载，直接使用本地数据", len(fund_codes))
+        else:
+            logger.info("开始流水线获取 %d 个基金的新数据...", len(fund_codes))
+
+        stages = [
+            threading.Thread(target=self._fetch_stage, args=(targets, fetched), name='monitor-fetch', daemon=True),
+            threading.Thread(target=self._write_stage, args=(fetched, written, local_status), name='monitor-write', daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        self._compute_stage(written, local_status)
+        for stage in stages:
+            stage.join()
+
+    def _fetch_stage(self, targets, out_queue):
+        """抓取阶段：每只基金完成后立即放入队列（队列满时等待）"""
+        pending = set(targets)
+
+        def put(fund_code, result):
+            pending.discard(fund_code)
+            out_queue.put((fund_code, result))
+
+        try:
+            if self.offline:
+                for fund_code in targets:
+                    put(fund_code, pd.DataFrame(columns=['date', 'net_value']))
+            elif hasattr(self.fetcher, 'fetch_stream'):
+                with self.metrics.stage('fetch'):
+                    self.fetcher.fetch_stream(targets, put)
+            else:
+                with self.metrics.stage('fetch'):
+                    fetched = self.fetcher.fetch_many(targets)
+                for fund_code, result in fetched.items():
+                    put(fund_code, result)
+        except Exception as e:
+            logger.error("批量获取基金数据失败: %s", e)
+            for fund_code in list(pending):
+                put(fund_code, e)
+        finally:
+            for fund_code in list(pending):
+                put(fund_code, pd.DataFrame(columns=['date', 'net_value']))
+            out_queue.put(_DONE)
+
+    def _write_stage(self, in_queue, out_queue, local_status):
+        """写入阶段：每次取出队列中已到达的一批基金，依次追加到本地存储并记录抓取结果"""
+        done = False
+        try:
+            while not done:
+                items, done = _next_batch(in_queue, PIPELINE_BATCH_SIZE)
+                for fund_code, new_df in items:
                     try:
-                        result = future.result()
-                        if result:
-                            self.fund_data[fund_code] = result
+                        if isinstance(new_df, Exception):
+                            self.repository.record_attempt(fund_code, 'error')
+                            raise new_df
+                        with self.metrics.stage('merge_save'):
+                            mode = self._write_new_data(fund_code, new_df, local_status[fund_code][0])
+                        out_queue.put((fund_code, new_df, mode))
                     except Exception as e:
                         logger.error("处理基金 %s 数据时出错: %s", fund_code, str(e))
-                        self.fund_data[fund_code] = {
-                            'fund_code': fund_code, 'latest_net_value': "数据获取失败", 'rsi': np.nan,
-                            'ma_ratio': np.nan, 'macd_diff': np.nan, 'bb_upper': np.nan, 'bb_lower': np.nan, 'advice': "观察", 'action_signal': 'N/A',
-                            'market_trend': self._get_index_market_trend()
-                        }
-        else:
-            logger.info("所有基金数据均来自本地缓存，无需网络下载。")
-        
-        if len(self.fund_data) > 0:
-            logger.info("所有基金数据处理完成。")
+                        self._emit_signals({fund_code: self._failed_signal(fund_code)})
+        finally:
+            out_queue.put(_DONE)
+
+    def _compute_stage(self, in_queue, local_status):
+        """计算阶段：增量更新指标状态，每批基金调用一次规则表并立即输出信号"""
+        done = False
+        while not done:
+            items, done = _next_batch(in_queue, PIPELINE_BATCH_SIZE)
+            with self.metrics.stage('indicators'):
+                rows = {}
+                for fund_code, new_df, mode in items:
+                    try:
+                        state = self._update_state(fund_code, new_df, mode, *local_status[fund_code])
+                        self._collect_latest(fund_code, self._latest_from_state(fund_code, state) if state is not None else None, rows)
+                    except Exception as e:
+                        logger.error("处理基金 %s 数据时出错: %s", fund_code, str(e))
+                        self._emit_signals({fund_code: self._failed_signal(fund_code)})
+                self._emit_rows(rows)
+
+    def _emit_rows(self, rows):
+        """对一批最新指标行计算信号并输出"""
+        try:
+            signals = self._signals_from_rows(rows)
+        except Exception as e:
+            logger.error("计算信号失败: %s", e)
+            signals = {fund_code: self._failed_signal(fund_code) for fund_code in rows}
+        self._emit_signals(signals)
+
+    def _emit_signals(self, signals):
+        """记录信号；设置了 stream_file 时同时逐行追加到流式输出文件"""
+        if not signals:
+            return
+        with self._emit_lock:
+            self.fund_data.update(signals)
+            if self.checkpoint is not None:
+                for fund_code, signal in signals.items():
+                    # 失败的基金不记入检查点，续跑时重试
+                    if not isinstance(signal['latest_net_value'], str):
+                        self.checkpoint.record(fund_code, signal)
+            if self._stream is not None:
+                writer = csv.writer(self._stream)
+                for signal in signals.values():
+                    writer.writerow([signal.get(column, '') for column in STREAM_COLUMNS])
+                self._stream.flush()
+
+    def _open_stream(self):
+        if self.stream_file:
+            self._stream = open(self.stream_file, 'w', encoding='utf-8', newline='')
+            csv.writer(self._stream).writerow(STREAM_COLUMNS)
+            self._stream.flush()
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            logger.info("信号已逐批输出到 %s", self.stream_file)
+
+    def _collect_latest(self, fund_code, latest, latest_rows):
+        if latest is None:
+            self._emit_signals({fund_code: self._failed_signal(fund_code)})
         else:
-            logger.error("所有基金数据均获取失败。")
+            latest_rows[fund_code] = latest
 
-    def _process_single_fund(self, fund_code):
-        """处理单个基金数据：读取本地，下载增量，合并，保存，并计算信号"""
-        local_df = self._read_local_data(fund_code)
-        latest_local_date = local_df['date'].max().date() if not local_df.empty else None
+    def _local_status(self, fund_code):
+        """
+        查询本地数据状态，返回 (最新日期, 行数, 最近若干行数据)。
+        新鲜度索引有效时不打开数据文件，最近行数据为 None；否则读取最后 SIGNAL_HISTORY_ROWS 行。
+        """
+        return self.repository.local_status(fund_code, tail=SIGNAL_HISTORY_ROWS)
 
-        new_df = self._fetch_fund_data(fund_code, latest_local_date)
-        
-        if not new_df.empty:
-            df_final = pd.concat([local_df, new_df]).drop_duplicates(subset=['date'], keep='last').sort_values(by='date', ascending=True)
-            self._save_to_local_file(fund_code, df_final)
-            return self._get_latest_signals(fund_code, df_final.tail(100))
-        elif not local_df.empty:
+    def _write_new_data(self, fund_code, new_df, latest_local):
+        """记录抓取结果并把新数据追加到本地存储，返回写入方式（无新数据时为 None）"""
+        if not self.offline:
+            self.repository.record_attempt(fund_code, 'ok' if not new_df.empty else 'no_data')
+        if new_df.empty:
+            return None
+        return self._append_to_local_file(fund_code, new_df, latest_local)
+
+    def _update_state(self, fund_code, new_df, mode, latest_local, local_df, state=None):
+        """
+        用已写入的新数据增量更新指标状态。
+        返回更新后的指标状态，既没有新数据也没有本地数据时返回 None。
+        """
+        if state is None and latest_local is not None:
+            state = self.indicator_states.get(fund_code, latest_local)
+        if mode is not None:
+            # 纯追加且已有指标状态时按新数据增量更新，无法增量更新时再重建
+            if mode == 'append' and state is not None and state.update_frame(new_df):
+                return state
+            if mode == 'create':
+                return self.indicator_states.rebuild(fund_code, new_df)
+            if mode == 'append' and local_df is not None and not local_df.empty:
+                # 已读入最近的历史，直接与新数据拼接重建
+                return self.indicator_states.rebuild(fund_code, pd.concat([local_df, new_df]))
+            # 历史被改写时，根据最新的 tail 行完整重建
+            return self.indicator_states.rebuild(fund_code, self._read_local_data(fund_code, tail=SIGNAL_HISTORY_ROWS))
+        elif latest_local is not None:
             # 如果没有新数据，且本地有数据，则使用本地数据计算信号
             logger.info("基金 %s 无新数据，使用本地历史数据进行分析", fund_code)
-            return self._get_latest_signals(fund_code, local_df.tail(100))
+            if state is None:
+                if local_df is None:
+                    local_df = self._read_local_data(fund_code, tail=SIGNAL_HISTORY_ROWS)
+                state = self.indicator_states.rebuild(fund_code, local_df)
+            return state
         else:
             # 如果既没有新数据，本地又没有数据，则返回失败
             logger.error("基金 %s 未获取到任何有效数据，且本地无缓存", fund_code)
             return None
 
     def generate_report(self):
-        """生成市场情绪与技术指标监控报告"""
+        """生成市场情绪与技术指标监控报告；分片运行时只写出本分片的信号和净值更新"""
+        with self.metrics.stage('report'):
+            if self.shard is not None:
+                self.shard.write_json(SHARD_SIGNALS_FILE, {code: self.fund_data[code] for code in self.fund_codes if code in self.fund_data})
+                self.shard.finish(self.fund_codes, self.repository)
+            else:
+                self._write_report()
+
+    def merge_shards(self, base_dir=SHARD_DIR):
+        """
+        合并 monitor --shard 各分片的结果：净值文件、新鲜度索引、指标状态和信号，
+        之后调用 generate_report 生成与单进程运行相同的完整报告。
+        """
+        shards = load_shards('monitor', base_dir)
+        with self.metrics.stage('load'):
+            self._load_index_data()
+        with self.metrics.stage('merge'):
+            merge_repository(shards, self.repository)
+            self.indicator_states.load()
+            fund_codes = []
+            for shard, manifest in shards:
+                fund_codes.extend(manifest['fund_codes'])
+                partial = IndicatorStateCache(shard.path(INDICATOR_STATE_FILE), SIGNAL_HISTORY_ROWS).load()
+                self.indicator_states.states.update({code: state for code, state in partial.states.items() if shard.owns(code)})
+                self.fund_data.update(shard.read_json(SHARD_SIGNALS_FILE))
+            self.fund_codes = sorted(fund_codes)
+            try:
+                self.indicator_states.save()
+            except Exception as e:
+                logger.warning("保存指标状态缓存失败: %s", e)
+        logger.info("已合并 %d 个分片共 %d 只基金的信号", len(shards), len(self.fund_codes))
+
+    def _write_report(self):
         logger.info("正在生成市场监控报告...")
         report_df_list = []
         market_trend = self._get_index_market_trend()
@@ -596,6 +804,7 @@ class MarketMonitor:
 
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         logger.info("脚本启动")
         # 示例：使用过滤模式，只显示强买入
@@ -604,6 +813,7 @@ if __name__ == "__main__":
         monitor = MarketMonitor()
         monitor.get_fund_data()
         monitor.generate_report()
+        monitor.metrics.write_summary(RUN_SUMMARY_FILE, job='market_monitor')
         logger.info("脚本执行完成")
     except Exception as e:
         logger.error("脚本运行失败: %s", e, exc_info=True)
@@ -0,0 +1,205 @@
+import os
+import logging
+import threading
+from datetime import datetime
+import pandas as pd
+from nav_store import get_nav_store
+from freshness_index import FreshnessIndex
+from trading_calendar import TradingCalendar, NAV_PUBLISH_TIME
+from run_metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 本地数据新鲜度索引文件（位于净值存储目录下）
+FRESHNESS_INDEX_FILE = 'freshness_index.json'
+# 补齐缺口时，间隔不超过该交易日数的两个缺口合并为一次区间请求
+GAP_MERGE_DAYS = int(os.getenv('GAP_MERGE_DAYS', 10))
+
+
+class NavRepository:
+    """
+    MarketMonitor 和 FundAnalyzer 共用的本地净值仓库。
+    历史净值保存在 NavStore 中，新鲜度索引记录每只基金的本地最新日期；
+    数据过时时只从网络获取本地最新日期之后的尾部，每只基金的完整历史只下载一次。
+    """
+
+    def __init__(self, nav_store=None, fetcher=None, calendar=None, data_dir=None):
+        self.store = nav_store or get_nav_store(data_dir=data_dir)
+        os.makedirs(self.store.data_dir, exist_ok=True)
+        self.freshness = FreshnessIndex(os.path.join(self.store.data_dir, FRESHNESS_INDEX_FILE), self.store)
+        self.calendar = calendar
+        self._fetcher = fetcher
+        self._lock = threading.Lock()
+        self.updated = set()  # 本次运行写入过新数据的基金（分片运行据此导出净值更新）
+
+    @property
+    def fetcher(self):
+        """异步净值抓取器（连接池 + 全局限速），首次需要下载时才创建"""
+        if self._fetcher is None:
+            from lsjz_fetcher import LsjzFetcher
+            self._fetcher = LsjzFetcher()
+        return self._fetcher
+
+    def expected_latest_date(self, now=None):
+        if self.calendar is None:
+            self.calendar = TradingCalendar.from_index_file()
+        return self.calendar.expected_latest_date(now)
+
+    def local_status(self, fund_code, tail=None):
+        """
+        查询本地数据状态，返回 (最新日期, 行数, 最近若干行数据)。
+        新鲜度索引有效时不打开数据文件，最近行数据为 None；
+        否则读取一次最后 tail 行并更新索引。
+        """
+        entry = self.freshness.lookup(fund_code)
+        if entry is not None:
+            return self.freshness.latest_date(entry), entry['rows'], None
+        local_df = self.store.read(fund_code, tail=tail)
+        if local_df.empty:
+            return None, 0, local_df
+        latest_local = local_df['date'].max()
+        with self._lock:
+            entry = self.freshness.record(fund_code, last_date=latest_local)
+        return latest_local, entry['rows'], local_df
+
+    def is_stale(self, fund_code, latest_local, expected_latest_date):
+        """本地最新日期早于期望日期，且期望日期的净值公布后还没有成功检查过"""
+        if latest_local is None:
+            return True
+        if latest_local.date() >= expected_latest_date:
+            return False
+        return not self.freshness.fetched_since(fund_code, datetime.combine(expected_latest_date, NAV_PUBLISH_TIME))
+
+    def save(self, fund_code, new_df, latest_local=None):
+        """
+        把新数据写入存储并更新新鲜度索引，返回 NavStore.append 的写入方式。
+        纯追加时新行数由写入前的索引记录加上追加的行数得到，不重新读取文件；重写时才重新计数。
+        """
+        with self._lock:
+            previous = self.freshness.lookup(fund_code)
+            previous_rows = previous['rows'] if previous is not None else None
+        mode = self.store.append(fund_code, new_df, latest_local)
+        if mode != 'noop':
+            new_latest = pd.Timestamp(new_df['date'].max())
+            if latest_local is not None:
+                new_latest = max(new_latest, pd.Timestamp(latest_local))
+            # 与 NavStore.append 的整理规则一致：去掉缺失值，同一日期只保留一行
+            valid = new_df['date'].notna() & pd.to_numeric(new_df['net_value'], errors='coerce').notna()
+            written = new_df.loc[valid, 'date'].nunique()
+            if mode == 'create':
+                rows = written
+            elif mode == 'append' and previous_rows is not None:
+                rows = previous_rows + written
+            else:
+                rows = None
+            with self._lock:
+                self.freshness.record(fund_code, last_date=new_latest, rows=rows)
+                self.updated.add(fund_code)
+        return mode
+
+    def missing_ranges(self, local_dates, expected_latest_date, merge_days=GAP_MERGE_DAYS):
+        """
+        对照交易日历找出本地日期 local_dates（date 集合）缺少的交易日，合并为 [(sdate, edate), ...] 日期区间。
+        间隔不超过 merge_days 个已有交易日的缺口合并为一个区间（多取几行比多发一次请求便宜）；
+        缺口延伸到 expected_latest_date 时 edate 为 None（尾部按起始日期请求），本地没有数据时返回 [(None, None)]。
+        日历按上交所交易日推算，QDII 等在 A 股交易日不公布净值的基金会出现无法补齐的缺口，
+        这类较早的区间的响应由 HTTP 缓存保存 LSJZ_RANGE_TTL（见 http_cache.py），有效期内不会重复访问网络，
+        过期后重新请求，滞后公布或事后修正的净值仍能补齐。
+        """
+        if not local_dates:
+            return [(None, None)]
+        if self.calendar is None:
+            self.calendar = TradingCalendar.from_index_file()
+        trading_days = self.calendar.trading_days(min(local_dates), expected_latest_date)
+        missing = [i for i, day in enumerate(trading_days) if day not in local_dates]
+        ranges = []
+        for i in missing:
+            if ranges and i - ranges[-1][1] <= merge_days + 1:
+                ranges[-1][1] = i
+            else:
+                ranges.append([i, i])
+        return [(trading_days[start], trading_days[end] if end < len(trading_days) - 1 else None)
+                for start, end in ranges]
+
+    def record_attempt(self, fund_code, status):
+        with self._lock:
+            self.freshness.record_attempt(fund_code, status)
+
+    def sync(self, fund_codes, download_missing=True, repair_gaps=False):
+        """
+        批量补齐多只基金的本地数据：只请求过时基金的尾部，并发下载后逐只写入。
+        download_missing 为 False 时跳过本地没有数据的基金（由调用方用其他来源获取完整历史）。
+        repair_gaps 为 True 时读取每只基金的完整历史，对照交易日历找出中间缺失的日期区间，
+        与尾部一起按日期区间并发请求（见 missing_ranges），用于修复被截断或有空洞的数据文件。
+        返回 {基金代码: 'fresh' / 'updated' / 'no_data' / 'missing' / 'error'}。
+        """
+        metrics = get_metrics()
+        status = {}
+        targets = {}
+        ranges = {}
+        known = {}  # 补齐缺口时各基金本地已有的日期，写入前从区间结果中去掉
+        with metrics.stage('staleness'):
+            self.freshness.load()
+            expected_latest_date = self.expected_latest_date()
+            for fund_code in fund_codes:
+                latest_local, _, _ = self.local_status(fund_code, tail=1)
+                if latest_local is None and not download_missing:
+                    status[fund_code] = 'missing'
+                    continue
+                stale = self.is_stale(fund_code, latest_local, expected_latest_date)
+                if repair_gaps:
+                    known[fund_code] = pd.DatetimeIndex(self.store.read(fund_code)['date']).normalize()
+                    fund_ranges = self.missing_ranges(set(known[fund_code].date), expected_latest_date)
+                    if fund_ranges and fund_ranges[-1][1] is None and not stale:
+                        fund_ranges.pop()  # 尾部在净值公布后已检查过
+                    if fund_ranges:
+                        ranges[fund_code] = fund_ranges
+                        targets[fund_code] = latest_local
+                        continue
+                elif stale:
+                    targets[fund_code] = latest_local
+                    continue
+                status[fund_code] = 'fresh'
+
+        if targets:
+            with metrics.stage('fetch'):
+                if repair_gaps:
+                    logger.info("本地净值仓库：%d 只基金共 %d 个缺失区间需要补齐（期望最新日期 %s）",
+                                len(targets), sum(len(r) for r in ranges.values()), expected_latest_date)
+                    fetched = self.fetcher.fetch_ranges(ranges)
+                else:
+                    logger.info("本地净值仓库：%d 只基金需要补齐尾部数据（期望最新日期 %s）", len(targets), expected_latest_date)
+                    fetched = self.fetcher.fetch_many({code: latest.date() if latest is not None else None for code, latest in targets.items()})
+            for fund_code, latest_local in targets.items():
+                new_df = fetched.get(fund_code)
+                if isinstance(new_df, Exception) or new_df is None:
+                    logger.warning("基金 %s 净值补齐失败: %s", fund_code, new_df)
+                    self.record_attempt(fund_code, 'error')
+                    status[fund_code] = 'error'
+                    continue
+                if fund_code in known and not new_df.empty:
+                    new_df = new_df[~new_df['date'].isin(known[fund_code])]
+                self.record_attempt(fund_code, 'ok' if not new_df.empty else 'no_data')
+                if new_df.empty:
+                    status[fund_code] = 'no_data'
+                    continue
+                try:
+                    with metrics.stage('merge_save'):
+                        self.save(fund_code, new_df, latest_local)
+                    status[fund_code] = 'updated'
+                except Exception as e:
+                    logger.error("保存基金 %s 净值失败: %s", fund_code, e)
+                    status[fund_code] = 'error'
+        self.save_index()
+        return status
+
+    def history(self, fund_code, tail=None):
+        """读取本地历史净值（date, net_value），无数据时返回空 DataFrame"""
+        return self.store.read(fund_code, tail=tail)
+
+    def save_index(self):
+        try:
+            with self._lock:
+                self.freshness.save()
+        except Exception as e:
+            logger.warning("保存新鲜度索引失败: %s", e)
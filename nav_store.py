@@ -0,0 +1,268 @@
+import os
+import io
+import logging
+import argparse
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 净值存储统一使用的列
+NAV_COLUMNS = ['date', 'net_value']
+
+# 默认存储后端，可通过环境变量 NAV_STORE_BACKEND 切换为 'binary'
+DEFAULT_BACKEND = os.getenv('NAV_STORE_BACKEND', 'csv')
+
+
+def _normalize(df):
+    """整理为 date/net_value 两列，按日期升序去重"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=NAV_COLUMNS)
+    df = df[NAV_COLUMNS].copy()
+    df['date'] = pd.to_datetime(df['date'])
+    df['net_value'] = pd.to_numeric(df['net_value'], errors='coerce')
+    df = df.dropna(subset=['date', 'net_value'])
+    return df.drop_duplicates(subset=['date'], keep='last').sort_values(by='date', ascending=True).reset_index(drop=True)
+
+
+class NavStore(ABC):
+    """
+    基金净值存储后端的基类。
+    子类需实现 exists / read / write / _append_rows / codes，
+    append 负责判断是纯追加还是需要整体重写。
+    """
+    data_dir = None
+
+    @abstractmethod
+    def exists(self, fund_code):
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, fund_code, tail=None):
+        """读取基金净值，tail 不为空时只读取最后 tail 行"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, fund_code, df):
+        """整体覆盖写入"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _append_rows(self, fund_code, df):
+        raise NotImplementedError
+
+    def last_date(self, fund_code):
+        """返回本地最新日期（pd.Timestamp），无数据时返回 None"""
+        df = self.read(fund_code, tail=1)
+        return None if df.empty else df['date'].iloc[-1]
+
+    @abstractmethod
+    def codes(self):
+        raise NotImplementedError
+
+    def row_count(self, fund_code):
+        return len(self.read(fund_code))
+
+    def append(self, fund_code, new_df, latest_local_date=None):
+        """
+        增量写入新数据。
+        新数据全部晚于本地最新日期时直接追加到文件末尾；
+        否则（例如历史净值被修正）读取全量数据合并后重写。
+        返回 'noop' / 'create' / 'append' / 'rewrite'。
+        """
+        new_df = _normalize(new_df)
+        if new_df.empty:
+            return 'noop'
+        if not self.exists(fund_code):
+            self.write(fund_code, new_df)
+            return 'create'
+
+        if latest_local_date is None:
+            latest_local_date = self.last_date(fund_code)
+        else:
+            latest_local_date = pd.Timestamp(latest_local_date)
+
+        if latest_local_date is None or new_df['date'].min() > latest_local_date:
+            self._append_rows(fund_code, new_df)
+            return 'append'
+
+        logger.info("基金 %s 新数据与本地历史重叠，重写全部数据", fund_code)
+        merged = pd.concat([self.read(fund_code), new_df])
+        self.write(fund_code, _normalize(merged))
+        return 'rewrite'
+
+
+class CsvNavStore(NavStore):
+    """每只基金一个 CSV 文件（原有 fund_data/<code>.csv 格式），支持追加写入和尾部读取"""
+
+    def __init__(self, data_dir='fund_data'):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def path(self, fund_code):
+        return os.path.join(self.data_dir, f"{fund_code}.csv")
+
+    def exists(self, fund_code):
+        return os.path.exists(self.path(fund_code))
+
+    def codes(self):
+        return sorted(f[:-4] for f in os.listdir(self.data_dir) if f.endswith('.csv'))
+
+    def row_count(self, fund_code):
+        """按换行符计数，不解析 CSV"""
+        file_path = self.path(fund_code)
+        if not os.path.exists(file_path):
+            return 0
+        with open(file_path, 'rb') as f:
+            lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+        return max(0, lines - 1)
+
+    def _read_tail_text(self, file_path, tail):
+        """从文件末尾按块向前读取，直到拿到 tail 行数据（不含表头）"""
+        block_size = 4096
+        with open(file_path, 'rb') as f:
+            header = f.readline()
+            header_end = f.tell()
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = b''
+            while pos > header_end and data.count(b'\n') <= tail:
+                read_size = min(block_size, pos - header_end)
+                pos -= read_size
+                f.seek(pos)
+                data = f.read(read_size) + data
+        lines = data.splitlines()
+        if pos > header_end:
+            # 第一行可能是被截断的半行
+            lines = lines[1:]
+        lines = [line for line in lines if line.strip()][-tail:]
+        return (header + b'\n'.join(lines) + b'\n').decode('utf-8')
+
+    def read(self, fund_code, tail=None):
+        file_path = self.path(fund_code)
+        if not os.path.exists(file_path):
+            return pd.DataFrame(columns=NAV_COLUMNS)
+        if tail:
+            df = pd.read_csv(io.StringIO(self._read_tail_text(file_path, tail)), parse_dates=['date'])
+        else:
+            df = pd.read_csv(file_path, parse_dates=['date'])
+        if df.empty or 'date' not in df.columns or 'net_value' not in df.columns:
+            return pd.DataFrame(columns=NAV_COLUMNS)
+        return df[NAV_COLUMNS].sort_values(by='date', ascending=True).reset_index(drop=True)
+
+    def write(self, fund_code, df):
+        file_path = self.path(fund_code)
+        tmp_path = file_path + '.tmp'
+        _normalize(df).to_csv(tmp_path, index=False, date_format='%Y-%m-%d')
+        os.replace(tmp_path, file_path)
+
+    def _append_rows(self, fund_code, df):
+        file_path = self.path(fund_code)
+        with open(file_path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        df.to_csv(file_path, mode='a', header=False, index=False, date_format='%Y-%m-%d')
+
+
+class BinaryNavStore(NavStore):
+    """
+    定长二进制记录的追加式存储：每只基金一个 <code>.nav 文件，
+    每条记录为 (自1970-01-01起的天数 int32, 净值 float64)。
+    读取最后 N 行只需一次 seek，追加无需解析已有数据。
+    """
+    RECORD_DTYPE = np.dtype([('date', '<i4'), ('net_value', '<f8')])
+
+    def __init__(self, data_dir='fund_data_bin'):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def path(self, fund_code):
+        return os.path.join(self.data_dir, f"{fund_code}.nav")
+
+    def exists(self, fund_code):
+        return os.path.exists(self.path(fund_code))
+
+    def codes(self):
+        return sorted(f[:-4] for f in os.listdir(self.data_dir) if f.endswith('.nav'))
+
+    def row_count(self, fund_code):
+        file_path = self.path(fund_code)
+        if not os.path.exists(file_path):
+            return 0
+        return os.path.getsize(file_path) // self.RECORD_DTYPE.itemsize
+
+    def _to_records(self, df):
+        records = np.empty(len(df), dtype=self.RECORD_DTYPE)
+        records['date'] = df['date'].values.astype('datetime64[D]').astype(np.int32)
+        records['net_value'] = df['net_value'].to_numpy(dtype=np.float64)
+        return records
+
+    def read(self, fund_code, tail=None):
+        total = self.row_count(fund_code)
+        if total == 0:
+            return pd.DataFrame(columns=NAV_COLUMNS)
+        count = min(tail, total) if tail else total
+        offset = (total - count) * self.RECORD_DTYPE.itemsize
+        records = np.fromfile(self.path(fund_code), dtype=self.RECORD_DTYPE, count=count, offset=offset)
+        return pd.DataFrame({
+            'date': pd.to_datetime(records['date'].astype('datetime64[D]').astype('datetime64[ns]')),
+            'net_value': records['net_value'],
+        })
+
+    def write(self, fund_code, df):
+        file_path = self.path(fund_code)
+        tmp_path = file_path + '.tmp'
+        self._to_records(_normalize(df)).tofile(tmp_path)
+        os.replace(tmp_path, file_path)
+
+    def _append_rows(self, fund_code, df):
+        with open(self.path(fund_code), 'ab') as f:
+            f.write(self._to_records(df).tobytes())
+
+
+STORE_BACKENDS = {
+    'csv': CsvNavStore,
+    'binary': BinaryNavStore,
+}
+
+
+def get_nav_store(backend=None, data_dir=None):
+    """按名称创建存储后端，默认读取环境变量 NAV_STORE_BACKEND"""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"未知的净值存储后端: {backend}")
+    store_cls = STORE_BACKENDS[backend]
+    return store_cls(data_dir) if data_dir else store_cls()
+
+
+def migrate(src_store, dst_store, fund_codes=None):
+    """将 src_store 中的基金净值一次性迁移到 dst_store，返回迁移的基金数"""
+    fund_codes = fund_codes or src_store.codes()
+    migrated = 0
+    for fund_code in fund_codes:
+        try:
+            df = src_store.read(fund_code)
+            if df.empty:
+                logger.warning("基金 %s 无数据，跳过迁移", fund_code)
+                continue
+            dst_store.write(fund_code, df)
+            migrated += 1
+        except Exception as e:
+            logger.error("迁移基金 %s 失败: %s", fund_code, e)
+    logger.info("迁移完成: %d / %d 个基金 (%s -> %s)", migrated, len(fund_codes), src_store.data_dir, dst_store.data_dir)
+    return migrated
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='基金净值存储迁移工具')
+    parser.add_argument('--from-backend', default='csv', choices=sorted(STORE_BACKENDS))
+    parser.add_argument('--from-dir', default='fund_data')
+    parser.add_argument('--to-backend', default='binary', choices=sorted(STORE_BACKENDS))
+    parser.add_argument('--to-dir', default='fund_data_bin')
+    args = parser.parse_args()
+    migrate(get_nav_store(args.from_backend, args.from_dir), get_nav_store(args.to_backend, args.to_dir))
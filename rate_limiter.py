@@ -0,0 +1,358 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from run_metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 自适应并发的上下限和延迟目标（秒），超过目标延迟视为站点开始过载
+ADAPTIVE_MIN_CONCURRENCY = int(os.getenv('ADAPTIVE_MIN_CONCURRENCY', 1))
+ADAPTIVE_MAX_CONCURRENCY = int(os.getenv('ADAPTIVE_MAX_CONCURRENCY', 32))
+ADAPTIVE_LATENCY_TARGET = float(os.getenv('ADAPTIVE_LATENCY_TARGET', 3.0))
+DECREASE_FACTOR = 0.5
+# 熔断：连续失败次数阈值、首次熔断时长和最长熔断时长（秒）
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', 30))
+BREAKER_MAX_RESET = 300.0
+# 重试退避的基数和上限（秒）
+BACKOFF_BASE = float(os.getenv('BACKOFF_BASE', 1.0))
+BACKOFF_CAP = float(os.getenv('BACKOFF_CAP', 60))
+# 表示服务端限流的状态码；被限流时请求速率减半（不低于配置速率的 MIN_RATE_FRACTION），
+# 之后每个成功请求把速率提高 1/速率（约每秒提高 1 次/秒），直到恢复配置速率
+THROTTLE_STATUSES = (429, 503)
+MIN_RATE_FRACTION = 0.05
+
+# 进程内共享的令牌桶和站点请求预算，按名称（通常是站点）区分
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限速器，同时支持同步 acquire() 和 asyncio 的 acquire_async()。
+    取令牌时先“预占”，令牌不足则记为负数并返回需要等待的时间，
+    因此并发调用者会被自然地错开，而不是同时醒来。
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)  # 每秒补充的令牌数
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens=1):
+        """预占令牌，返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate):
+        """调整补充速率（先按旧速率结算已经过去的时间）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = float(rate)
+
+    def acquire(self, tokens=1):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def get_bucket(name, rate, capacity=None):
+    """获取（必要时创建）进程内共享的令牌桶，同名调用方共用同一个限速额度"""
+    with _buckets_lock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(rate, capacity)
+        return _buckets[name]
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开期间拒绝请求；retry_after 为距离允许试探的秒数"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} 熔断中，{retry_after:.1f} 秒后重试")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 并发上限：请求成功且延迟低于 latency_target 时加性增加（每轮约 +1），
+    被限流、出错或延迟超标时乘性减少。减少只对上次减少之后发出的请求生效，
+    因此同一波拥塞中的多个失败只减半一次，不会所有调用方一起退到最低。
+    同步线程（acquire）和 asyncio 协程（acquire_async）可以共用同一个上限。
+    """
+
+    def __init__(self, initial, minimum=ADAPTIVE_MIN_CONCURRENCY, maximum=ADAPTIVE_MAX_CONCURRENCY,
+                 latency_target=ADAPTIVE_LATENCY_TARGET, decrease_factor=DECREASE_FACTOR):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum, initial)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters = []
+
+    def _try_enter(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._cond:
+            while not self._try_enter():
+                self._cond.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_enter():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, started, overloaded=False, succeeded=False):
+        """释放一个并发名额，并按本次请求的结果调整上限；started 为请求发出的时刻"""
+        with self._cond:
+            self.in_flight -= 1
+            decreased = False
+            if overloaded:
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self.last_decrease = time.monotonic()
+                    decreased = True
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        return decreased
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    单个站点的熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开并把等待时间加倍（不超过 max_reset_timeout）。
+    """
+
+    def __init__(self, host, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET,
+                 max_reset_timeout=BREAKER_MAX_RESET):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """检查是否允许发出请求，不允许时抛出 CircuitOpenError；返回本次是否为半开状态的试探请求"""
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(self.host, remaining)
+            if self._probing:
+                raise CircuitOpenError(self.host, 1.0)
+            self.state = 'half_open'
+            self._probing = True
+            return True
+
+    def cancel_probe(self):
+        """试探请求在发出前被放弃（等待名额时被取消等），允许下一个请求重新试探"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, failed):
+        """记录请求结果，返回熔断器是否因此打开"""
+        with self._lock:
+            self._probing = False
+            if not failed:
+                if self.state != 'closed':
+                    logger.info("%s 试探请求成功，熔断器关闭", self.host)
+                self.state = 'closed'
+                self.failures = 0
+                self.reset_timeout = self.base_reset_timeout
+                return False
+            self.failures += 1
+            if self.state == 'half_open':
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            elif self.state == 'open' or self.failures < self.failure_threshold:
+                return False
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            logger.warning("%s 连续失败 %d 次，熔断 %.0f 秒", self.host, self.failures, self.reset_timeout)
+            return True
+
+
+class RequestCall:
+    """HostLimiter 中一次请求的记录：调用方在请求完成后填写 status"""
+
+    def __init__(self, throttle_wait):
+        self.throttle_wait = throttle_wait
+        self.started = time.monotonic()
+        self.status = None
+        self.error = None
+
+
+class HostLimiter:
+    """
+    单个站点在进程内共用的请求预算：令牌桶限制每秒请求数（被限流时临时降低），AIMD 限制同时进行的请求数，
+    熔断器在站点持续失败时快速失败。同步代码用 request()，asyncio 代码用 request_async()：
+
+        with limiter.request() as call:
+            response = requests.get(url)
+            call.status = response.status_code
+    """
+
+    def __init__(self, name, rate, concurrency):
+        self.name = name
+        self.bucket = get_bucket(name, rate, capacity=max(1, concurrency))
+        self.base_rate = self.bucket.rate
+        self.initial_concurrency = concurrency
+        self.concurrency = AdaptiveConcurrency(concurrency)
+        self.breaker = CircuitBreaker(name)
+
+    @property
+    def max_concurrency(self):
+        return self.concurrency.maximum
+
+    @contextmanager
+    def request(self):
+        probe = self.breaker.before_request()
+        acquired = False
+        try:
+            self.concurrency.acquire()
+            acquired = True
+            call = RequestCall(self.bucket.acquire())
+        except BaseException:
+            self._abandon(probe, acquired)
+            raise
+        try:
+            yield call
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._complete(call)
+
+    @asynccontextmanager
+    async def request_async(self):
+        probe = self.breaker.before_request()
+        acquired = False
+        try:
+            await self.concurrency.acquire_async()
+            acquired = True
+            call = RequestCall(await self.bucket.acquire_async())
+        except BaseException:
+            self._abandon(probe, acquired)
+            raise
+        try:
+            yield call
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._complete(call)
+
+    def _abandon(self, probe, acquired):
+        """请求发出前放弃（排队时被 asyncio 取消、KeyboardInterrupt 等）：归还并发名额和试探机会，不计入请求结果"""
+        if acquired:
+            self.concurrency.release(time.monotonic())
+        if probe:
+            self.breaker.cancel_probe()
+
+    def _complete(self, call):
+        """按状态码、异常和延迟判断请求结果，调整并发上限和熔断器"""
+        latency = time.monotonic() - call.started
+        throttled = call.status in THROTTLE_STATUSES
+        if call.status is not None:
+            failed = throttled or call.status >= 500
+        else:
+            # 没有状态码的异常为连接失败或超时
+            failed = call.error is not None
+        overloaded = failed or latency > self.concurrency.latency_target
+        succeeded = call.status is not None and not failed
+        metrics = get_metrics()
+        if self.concurrency.release(call.started, overloaded=overloaded, succeeded=succeeded):
+            metrics.inc('concurrency_decreases', host=self.name)
+            if throttled:
+                self.bucket.set_rate(max(self.base_rate * MIN_RATE_FRACTION, self.bucket.rate * DECREASE_FACTOR))
+            logger.debug("%s 并发上限降为 %d，速率 %.1f/秒（状态 %s，延迟 %.2f 秒）",
+                         self.name, int(self.concurrency.limit), self.bucket.rate, call.status, latency)
+        elif succeeded and self.bucket.rate < self.base_rate:
+            self.bucket.set_rate(min(self.base_rate, self.bucket.rate + 1 / self.bucket.rate))
+        # 限流说明站点仍在正常响应，只需放慢（由 AIMD 和退避处理），不计入熔断的失败次数
+        if self.breaker.record(failed and not throttled):
+            metrics.inc('circuit_opened', host=self.name)
+
+    def stats(self):
+        return {'concurrency_limit': int(self.concurrency.limit), 'in_flight': self.concurrency.in_flight,
+                'rate': round(self.bucket.rate, 2), 'breaker': self.breaker.state}
+
+
+_hosts = {}
+
+
+def get_host(name, rate, concurrency):
+    """
+    获取（必要时创建）进程内共享的站点请求预算；同一站点的所有调用方（监控、评分、指数下载）共用。
+    速率和并发数以第一个调用方给出的为准，之后的调用方给出的不同取值被忽略（记录 debug 日志），
+    需要不同预算的调用方应使用不同的 name。
+    """
+    with _buckets_lock:
+        host = _hosts.get(name)
+    if host is None:
+        host = HostLimiter(name, rate, concurrency)
+        with _buckets_lock:
+            host = _hosts.setdefault(name, host)
+    if rate != host.base_rate or concurrency != host.initial_concurrency:
+        logger.debug("%s 已有请求预算（%.1f/秒，并发 %d），忽略新的取值（%.1f/秒，并发 %d）",
+                     name, host.base_rate, host.initial_concurrency, rate, concurrency)
+    return host
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """第 attempt 次（从 1 开始）重试前的等待：全抖动指数退避，在 [0, min(cap, base × 2^(attempt-1))] 内均匀随机"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retry_wait(retry_state):
+    """tenacity 的 wait 回调：熔断中时等到允许试探为止（加少量抖动），否则按 backoff_delay 退避"""
+    error = retry_state.outcome.exception() if retry_state.outcome else None
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after + random.uniform(0, BACKOFF_BASE)
+    return backoff_delay(retry_state.attempt_number)
@@ -0,0 +1,194 @@
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 年化使用的每年交易日数，与 FundAnalyzer 的夏普比率计算一致
+TRADING_DAYS = 252
+# 回看窗口：名称 -> 年数（None 表示成立以来）
+DEFAULT_WINDOWS = {'1y': 1, '3y': 3, 'inception': None}
+DEFAULT_RISK_FREE_RATE = 0.01858
+# 窗口起点之后这么多天内才有第一条净值的基金，视为历史不足，不计算该窗口
+START_GRACE_DAYS = 10
+# 计算指标至少需要的收益率个数
+MIN_RETURNS = 20
+
+METRIC_NAMES = ['observations', 'cagr', 'volatility', 'sharpe', 'sortino',
+                'max_drawdown', 'max_drawdown_days', 'calmar']
+
+
+def nav_matrix(frames):
+    """
+    把 {基金代码: DataFrame[date, net_value]} 对齐为日期 × 基金的净值矩阵。
+    各基金缺失的日期（成立前、非交易日等）为 NaN。
+    """
+    series = {}
+    for fund_code, df in frames.items():
+        if df is None or df.empty:
+            continue
+        s = df.drop_duplicates(subset=['date'], keep='last').set_index('date')['net_value']
+        series[fund_code] = pd.to_numeric(s, errors='coerce')
+    if not series:
+        return pd.DataFrame()
+    return pd.DataFrame(series).sort_index()
+
+
+def _ffill(values):
+    """按列向前填充 NaN（不填充首个有效值之前的部分）"""
+    rows = np.arange(values.shape[0])[:, None]
+    idx = np.where(np.isnan(values), 0, rows)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = values[idx, np.arange(values.shape[1])]
+    # 第一行本身为 NaN 时，上面的索引会指向第 0 行，保持 NaN 即可
+    return filled
+
+
+def _first_valid_rows(valid):
+    has = valid.any(axis=0)
+    return np.where(has, valid.argmax(axis=0), -1)
+
+
+def _last_valid_rows(valid):
+    n = valid.shape[0]
+    has = valid.any(axis=0)
+    return np.where(has, n - 1 - valid[::-1].argmax(axis=0), -1)
+
+
+def _window_metrics(values, days, risk_free_rate):
+    """
+    对一个窗口内的净值矩阵（行为日期，列为基金）计算全部指标。
+    收益率取各基金相邻两个有效净值之间的变化，缺失的日期不产生收益率，
+    因此成立前的空白和非交易日的缺口都不会被当作 0 收益。
+    days 为各行相对于第一行的自然日数。
+    """
+    n_rows, n_cols = values.shape
+    valid = ~np.isnan(values)
+    filled = _ffill(values)
+
+    # 相邻有效净值之间的收益率
+    prev = np.vstack([np.full((1, n_cols), np.nan), filled[:-1]])
+    returns = np.where(valid & ~np.isnan(prev), values / prev - 1, np.nan)
+    n_returns = (~np.isnan(returns)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(returns, axis=0) / n_returns
+        deviation = np.where(np.isnan(returns), 0.0, returns - mean)
+        std = np.sqrt((deviation ** 2).sum(axis=0) / (n_returns - 1))
+        target = risk_free_rate / TRADING_DAYS
+        downside = np.where(np.isnan(returns), 0.0, np.minimum(returns - target, 0.0))
+        downside_dev = np.sqrt((downside ** 2).sum(axis=0) / n_returns)
+
+        annual_return = mean * TRADING_DAYS
+        volatility = std * np.sqrt(TRADING_DAYS)
+        # 与原逐只计算一致：波动率为 0 时夏普比率记为 0
+        sharpe = np.where(volatility != 0, (annual_return - risk_free_rate) / volatility, 0.0)
+        downside_vol = downside_dev * np.sqrt(TRADING_DAYS)
+        sortino = np.where(downside_vol != 0, (annual_return - risk_free_rate) / downside_vol, np.nan)
+
+        # 最大回撤及最长水下持续天数（从前高到最后一个低于前高的日期）
+        running_max = np.fmax.accumulate(filled, axis=0)
+        drawdown = filled / running_max - 1
+        max_drawdown = -np.nanmin(np.where(np.isnan(drawdown), 0.0, drawdown), axis=0)
+        row_idx = np.arange(n_rows)[:, None]
+        at_peak = (drawdown >= 0) | np.isnan(drawdown)
+        last_peak = np.maximum.accumulate(np.where(at_peak, row_idx, 0), axis=0)
+        underwater_days = np.where(at_peak, 0.0, days[:, None] - days[last_peak])
+        max_drawdown_days = underwater_days.max(axis=0)
+
+        # 年化复合收益率：窗口内第一条与最后一条有效净值
+        first = _first_valid_rows(valid)
+        last = _last_valid_rows(valid)
+        cols = np.arange(n_cols)
+        first_value = np.where(first >= 0, values[np.maximum(first, 0), cols], np.nan)
+        last_value = np.where(last >= 0, values[np.maximum(last, 0), cols], np.nan)
+        span_years = (days[np.maximum(last, 0)] - days[np.maximum(first, 0)]) / 365.25
+        cagr = np.where(span_years > 0, (last_value / first_value) ** (1 / span_years) - 1, np.nan)
+        calmar = np.where(max_drawdown > 0, cagr / max_drawdown, np.nan)
+
+    metrics = {
+        'observations': valid.sum(axis=0).astype(float),
+        'cagr': cagr,
+        'volatility': volatility,
+        'sharpe': sharpe,
+        'sortino': sortino,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_days': max_drawdown_days,
+        'calmar': calmar,
+    }
+    insufficient = n_returns < MIN_RETURNS
+    for name in METRIC_NAMES[1:]:
+        metrics[name] = np.where(insufficient, np.nan, metrics[name])
+    return metrics, first
+
+
+def risk_metrics(nav, windows=None, risk_free_rate=DEFAULT_RISK_FREE_RATE, as_of=None):
+    """
+    一次性计算所有基金在各回看窗口内的风险收益指标。
+    nav 为日期 × 基金的净值矩阵（见 nav_matrix），windows 为 {名称: 年数或 None(成立以来)}，
+    as_of 为窗口截止日期，默认取矩阵最后一个日期。
+    返回以基金代码为索引、列名形如 sharpe_1y / max_drawdown_inception 的 DataFrame；
+    基金在窗口起点时尚未有净值（历史不足）时，该窗口的指标为 NaN。
+    """
+    windows = DEFAULT_WINDOWS if windows is None else windows
+    if nav.empty:
+        return pd.DataFrame(index=pd.Index([], name='fund_code'))
+    dates = pd.DatetimeIndex(nav.index)
+    as_of = dates[-1] if as_of is None else pd.Timestamp(as_of)
+    values = nav.to_numpy(dtype=np.float64)
+
+    columns = {}
+    for name, years in windows.items():
+        end = dates <= as_of
+        if years is None:
+            mask = end
+            start = None
+        else:
+            start = as_of - pd.DateOffset(years=years)
+            mask = end & (dates >= start)
+        window_dates = dates[mask]
+        if len(window_dates) == 0:
+            for metric in METRIC_NAMES:
+                columns[f'{metric}_{name}'] = np.full(values.shape[1], np.nan)
+            continue
+        days = ((window_dates - window_dates[0]) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+        metrics, first = _window_metrics(values[mask], days, risk_free_rate)
+        if start is not None:
+            # 窗口起点时还没有净值的基金，该窗口的历史不完整
+            first_date = np.where(first >= 0, days[np.maximum(first, 0)], np.inf)
+            lead = (window_dates[0] - start) / pd.Timedelta(days=1)
+            incomplete = first_date + lead > START_GRACE_DAYS
+            for metric in METRIC_NAMES[1:]:
+                metrics[metric] = np.where(incomplete, np.nan, metrics[metric])
+        for metric in METRIC_NAMES:
+            columns[f'{metric}_{name}'] = metrics[metric]
+
+    result = pd.DataFrame(columns, index=pd.Index(nav.columns, name='fund_code'))
+    return result
+
+
+def load_nav_matrix(nav_store, fund_codes=None):
+    """从净值存储读取多只基金的完整历史并对齐为矩阵"""
+    fund_codes = nav_store.codes() if fund_codes is None else fund_codes
+    return nav_matrix({code: nav_store.read(code) for code in fund_codes})
+
+
+if __name__ == '__main__':
+    from nav_store import get_nav_store
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="批量计算本地基金的风险收益指标")
+    parser.add_argument('--backend', default=None, help="净值存储后端 (csv / binary)")
+    parser.add_argument('--data-dir', default=None, help="净值存储目录")
+    parser.add_argument('--windows', default='1y,3y,inception', help="回看窗口，如 1y,3y,5y,inception")
+    parser.add_argument('--output', default='risk_metrics.csv', help="输出 CSV 文件")
+    args = parser.parse_args()
+
+    windows = {}
+    for name in args.windows.split(','):
+        name = name.strip()
+        windows[name] = None if name == 'inception' else int(name.rstrip('y'))
+    nav = load_nav_matrix(get_nav_store(args.backend, args.data_dir))
+    table = risk_metrics(nav, windows)
+    table.to_csv(args.output, float_format='%.6f')
+    logger.info("已计算 %d 只基金的风险指标，结果保存到 %s", len(table), args.output)
@@ -0,0 +1,267 @@
+import os
+import time
+import json
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 主要阶段（按运行顺序）：加载本地数据、检查新鲜度、网络抓取、解析页面、合并保存、计算指标、生成报告
+STAGES = ('load', 'staleness', 'fetch', 'parse', 'merge_save', 'indicators', 'report')
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Prometheus 指标名前缀
+PROMETHEUS_PREFIX = 'fund'
+# 需要做性能剖析的阶段（如 fetch / indicators），为空时不剖析；剖析器为 cprofile 或 pyinstrument
+PROFILE_STAGE = os.getenv('PROFILE_STAGE')
+PROFILER = os.getenv('PROFILER', 'cprofile')
+
+
+def _key(name, labels):
+    """指标名和标签组成的键，如 http_requests{source="lsjz"}"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+class Histogram:
+    """累计桶计数的直方图（Prometheus 格式），同时保留原始值以计算分位数"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.values = []
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values.append(value)
+
+    def summary(self):
+        values = sorted(self.values)
+        if not values:
+            return {'count': 0}
+
+        def quantile(q):
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        return {
+            'count': len(values),
+            'sum': sum(values),
+            'mean': sum(values) / len(values),
+            'p50': quantile(0.5),
+            'p90': quantile(0.9),
+            'p99': quantile(0.99),
+            'max': values[-1],
+            'buckets': {str(le): count for le, count in zip(self.buckets + ('+Inf',), self._cumulative())},
+        }
+
+    def _cumulative(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class RunMetrics:
+    """
+    一次运行的性能指标：各阶段耗时、HTTP 计数器和延迟直方图。线程安全，进程内共享一个实例（见 get_metrics）。
+    阶段耗时按调用累加，流水线中并行的阶段各自计时，因此各阶段之和可能大于总耗时。
+    """
+
+    def __init__(self, profile_stage=PROFILE_STAGE, profiler=PROFILER):
+        self._lock = threading.Lock()
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = {}
+            self.counters = {}
+            self.histograms = {}
+            self._profile = None
+            self._profiling = False
+
+    def configure_profiler(self, stage, profiler='cprofile'):
+        """对指定阶段启用 cProfile 或 pyinstrument（只剖析第一个进入该阶段的线程）"""
+        if profiler not in ('cprofile', 'pyinstrument'):
+            raise ValueError(f"未知的剖析器: {profiler}")
+        self.profile_stage = stage
+        self.profiler = profiler
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个阶段的耗时，可以在多个线程中重复进入，耗时累加"""
+        profiled = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiled:
+                self._stop_profile()
+            self.add_stage_time(name, elapsed)
+
+    def add_stage_time(self, name, seconds, calls=1):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def record_http(self, source, status=None, nbytes=0, seconds=None):
+        """记录一次 HTTP 请求；status 为空表示连接失败或超时"""
+        self.inc('http_requests', source=source)
+        if nbytes:
+            self.inc('http_bytes', nbytes, source=source)
+        if status is None:
+            self.inc('http_errors', source=source)
+        elif 400 <= status < 500:
+            self.inc('http_4xx', source=source)
+        elif status >= 500:
+            self.inc('http_5xx', source=source)
+        if seconds is not None:
+            self.observe('http_request_seconds', seconds, source=source)
+
+    def record_throttle(self, source, wait):
+        """记录令牌桶限速造成的等待"""
+        if wait and wait > 0:
+            self.inc('throttle_sleeps', source=source)
+            self.inc('throttle_sleep_seconds', wait, source=source)
+
+    def record_retry(self, source):
+        self.inc('http_retries', source=source)
+
+    def _start_profile(self, name):
+        if name != self.profile_stage:
+            return False
+        with self._lock:
+            if self._profiling:
+                return False
+            self._profiling = True
+            if self._profile is None:
+                if self.profiler == 'pyinstrument':
+                    from pyinstrument import Profiler  # 只有选择 pyinstrument 时才需要安装
+                    self._profile = Profiler()
+                else:
+                    import cProfile
+                    self._profile = cProfile.Profile()
+        if self.profiler == 'pyinstrument':
+            self._profile.start()
+        else:
+            self._profile.enable()
+        return True
+
+    def _stop_profile(self):
+        if self.profiler == 'pyinstrument':
+            self._profile.stop()
+        else:
+            self._profile.disable()
+        with self._lock:
+            self._profiling = False
+
+    def save_profile(self, path=None):
+        """保存剖析结果：cProfile 为 .prof（可用 pstats / snakeviz 查看），pyinstrument 为 .html"""
+        if self._profile is None:
+            return None
+        if self.profiler == 'pyinstrument':
+            path = path or f'profile_{self.profile_stage}.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profile.output_html())
+        else:
+            path = path or f'profile_{self.profile_stage}.prof'
+            self._profile.dump_stats(path)
+        logger.info("阶段 %s 的性能剖析结果已保存到 %s", self.profile_stage, path)
+        return path
+
+    def summary(self):
+        """机器可读的运行汇总"""
+        with self._lock:
+            stages = {name: {'seconds': round(seconds, 6), 'calls': calls} for name, (seconds, calls) in self.stages.items()}
+            counters = dict(self.counters)
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+        ordered = {name: stages.pop(name) for name in STAGES if name in stages}
+        ordered.update(stages)
+        return {
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'duration_seconds': round(time.time() - self.started, 6),
+            'stages': ordered,
+            'counters': counters,
+            'histograms': histograms,
+        }
+
+    def prometheus(self, prefix=PROMETHEUS_PREFIX, job=None):
+        """Prometheus textfile collector 格式的文本"""
+        summary = self.summary()
+        base = [f'job="{job}"'] if job else []
+
+        def series(name, *labels):
+            labels = ','.join(base + [label for label in labels if label])
+            return f'{prefix}_{name}{{{labels}}}' if labels else f'{prefix}_{name}'
+
+        lines = [f'# TYPE {prefix}_run_duration_seconds gauge',
+                 f'{series("run_duration_seconds")} {summary["duration_seconds"]}',
+                 f'# TYPE {prefix}_stage_seconds gauge']
+        for name, entry in summary['stages'].items():
+            stage = _key('', {'stage': name})[1:-1]
+            lines.append(f'{series("stage_seconds", stage)} {entry["seconds"]}')
+            lines.append(f'{series("stage_calls", stage)} {entry["calls"]}')
+        typed = set()
+        for key, value in summary['counters'].items():
+            name, _, labels = key.partition('{')
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{series(name + "_total", labels.rstrip("}"))} {value}')
+        for key, histogram in summary['histograms'].items():
+            if not histogram['count']:
+                continue
+            name, _, labels = key.partition('{')
+            labels = labels.rstrip('}')
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {prefix}_{name} histogram')
+            for le, count in histogram['buckets'].items():
+                lines.append(f'{series(name + "_bucket", labels, _key("", {"le": le})[1:-1])} {count}')
+            lines.append(f'{series(name + "_sum", labels)} {histogram["sum"]}')
+            lines.append(f'{series(name + "_count", labels)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_summary(self, json_path, prometheus_path=None, job=None):
+        """写出 JSON 运行汇总（以及可选的 Prometheus textfile 和剖析结果），并在日志中输出一行各阶段耗时"""
+        summary = self.summary()
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        if prometheus_path:
+            # 先写临时文件再改名，避免 node_exporter 读到写了一半的文件
+            tmp_path = prometheus_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus(job=job))
+            os.replace(tmp_path, prometheus_path)
+        self.save_profile()
+        stages = ", ".join(f"{name} {entry['seconds']:.2f}s" for name, entry in summary['stages'].items())
+        logger.info("运行汇总已保存到 %s，总耗时 %.2f 秒: %s", json_path, summary['duration_seconds'], stages or "无")
+        return summary
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics():
+    """进程内共享的运行指标"""
+    return _metrics
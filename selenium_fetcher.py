@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 浏览器池大小和空闲关闭时间（秒），可通过环境变量调整
+SELENIUM_POOL_SIZE = int(os.getenv('SELENIUM_POOL_SIZE', 2))
+SELENIUM_IDLE_TIMEOUT = float(os.getenv('SELENIUM_IDLE_TIMEOUT', 120))
+
+
+class SeleniumFetcher:
+    """
+    使用 Selenium 模拟浏览器进行数据抓取。
+    浏览器按需启动：第一次需要渲染页面时才创建，最多 pool_size 个并行复用；
+    空闲超过 idle_timeout 秒的浏览器由后台线程关闭。selenium 本身也在首次使用时才导入。
+    """
+    def __init__(self, pool_size=SELENIUM_POOL_SIZE, idle_timeout=SELENIUM_IDLE_TIMEOUT):
+        self.pool_size = max(1, pool_size)
+        self.idle_timeout = idle_timeout
+        self._idle = []  # [(driver, 最近使用时间)]
+        self._created = 0
+        self._available = True  # WebDriver 初始化失败后不再重试
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._closed = False
+
+    def _create_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from selenium.webdriver.chrome.options import Options
+        from selenium.common.exceptions import WebDriverException
+
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")  # 无头模式，不显示浏览器窗口
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+        # 指定 Chromium 二进制路径和 ChromeDriver 路径
+        chrome_options.binary_location = os.getenv('CHROME_BINARY_PATH', '/usr/bin/chromium-browser')
+        service = ChromeService(executable_path=os.getenv('CHROMEDRIVER_PATH', '/usr/bin/chromedriver'))
+        try:
+            # 尝试使用环境变量中的 ChromeDriver
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+            logger.info("已启动 Selenium 浏览器 (%d/%d)", self._created, self.pool_size)
+            return driver
+        except WebDriverException as e:
+            logger.error("Selenium WebDriver 初始化失败: %s", e)
+            return None
+
+    @contextmanager
+    def _driver(self):
+        """从池中借出一个浏览器，没有空闲且未达上限时新建，否则等待归还"""
+        driver = None
+        with self._cond:
+            while driver is None:
+                if not self._available or self._closed:
+                    break
+                if self._idle:
+                    driver, _ = self._idle.pop()
+                elif self._created < self.pool_size:
+                    self._created += 1
+                    break
+                else:
+                    self._cond.wait()
+        if driver is None and self._available and not self._closed:
+            try:
+                driver = self._create_driver()
+            except BaseException:
+                # 导入 selenium 失败、ChromeService 异常等：同样归还名额，否则等待的调用方会永远阻塞
+                self._creation_failed()
+                raise
+            if driver is None:
+                self._creation_failed()
+            else:
+                self._start_reaper()
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            if driver is not None:
+                self._release(driver, broken)
+
+    def _creation_failed(self):
+        """浏览器创建失败：归还名额，之后不再尝试，并唤醒所有等待的调用方"""
+        with self._cond:
+            self._created -= 1
+            self._available = False
+            self._cond.notify_all()
+
+    def _release(self, driver, broken=False):
+        with self._cond:
+            if broken or self._closed:
+                self._created -= 1
+            else:
+                self._idle.append((driver, time.monotonic()))
+                driver = None
+            self._cond.notify_all()
+        if driver is not None:
+            self._quit(driver)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning("关闭 Selenium 浏览器失败: %s", e)
+
+    def _start_reaper(self):
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_idle, name='selenium-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_idle(self):
+        """定期关闭空闲过久的浏览器"""
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=max(1.0, self.idle_timeout / 2))
+                if self._closed:
+                    return
+                now = time.monotonic()
+                expired = [driver for driver, last_used in self._idle if now - last_used >= self.idle_timeout]
+                self._idle = [(driver, last_used) for driver, last_used in self._idle if now - last_used < self.idle_timeout]
+                self._created -= len(expired)
+            for driver in expired:
+                logger.info("关闭空闲的 Selenium 浏览器")
+                self._quit(driver)
+
+    def get_page_source(self, url, wait_for_element=None, timeout=30):
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        try:
+            with self._driver() as driver:
+                if driver is None:
+                    return None
+                try:
+                    driver.get(url)
+                    if wait_for_element:
+                        from selenium.webdriver.common.by import By
+                        from selenium.webdriver.support.ui import WebDriverWait
+                        from selenium.webdriver.support import expected_conditions as EC
+                        WebDriverWait(driver, timeout).until(
+                            EC.presence_of_element_located((By.CSS_SELECTOR, wait_for_element))
+                        )
+                    return driver.page_source
+                except TimeoutException as e:
+                    # 等待超时不代表浏览器异常，归还池中继续使用
+                    logger.error("Selenium 抓取超时: %s", e)
+                    return None
+        except WebDriverException as e:
+            # 其他 WebDriver 异常时该浏览器已被丢弃
+            logger.error("Selenium 抓取失败: %s", e)
+            return None
+
+    def close(self):
+        """关闭池中所有浏览器"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for driver, _ in idle:
+            self._quit(driver)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,159 @@
+import os
+import json
+import shutil
+import filecmp
+import hashlib
+import logging
+from datetime import datetime
+from freshness_index import FreshnessIndex
+
+logger = logging.getLogger(__name__)
+
+# 分片结果的根目录：每个分片写入 <SHARD_DIR>/<命令>/<i>-of-<N>/
+SHARD_DIR = os.getenv('SHARD_DIR', 'shards')
+# 分片完成后最后写出的清单，合并时以清单存在作为分片已完成的标志
+MANIFEST_FILE = 'manifest.json'
+# 分片内更新过的净值文件的副本（分片在不同机器上运行时随分片目录一起传给合并步骤）
+NAV_DIR = 'nav'
+
+
+def shard_of(fund_code, count):
+    """基金所属的分片序号：按基金代码的 SHA-1 取模，与进程、机器、Python 版本和基金列表的顺序无关"""
+    digest = hashlib.sha1(str(fund_code).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def json_default(value):
+    """numpy 标量等 json 不认识的值"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class Shard:
+    """
+    基金全集中的一个分片（index 从 0 开始，共 count 个）。
+    同一只基金在任何机器、任何一次运行中都落在同一个分片，各分片可以在不同进程或 CI 任务中并行运行，
+    部分结果写入各自的目录，全部完成后由 merge 命令合并为最终报告。
+    """
+
+    def __init__(self, index, count, command, base_dir=SHARD_DIR):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"无效的分片 {index}/{count}：序号应在 0 到 {count - 1} 之间")
+        self.index = index
+        self.count = count
+        self.command = command
+        self.dir = os.path.join(base_dir, command, f"{index}-of-{count}")
+
+    @classmethod
+    def parse(cls, spec, command, base_dir=SHARD_DIR):
+        """解析命令行的 'i/N'（如 0/4 表示 4 个分片中的第一个）"""
+        try:
+            index, count = (int(part) for part in spec.split('/'))
+        except ValueError:
+            raise ValueError(f"分片格式应为 i/N（如 0/4）: {spec}") from None
+        return cls(index, count, command, base_dir)
+
+    @property
+    def name(self):
+        return f"{self.index}/{self.count}"
+
+    def owns(self, fund_code):
+        return shard_of(fund_code, self.count) == self.index
+
+    def select(self, fund_codes):
+        """按基金全集的原有顺序返回属于本分片的基金"""
+        selected = [code for code in fund_codes if self.owns(code)]
+        logger.info("分片 %s：处理 %d 只基金中的 %d 只", self.name, len(fund_codes), len(selected))
+        return selected
+
+    def prepare(self):
+        """清空本分片上一次运行留下的结果"""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir)
+
+    def path(self, filename):
+        return os.path.join(self.dir, filename)
+
+    def redirect(self, repository):
+        """全局新鲜度索引改为写到分片目录，避免并行的分片互相覆盖（合并时再并回）"""
+        repository.freshness.save_path = self.path(os.path.basename(repository.freshness.path))
+
+    def write_json(self, filename, data):
+        path = self.path(filename)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=json_default)
+        os.replace(path + '.tmp', path)
+
+    def read_json(self, filename):
+        with open(self.path(filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def finish(self, fund_codes, repository):
+        """复制本分片更新过的净值文件，最后写出清单"""
+        nav_files = {}
+        for fund_code in sorted(repository.updated):
+            source = repository.store.path(fund_code)
+            if not self.owns(fund_code) or not os.path.exists(source):
+                continue
+            os.makedirs(self.path(NAV_DIR), exist_ok=True)
+            nav_files[fund_code] = os.path.basename(source)
+            shutil.copy2(source, os.path.join(self.path(NAV_DIR), nav_files[fund_code]))
+        self.write_json(MANIFEST_FILE, {
+            'command': self.command,
+            'index': self.index,
+            'count': self.count,
+            'fund_codes': list(fund_codes),
+            'nav_files': nav_files,
+            'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        logger.info("分片 %s 的部分结果已写入 %s（%d 只基金，%d 个净值文件有更新）",
+                    self.name, self.dir, len(fund_codes), len(nav_files))
+
+
+def load_shards(command, base_dir=SHARD_DIR):
+    """
+    读取某个命令全部已完成分片的清单，返回按序号排列的 [(Shard, 清单), ...]。
+    分片数不一致（目录中混有旧的运行结果）或有分片缺失时抛出 ValueError，不生成不完整的报告。
+    """
+    root = os.path.join(base_dir, command)
+    found = {}
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        manifest_path = os.path.join(root, name, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            logger.warning("分片目录 %s 没有清单（未完成），忽略", os.path.join(root, name))
+            continue
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        shard = Shard(manifest['index'], manifest['count'], command, base_dir)
+        found.setdefault(shard.count, {})[shard.index] = (shard, manifest)
+    if not found:
+        raise FileNotFoundError(f"{root} 下没有已完成的分片")
+    if len(found) > 1:
+        raise ValueError(f"{root} 下混有不同分片数 {sorted(found)} 的结果，请清理旧的分片目录")
+    count, shards = found.popitem()
+    missing = sorted(set(range(count)) - set(shards))
+    if missing:
+        raise ValueError(f"{command} 共 {count} 个分片，分片 {missing} 尚未完成，无法合并")
+    return [shards[index] for index in range(count)]
+
+
+def merge_repository(shards, repository):
+    """把各分片更新过的净值文件复制回本地存储，并把各分片的新鲜度记录并入全局索引"""
+    repository.freshness.load()
+    copied = 0
+    for shard, manifest in shards:
+        for fund_code, filename in manifest.get('nav_files', {}).items():
+            source = os.path.join(shard.path(NAV_DIR), filename)
+            target = repository.store.path(fund_code)
+            # 分片在本机运行时净值已直接写入存储，内容相同则不必复制
+            if not os.path.exists(target) or not filecmp.cmp(source, target, shallow=False):
+                shutil.copy2(source, target)
+                copied += 1
+        partial_path = shard.path(os.path.basename(repository.freshness.path))
+        if os.path.exists(partial_path):
+            partial = FreshnessIndex(partial_path, repository.store).load()
+            repository.freshness.entries.update(
+                {code: entry for code, entry in partial.entries.items() if shard.owns(code)})
+    repository.save_index()
+    logger.info("已合并 %d 个分片的净值更新（复制 %d 个文件）", len(shards), copied)
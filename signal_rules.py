@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import copy
+import logging
+import argparse
+import numpy as np
+from indicator_engine import BB_WIDTH
+
+logger = logging.getLogger(__name__)
+
+# 自定义规则文件（JSON 或 YAML），为空时使用内置规则
+SIGNAL_RULES_FILE = os.getenv('SIGNAL_RULES_FILE')
+
+TREND_STRONG, TREND_NEUTRAL, TREND_WEAK = "强势", "中性", "弱势"
+
+# 内置规则，与原 MarketMonitor 中的 if/elif 判断完全一致。
+# 每张表按顺序匹配，第一条满足的规则决定结果；都不满足时取 default。
+# 条件写成 "字段 比较符 数值/参数名/字段"，all 中的条件全部满足、any 中的条件至少满足一个；
+# trend 指定大盘处于某种趋势时替换的信号，side 指定回测时的买卖方向。
+DEFAULT_RULES = {
+    'params': {
+        'rsi_overbought': 70,
+        'rsi_oversold': 30,
+        'rsi_sell': 65,
+        'rsi_strong_buy': 35,
+        'rsi_buy': 45,
+        'ma_high': 1.2,
+        'ma_low': 0.8,
+        'ma_stop': 0.95,
+        'ma_strong_buy': 0.9,
+        'bb_width': BB_WIDTH,
+    },
+    'market_trend': {
+        'default': TREND_NEUTRAL,
+        'rules': [
+            {'all': ['ma_ratio > 1', 'macd_diff > 0', 'rsi < 70'], 'label': TREND_STRONG},
+            {'any': ['ma_ratio < 0.95', 'macd_diff < 0', 'rsi > 70'], 'label': TREND_WEAK},
+        ],
+    },
+    'advice': {
+        'default': "观察",
+        'rules': [
+            {'any': ['rsi > rsi_overbought', 'net_value > bb_upper', 'ma_ratio > ma_high'],
+             'label': "等待回调", 'side': 'sell', 'trend': {TREND_WEAK: "强烈等待回调"}},
+            {'any': ['rsi < rsi_oversold', 'net_value < bb_lower', 'ma_ratio < ma_low'],
+             'label': "可分批买入", 'side': 'buy', 'trend': {TREND_STRONG: "强烈分批买入"}},
+            {'all': ['ma_ratio > 1', 'macd_diff > 0'],
+             'label': "可分批买入", 'side': 'buy', 'trend': {TREND_STRONG: "强烈分批买入"}},
+            {'all': ['ma_ratio < 1', 'macd_diff < 0'],
+             'label': "等待回调", 'side': 'sell', 'trend': {TREND_WEAK: "强烈等待回调"}},
+        ],
+    },
+    'action_signal': {
+        'default': "持有/观察",
+        'rules': [
+            {'all': ['ma_ratio < ma_stop'],
+             'label': "强卖出/规避", 'side': 'sell', 'trend': {TREND_WEAK: "强烈强卖出/规避"}},
+            {'all': ['rsi > rsi_overbought', 'ma_ratio > ma_high', 'macd_diff < 0'],
+             'label': "强卖出/规避", 'side': 'sell', 'trend': {TREND_WEAK: "强烈强卖出/规避"}},
+            {'any': ['rsi > rsi_sell', 'net_value > bb_upper', 'ma_ratio > ma_high'],
+             'label': "弱卖出/规避", 'side': 'sell', 'trend': {TREND_WEAK: "强卖出/规避"}},
+            {'all': ['rsi < rsi_strong_buy', 'ma_ratio < ma_strong_buy', 'macd_diff > 0'],
+             'label': "强买入", 'side': 'buy', 'trend': {TREND_STRONG: "强烈强买入"}},
+            {'any': ['rsi < rsi_buy', 'net_value < bb_lower', 'ma_ratio < 1'],
+             'label': "弱买入", 'side': 'buy', 'trend': {TREND_STRONG: "强买入"}},
+        ],
+    },
+}
+
+# 规则中可以引用的指标字段
+FIELDS = ('net_value', 'rsi', 'ma_ratio', 'macd', 'signal', 'macd_diff', 'bb_mid', 'bb_std', 'bb_upper', 'bb_lower', 'ma50')
+SIDES = ('buy', 'sell', 'hold')
+
+_CONDITION = re.compile(r'^\s*([A-Za-z_]\w*)\s*(>=|<=|==|!=|>|<)\s*(\S+)\s*$')
+_OPERATORS = {
+    '>': np.greater, '<': np.less, '>=': np.greater_equal,
+    '<=': np.less_equal, '==': np.equal, '!=': np.not_equal,
+}
+
+
+def _compile_condition(text, params):
+    """把 "rsi > rsi_overbought" 这样的条件编译成 (字段, 比较函数, 右侧取值函数)"""
+    match = _CONDITION.match(text)
+    if not match:
+        raise ValueError(f"无法解析的规则条件: {text!r}")
+    field, op, operand = match.groups()
+    if field not in FIELDS:
+        raise ValueError(f"规则条件 {text!r} 引用了未知字段 {field}")
+    try:
+        value = float(operand)
+        return field, _OPERATORS[op], lambda ctx, p: value
+    except ValueError:
+        pass
+    if operand in FIELDS:
+        return field, _OPERATORS[op], lambda ctx, p: ctx[operand]
+    if operand in params:
+        return field, _OPERATORS[op], lambda ctx, p: p[operand]
+    raise ValueError(f"规则条件 {text!r} 引用了未知参数 {operand}")
+
+
+class _CompiledRule:
+    def __init__(self, spec, params):
+        self.all = [_compile_condition(c, params) for c in spec.get('all', [])]
+        self.any = [_compile_condition(c, params) for c in spec.get('any', [])]
+        if not self.all and not self.any:
+            raise ValueError(f"规则缺少条件: {spec}")
+        self.label = spec['label']
+        self.side = spec.get('side', 'hold')
+        if self.side not in SIDES:
+            raise ValueError(f"规则的 side 必须是 {SIDES} 之一: {spec}")
+        self.trend = dict(spec.get('trend', {}))
+
+    def mask(self, ctx, params):
+        # NaN 参与比较时结果为 False，与原规则中的 np.isnan 检查等价
+        result = None
+        for field, op, operand in self.all:
+            hit = op(ctx[field], operand(ctx, params))
+            result = hit if result is None else result & hit
+        if self.any:
+            any_hit = None
+            for field, op, operand in self.any:
+                hit = op(ctx[field], operand(ctx, params))
+                any_hit = hit if any_hit is None else any_hit | hit
+            result = any_hit if result is None else result & any_hit
+        return result
+
+    def choice(self, market_trend):
+        """按大盘趋势替换信号，market_trend 可以是单个值或与指标同形状的数组"""
+        label = np.asarray(self.label)
+        for trend, replacement in self.trend.items():
+            label = np.where(np.asarray(market_trend) == trend, replacement, label)
+        return label
+
+
+class SignalRules:
+    """
+    表驱动的信号规则：规则表编译成条件函数，一次调用即可对任意形状的指标数组求值——
+    所有基金的最新一行（一维），或回测时所有基金的全部历史（二维）。
+    新增规则只需修改规则文件，不需要修改代码。
+    """
+
+    def __init__(self, spec=None):
+        self.spec = copy.deepcopy(DEFAULT_RULES if spec is None else spec)
+        self.params = dict(DEFAULT_RULES['params'], **self.spec.get('params', {}))
+        self.tables = {}
+        for name, table in self.spec.items():
+            if name == 'params':
+                continue
+            self.tables[name] = (
+                [_CompiledRule(rule, self.params) for rule in table.get('rules', [])],
+                table.get('default', ''),
+            )
+        for name in ('market_trend', 'advice', 'action_signal'):
+            if name not in self.tables:
+                raise ValueError(f"规则缺少 {name} 表")
+
+    @classmethod
+    def load(cls, path=None):
+        """从 JSON / YAML 文件加载规则，path 为空时使用 SIGNAL_RULES_FILE 或内置规则"""
+        path = path or SIGNAL_RULES_FILE
+        if not path:
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith(('.yaml', '.yml')):
+                import yaml  # 只有使用 YAML 规则文件时才需要 PyYAML
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+        logger.info("已加载信号规则文件: %s", path)
+        return cls(spec)
+
+    def context(self, ind, params=None):
+        """由指标字典（或 DataFrame）得到规则可引用的全部字段"""
+        p = dict(self.params, **(params or {}))
+        ctx = {name: np.asarray(ind[name], dtype=np.float64)
+               for name in ('net_value', 'rsi', 'ma_ratio', 'macd', 'signal', 'bb_mid', 'bb_std', 'ma50')}
+        ctx['macd_diff'] = ctx['macd'] - ctx['signal']
+        ctx['bb_upper'] = ctx['bb_mid'] + ctx['bb_std'] * p['bb_width']
+        ctx['bb_lower'] = ctx['bb_mid'] - ctx['bb_std'] * p['bb_width']
+        return ctx, p
+
+    def conditions(self, table, ind, params=None):
+        """各规则的条件矩阵（按优先级顺序）"""
+        ctx, p = self.context(ind, params)
+        with np.errstate(invalid='ignore'):
+            return [rule.mask(ctx, p) for rule in self.tables[table][0]]
+
+    def evaluate(self, table, ind, market_trend=None, params=None):
+        """对指标数组求值，第一条满足的规则决定信号（np.select），返回字符串数组"""
+        rules, default = self.tables[table]
+        masks = self.conditions(table, ind, params)
+        trend = TREND_NEUTRAL if market_trend is None else market_trend
+        return np.select(masks, [rule.choice(trend) for rule in rules], default=default)
+
+    def sides(self, table, ind, params=None):
+        """回测用：直接得到买入 / 卖出条件矩阵，大盘趋势只改变措辞，不影响方向"""
+        rules, _ = self.tables[table]
+        masks = self.conditions(table, ind, params)
+        shape = np.broadcast(*masks).shape if masks else np.shape(ind['net_value'])
+        buy = np.zeros(shape, dtype=bool)
+        sell = np.zeros(shape, dtype=bool)
+        decided = np.zeros(shape, dtype=bool)
+        for mask, rule in zip(masks, rules):
+            hit = mask & ~decided
+            if rule.side == 'buy':
+                buy |= hit
+            elif rule.side == 'sell':
+                sell |= hit
+            decided |= mask
+        return buy, sell
+
+    def labels(self, table, side):
+        """某个方向的所有可能信号（含大盘趋势替换后的信号）"""
+        result = set()
+        for rule in self.tables[table][0]:
+            if rule.side == side:
+                result.add(rule.label)
+                result.update(rule.trend.values())
+        return sorted(result)
+
+    def market_trend(self, ind, params=None):
+        return self.evaluate('market_trend', ind, params=params)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="导出或检查信号规则文件")
+    parser.add_argument('--dump', default=None, help="把内置规则导出为 JSON 文件，便于修改")
+    parser.add_argument('--check', default=None, help="检查规则文件能否正确编译")
+    args = parser.parse_args()
+    if args.dump:
+        with open(args.dump, 'w', encoding='utf-8') as f:
+            json.dump(DEFAULT_RULES, f, ensure_ascii=False, indent=2)
+        print(f"内置规则已导出到 {args.dump}")
+    if args.check:
+        rules = SignalRules.load(args.check)
+        print(f"规则文件 {args.check} 编译成功: " + ", ".join(f"{name} {len(r)} 条" for name, (r, _) in rules.tables.items()))
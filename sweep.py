@@ -0,0 +1,214 @@
+import os
+import time
+import json
+import random
+import logging
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from indicator_engine import align_tail_matrix, compute_indicator_matrices, BB_WINDOW, RSI_WINDOW, MA_WINDOW
+from backtest import STOP_LOSS, active_mask, trade_masks, evaluate_positions
+from signal_rules import SignalRules
+
+logger = logging.getLogger(__name__)
+
+SWEEP_RESULTS_FILE = 'sweep_results.csv'
+# 指标窗口参数：改变时需要重新计算指标矩阵
+WINDOW_PARAMS = {'bb_window': BB_WINDOW, 'rsi_window': RSI_WINDOW, 'ma_window': MA_WINDOW}
+# 默认搜索空间：每个参数的候选值
+DEFAULT_GRID = {
+    'rsi_overbought': [65, 70, 75],
+    'rsi_oversold': [25, 30, 35],
+    'rsi_sell': [60, 65, 70],
+    'rsi_strong_buy': [30, 35, 40],
+    'rsi_buy': [40, 45, 50],
+    'ma_high': [1.1, 1.2, 1.3],
+    'ma_stop': [0.9, 0.95, 0.97],
+    'ma_strong_buy': [0.85, 0.9],
+    'bb_width': [1.5, 2, 2.5],
+    'bb_window': [20, 30],
+    'rsi_window': [14, 21],
+    'ma_window': [50, 60],
+}
+# 每个任务包含的阈值组合数（同一任务内共享一次指标计算）
+TASK_SIZE = 16
+# 每个工作进程最多缓存的指标窗口设置数
+INDICATOR_CACHE_SIZE = 4
+SUMMARY_COLUMNS = ['cum_return', 'cagr', 'sharpe_ratio', 'max_drawdown', 'win_rate', 'total_trades']
+
+# 工作进程内的共享数据（由 _init_worker 设置）
+_worker = {}
+
+
+def _share(array):
+    """把数组复制到一块新的共享内存，返回 (共享内存对象, 供子进程重建数组的描述)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker(values_spec, dates_spec, stop_loss, signal, rules_spec):
+    """工作进程启动时挂载共享内存中的净值和日期矩阵（只读，不复制）"""
+    values_shm, values = _attach(values_spec)
+    dates_shm, dates = _attach(dates_spec)
+    _worker.update({
+        'shm': (values_shm, dates_shm),
+        'values': values,
+        'dates': dates.view('datetime64[D]'),
+        'active': active_mask(values),
+        'stop_loss': stop_loss,
+        'signal': signal,
+        'rules': SignalRules(rules_spec),
+        'indicators': OrderedDict(),
+    })
+
+
+def _indicators(windows):
+    """按窗口设置缓存指标矩阵，同一设置下的所有阈值组合共用"""
+    cache = _worker['indicators']
+    if windows in cache:
+        cache.move_to_end(windows)
+        return cache[windows]
+    ind = compute_indicator_matrices(_worker['values'], **dict(windows))
+    cache[windows] = ind
+    if len(cache) > INDICATOR_CACHE_SIZE:
+        cache.popitem(last=False)
+    return ind
+
+
+def _evaluate(values, dates, active, ind, params, stop_loss, signal, rules):
+    """回测一组阈值，返回所有基金指标的汇总"""
+    buy, sell = trade_masks(ind, params, signal, rules)
+    metrics = evaluate_positions(values, dates, active, buy, sell, stop_loss)
+    valid = metrics['valid']
+    summary = {column: float(np.nanmean(metrics[column][valid])) if valid.any() else np.nan
+               for column in SUMMARY_COLUMNS}
+    summary['median_cum_return'] = float(np.nanmedian(metrics['cum_return'][valid])) if valid.any() else np.nan
+    summary['funds'] = int(valid.sum())
+    return summary
+
+
+def _run_task(windows, param_sets):
+    """工作进程执行的任务：一个窗口设置下的一批阈值组合"""
+    ind = _indicators(windows)
+    results = []
+    for params in param_sets:
+        summary = _evaluate(_worker['values'], _worker['dates'], _worker['active'], ind, params,
+                            _worker['stop_loss'], _worker['signal'], _worker['rules'])
+        results.append({**dict(windows), **_worker['rules'].params, **params, **summary})
+    return results
+
+
+def grid_search_space(grid=None):
+    """网格搜索：所有候选值的笛卡尔积"""
+    grid = DEFAULT_GRID if grid is None else grid
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[name] for name in names))]
+
+
+def random_search_space(n, grid=None, seed=None):
+    """随机搜索：从候选值中独立抽样 n 组（去重）"""
+    grid = DEFAULT_GRID if grid is None else grid
+    rng = random.Random(seed)
+    seen = OrderedDict()
+    total = int(np.prod([len(values) for values in grid.values()]))
+    while len(seen) < min(n, total):
+        combo = {name: rng.choice(values) for name, values in grid.items()}
+        seen.setdefault(tuple(combo.items()), combo)
+    return list(seen.values())
+
+
+def _tasks(param_space, task_size=TASK_SIZE):
+    """按指标窗口设置分组，再切成小批次；同一窗口的批次相邻提交，便于工作进程复用缓存"""
+    groups = OrderedDict()
+    for combo in param_space:
+        windows = tuple(sorted((name, combo.get(name, default)) for name, default in WINDOW_PARAMS.items()))
+        thresholds = {name: value for name, value in combo.items() if name not in WINDOW_PARAMS}
+        groups.setdefault(windows, []).append(thresholds)
+    for windows, param_sets in groups.items():
+        for start in range(0, len(param_sets), task_size):
+            yield windows, param_sets[start:start + task_size]
+
+
+def run_sweep(frames, param_space, processes=None, stop_loss=STOP_LOSS, signal='action_signal',
+              objective='sharpe_ratio', task_size=TASK_SIZE, rules=None):
+    """
+    在进程池中评估一组参数组合，返回按 objective（各基金平均值）从高到低排序的 DataFrame。
+    净值和日期矩阵放在共享内存中，任务只传递参数，不会为每个任务序列化数据。
+    rules 为 SignalRules（默认内置规则），阈值参数覆盖其中的 params。
+    """
+    rules = rules or SignalRules()
+    fund_codes, values, dates = align_tail_matrix(frames)
+    if values.size == 0:
+        logger.warning("没有可用于参数扫描的基金数据")
+        return pd.DataFrame()
+    processes = processes or os.cpu_count() or 1
+    tasks = list(_tasks(param_space, task_size))
+    logger.info("参数扫描: %d 只基金, %d 组参数, %d 个任务, %d 个进程",
+                len(fund_codes), len(param_space), len(tasks), processes)
+
+    values_shm, values_spec = _share(values)
+    dates_shm, dates_spec = _share(dates.view('int64'))
+    rows = []
+    start = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(values_spec, dates_spec, stop_loss, signal, rules.spec)) as executor:
+            futures = [executor.submit(_run_task, windows, param_sets) for windows, param_sets in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                rows.extend(future.result())
+                if done % max(1, len(futures) // 10) == 0 or done == len(futures):
+                    logger.info("参数扫描进度: %d/%d 个任务，已用时 %.0f 秒", done, len(futures), time.monotonic() - start)
+    finally:
+        for shm in (values_shm, dates_shm):
+            shm.close()
+            shm.unlink()
+
+    table = pd.DataFrame(rows)
+    table = table.sort_values(by=objective, ascending=False, na_position='last').reset_index(drop=True)
+    table.index = table.index + 1
+    table.index.name = 'rank'
+    return table
+
+
+def load_grid(path, rules=None):
+    """从 JSON 文件读取搜索空间 {参数名: [候选值, ...]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        grid = json.load(f)
+    unknown = set(grid) - set((rules or SignalRules()).params) - set(WINDOW_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的参数: {', '.join(sorted(unknown))}")
+    return grid
+
+
+def sweep_store(nav_store=None, grid=None, random_samples=None, seed=None, processes=None, stop_loss=STOP_LOSS,
+                signal='action_signal', objective='sharpe_ratio', output_file=SWEEP_RESULTS_FILE, rules=None):
+    """对净值存储中的全部基金做参数扫描，结果保存到 sweep_results.csv"""
+    if nav_store is None:
+        from nav_store import get_nav_store
+        nav_store = get_nav_store(data_dir='fund_data')
+    frames = {code: nav_store.read(code) for code in nav_store.codes()}
+    if random_samples:
+        param_space = random_search_space(random_samples, grid, seed)
+    else:
+        param_space = grid_search_space(grid)
+    table = run_sweep(frames, param_space, processes=processes, stop_loss=stop_loss, signal=signal, objective=objective,
+                      rules=rules or SignalRules.load())
+    if not table.empty:
+        table.to_csv(output_file, encoding='utf-8')
+        logger.info("参数扫描结果已保存到 %s，最优参数: %s", output_file, table.iloc[0].to_dict())
+    return table
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sweep_store(random_samples=200)
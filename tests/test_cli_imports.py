@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+
+
+def test_cli_import_defers_heavy_modules_and_stays_within_budget():
+    loaded, seconds = cli._import_profile('cli')
+    assert not set(cli.HEAVY_MODULES) & loaded
+    assert seconds <= cli.DEFAULT_IMPORT_BUDGET
+
+
+def test_broken_module_fails_check_imports(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'broken_module.py').write_text("import os\nundefined_name\n")
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    monkeypatch.setattr(cli, 'DEFERRED_IMPORTS', {'broken_module': ('akshare',)})
+    assert cli.main(['check-imports']) == 1
+    assert 'NameError' in capsys.readouterr().out
+
+
+def test_missing_third_party_package_is_skipped(tmp_path, monkeypatch):
+    (tmp_path / 'needs_missing.py').write_text("import optional_pkg_not_installed\n")
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    monkeypatch.setattr(cli, 'THIRD_PARTY_PACKAGES', ('optional_pkg_not_installed',))
+    with pytest.raises(cli.MissingDependency) as excinfo:
+        cli._import_profile('needs_missing')
+    assert excinfo.value.package == 'optional_pkg_not_installed'
@@ -0,0 +1,105 @@
+import os
+import logging
+from datetime import datetime, date, time, timedelta
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 上交所工作日休市日（周末以外的节假日）。
+# 本地 index_data/000300.csv 自 2022 年起为逐自然日数据，无法再推算休市日，
+# 因此 2022 年以后的休市安排以此表为准，每年交易所公布次年安排后需补充。
+SSE_HOLIDAYS = {
+    # 2022
+    '2022-01-03', '2022-01-31', '2022-02-01', '2022-02-02', '2022-02-03', '2022-02-04',
+    '2022-04-04', '2022-04-05', '2022-05-02', '2022-05-03', '2022-05-04', '2022-06-03',
+    '2022-09-12', '2022-10-03', '2022-10-04', '2022-10-05', '2022-10-06', '2022-10-07',
+    # 2023
+    '2023-01-02', '2023-01-23', '2023-01-24', '2023-01-25', '2023-01-26', '2023-01-27',
+    '2023-04-05', '2023-05-01', '2023-05-02', '2023-05-03', '2023-06-22', '2023-06-23',
+    '2023-09-29', '2023-10-02', '2023-10-03', '2023-10-04', '2023-10-05', '2023-10-06',
+    # 2024
+    '2024-01-01', '2024-02-09', '2024-02-12', '2024-02-13', '2024-02-14', '2024-02-15',
+    '2024-02-16', '2024-04-04', '2024-04-05', '2024-05-01', '2024-05-02', '2024-05-03',
+    '2024-06-10', '2024-09-16', '2024-09-17', '2024-10-01', '2024-10-02', '2024-10-03',
+    '2024-10-04', '2024-10-07',
+    # 2025
+    '2025-01-01', '2025-01-28', '2025-01-29', '2025-01-30', '2025-01-31', '2025-02-03',
+    '2025-02-04', '2025-04-04', '2025-05-01', '2025-05-02', '2025-05-05', '2025-06-02',
+    '2025-10-01', '2025-10-02', '2025-10-03', '2025-10-06', '2025-10-07', '2025-10-08',
+    # 2026
+    '2026-01-01', '2026-01-02', '2026-02-16', '2026-02-17', '2026-02-18', '2026-02-19',
+    '2026-02-20', '2026-02-23', '2026-04-06', '2026-05-01', '2026-05-04', '2026-05-05',
+    '2026-06-19', '2026-09-25', '2026-10-01', '2026-10-02', '2026-10-05', '2026-10-06',
+    '2026-10-07',
+}
+
+# 假设基金净值在交易日晚上21:00前公布
+NAV_PUBLISH_TIME = time(21, 0)
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+class TradingCalendar:
+    """
+    离线的上交所交易日历。
+    休市日 = 内置节假日表 ∪ 本地指数数据中缺失的工作日；
+    本地指数数据包含周末日期的年份（逐自然日数据）不参与推算。
+    """
+
+    def __init__(self, index_dates=None, holidays=None):
+        self.holidays = {_to_date(d) for d in (SSE_HOLIDAYS if holidays is None else holidays)}
+        if index_dates is not None and len(index_dates) > 0:
+            self.holidays |= self._derive_holidays(index_dates)
+
+    @classmethod
+    def from_index_file(cls, index_file=os.path.join('index_data', '000300.csv')):
+        """从本地指数文件（只读取 date 列）构建日历，文件不存在时只使用内置节假日表"""
+        index_dates = None
+        if os.path.exists(index_file):
+            try:
+                index_dates = pd.read_csv(index_file, usecols=['date'], parse_dates=['date'])['date']
+            except Exception as e:
+                logger.warning("读取指数日期失败，仅使用内置节假日表: %s", e)
+        return cls(index_dates)
+
+    @staticmethod
+    def _derive_holidays(index_dates):
+        dates = pd.to_datetime(pd.Series(index_dates)).dt.normalize().drop_duplicates()
+        derived = set()
+        for year, year_dates in dates.groupby(dates.dt.year):
+            if (year_dates.dt.dayofweek >= 5).any():
+                continue
+            weekdays = pd.bdate_range(year_dates.min(), year_dates.max())
+            derived |= {d.date() for d in weekdays.difference(pd.DatetimeIndex(year_dates))}
+        return derived
+
+    def is_trading_day(self, day):
+        day = _to_date(day)
+        return day.weekday() < 5 and day not in self.holidays
+
+    def previous_trading_day(self, day, inclusive=True):
+        """返回不晚于 day（inclusive=False 时早于 day）的最近一个交易日"""
+        day = _to_date(day)
+        if not inclusive:
+            day -= timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    def trading_days(self, start, end):
+        """返回 [start, end] 区间内的所有交易日"""
+        days = pd.bdate_range(_to_date(start), _to_date(end))
+        return [d.date() for d in days if d.date() not in self.holidays]
+
+    def expected_latest_date(self, now=None, publish_time=NAV_PUBLISH_TIME):
+        """当前时刻应已公布净值的最近交易日"""
+        now = now or datetime.now()
+        if now.time() >= publish_time and self.is_trading_day(now.date()):
+            return now.date()
+        return self.previous_trading_day(now.date(), inclusive=False)